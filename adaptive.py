@@ -0,0 +1,267 @@
+import json
+import statistics
+import time
+from collections import deque, namedtuple
+
+import cv2
+import numpy as np
+
+from idle import IdleEngine
+from metrics import metrics
+
+# One rung of the quality ladder. scale downscales the frame the model (and
+# keyframe optical flow) sees; capture, display and keypoints stay full size.
+Level = namedtuple('Level', ['model', 'imgsz', 'stride', 'scale'])
+
+# Inference sizes tried for each model, largest first (multiples of 32)
+IMGSZ_STEPS = (640, 512, 416, 320)
+# Last resorts once the cheapest model runs at the smallest size:
+# (inference stride, input scale), in order
+FALLBACK_STEPS = ((2, 1.0), (2, 0.75), (3, 0.75), (3, 0.5))
+
+
+def build_levels(models, top_imgsz=640, fixed_imgsz=False):
+    """
+    The quality ladder, best first. Every model but the cheapest steps down
+    to the third inference size before handing over to the next model; the
+    cheapest one goes down to the smallest size, then the inference stride
+    rises and the inference input is downscaled.
+    models: model paths ordered from best to cheapest.
+    """
+    sizes = [s for s in IMGSZ_STEPS if s <= top_imgsz] or [top_imgsz]
+    if top_imgsz not in sizes:
+        sizes.insert(0, top_imgsz)
+    if fixed_imgsz:
+        # Static-shape exports only run at their export size
+        sizes = [top_imgsz]
+    levels = []
+    for i, model in enumerate(models):
+        last = i == len(models) - 1
+        for imgsz in (sizes if last else sizes[:3]):
+            levels.append(Level(model, imgsz, 1, 1.0))
+    for stride, scale in FALLBACK_STEPS:
+        levels.append(Level(models[-1], sizes[-1], stride, scale))
+    return levels
+
+
+class AdaptiveEngine:
+    """
+    Pose engine whose model variant, inference size and stride can be
+    changed between frames. All variants are loaded up front so a switch
+    never stalls on a checkpoint load; stride > 1 runs the model on
+    keyframes only (KeyframeEngine) and propagates keypoints in between.
+    scale < 1 hands both a downscaled copy of each frame (cheaper optical
+    flow and model preprocessing) and maps the keypoints back, so callers
+    always get full-frame coordinates and tracking is unaffected.
+    Same get_keypoints / get_all_keypoints contract as PoseEngine.
+    """
+    def __init__(self, engines):
+        self.engines = engines # {model path: PoseEngine}, best first
+        self.engine = next(iter(engines.values()))
+        self.stride = 1
+        self.scale = 1.0
+        self._keyframe = None
+
+    def __getattr__(self, name):
+        # Anything not overridden (batch API, device...) goes to the current engine
+        return getattr(self.engine, name)
+
+    @property
+    def fixed_imgsz(self):
+        return any(e.fixed_imgsz for e in self.engines.values())
+
+    def configure(self, model, imgsz, stride, scale=1.0):
+        engine = self.engines[model]
+        # Optical flow state is only valid for one model and one frame size
+        if engine is not self.engine or stride != self.stride or scale != self.scale:
+            if stride > 1:
+                from keyframe import KeyframeEngine
+                self._keyframe = KeyframeEngine(engine, max_interval=stride)
+            else:
+                self._keyframe = None
+        self.engine = engine
+        self.stride = stride
+        self.scale = scale
+        if not engine.fixed_imgsz:
+            engine.imgsz = imgsz
+
+    def warmup(self, *args, **kwargs):
+        for engine in self.engines.values():
+            engine.warmup(*args, **kwargs)
+
+    def get_all_keypoints(self, frame):
+        engine = self._keyframe or self.engine
+        if self.scale >= 1.0:
+            return engine.get_all_keypoints(frame)
+        h, w = frame.shape[:2]
+        sw, sh = max(1, int(w * self.scale)), max(1, int(h * self.scale))
+        people = engine.get_all_keypoints(cv2.resize(frame, (sw, sh), interpolation=cv2.INTER_AREA))
+        if len(people):
+            people = np.array(people, dtype=np.float32)
+            people[..., 0] *= w / sw
+            people[..., 1] *= h / sh
+        return people
+
+    def get_keypoints(self, frame):
+        people = self.get_all_keypoints(frame)
+        if len(people) == 0:
+            return None
+        return people[0]
+
+
+class QualityController:
+    """
+    Closed-loop frame-rate keeper. observe() is fed the per-frame processing
+    time; the controller steps down the quality ladder when the median of
+    the last `window` frames is over `budget`, and back up when it has been
+    under `up_ratio * budget` for `2 * window` frames.
+
+    Hysteresis against oscillation:
+    - the gap between the down and up thresholds;
+    - `settle` frames after every change are ignored (warm-up, caches);
+    - a level that had to be left for being too slow is only retried after
+      a backoff starting at `cooldown` frames that doubles every time it
+      fails again soon after being entered.
+
+    apply(level) is called with the new Level on every change, including
+    the initial one, from the thread calling observe(). measure() -> bool,
+    if given, says whether the frame just observed ran the model (IdleEngine
+    polls would otherwise read as headroom).
+    """
+    def __init__(self, levels, apply, budget, window=30, up_ratio=0.7, settle=15,
+                 cooldown=90, start=0, log_path=None, measure=None):
+        self.levels = levels
+        self.apply = apply
+        self.measure = measure
+        self.budget = budget
+        self.window = window
+        self.up_ratio = up_ratio
+        self.settle = settle
+        self.cooldown = cooldown
+        self.log_path = log_path
+        self.level = start
+        self.frames = 0
+        self.changes = []
+        self._samples = deque(maxlen=2 * window)
+        self._settle = settle
+        self._entered = 0        # Frame the current level was entered at
+        self._backoff = {}       # level -> current backoff (frames)
+        self._blocked_until = {} # level -> frame index it may be retried from
+        self._frames_at = [0] * len(levels)
+        self.apply(levels[start])
+        metrics.set_counter("quality_level", start)
+
+    def observe(self, seconds):
+        if self.measure is not None and not self.measure():
+            return
+        self.frames += 1
+        self._frames_at[self.level] += 1
+        if self._settle > 0:
+            self._settle -= 1
+            return
+        self._samples.append(seconds)
+        if len(self._samples) < self.window:
+            return
+
+        recent = statistics.median(list(self._samples)[-self.window:])
+        if recent > self.budget and self.level < len(self.levels) - 1:
+            # Too slow here: back off before this level is tried again. A level
+            # that held for a long time before failing starts over (the load changed)
+            backoff = self._backoff.get(self.level, self.cooldown // 2) * 2
+            if self.frames - self._entered > 10 * self.cooldown:
+                backoff = self.cooldown
+            self._backoff[self.level] = backoff
+            self._blocked_until[self.level] = self.frames + backoff
+            self._change(self.level + 1, recent, "over budget")
+        elif len(self._samples) == self._samples.maxlen and self.level > 0:
+            longer = statistics.median(self._samples)
+            up = self.level - 1
+            if longer < self.up_ratio * self.budget and self.frames >= self._blocked_until.get(up, 0):
+                self._change(up, longer, "headroom")
+
+    def _change(self, level, median, reason):
+        old, new = self.levels[self.level], self.levels[level]
+        knobs = {k: [getattr(old, k), getattr(new, k)] for k in Level._fields
+                 if getattr(old, k) != getattr(new, k)}
+        entry = {
+            'time': round(time.time(), 3),
+            'frame': self.frames,
+            'from': self.level,
+            'to': level,
+            'reason': reason,
+            'median_ms': round(median * 1000.0, 2),
+            'budget_ms': round(self.budget * 1000.0, 2),
+            'changed': knobs,
+        }
+        self.changes.append(entry)
+        changed = ", ".join(f"{k} {a} -> {b}" for k, (a, b) in knobs.items())
+        print(f"[Adaptive] frame {self.frames}: level {self.level} -> {level} "
+              f"({reason}, median {entry['median_ms']} ms vs budget {entry['budget_ms']} ms): {changed}")
+        if self.log_path:
+            with open(self.log_path, 'a') as f:
+                f.write(json.dumps(entry) + "\n")
+
+        self.level = level
+        self._entered = self.frames
+        self.apply(new)
+        self._samples.clear()
+        self._settle = self.settle
+        metrics.set_counter("quality_level", level)
+        metrics.count("quality_changes")
+
+    def report(self):
+        return {
+            'level': self.level,
+            'current': self.levels[self.level]._asdict(),
+            'changes': len(self.changes),
+            'frames_per_level': {i: n for i, n in enumerate(self._frames_at) if n},
+        }
+
+
+def add_adaptive_args(parser):
+    """
+    Registers the adaptive-quality CLI flags shared by the main scripts.
+    """
+    parser.add_argument('--target-fps', type=float, default=None,
+                        help="Adapt model, input size, stride and input downscale at runtime "
+                             "to hold this inference frame rate")
+    parser.add_argument('--adaptive-models', default=None,
+                        help="Comma-separated model variants, best first "
+                             "(e.g. yolo26s-pose.pt,yolo26n-pose.pt; default: --model only)")
+    parser.add_argument('--adaptive-log', default=None, metavar='PATH',
+                        help="Append every quality adjustment to this JSONL file")
+
+
+def check_adaptive_args(parser, args):
+    if args.target_fps is None:
+        return
+    if args.target_fps <= 0:
+        parser.error("--target-fps must be positive")
+    if args.roi or args.keyframe_interval > 1:
+        parser.error("--target-fps manages the inference stride itself; "
+                     "it cannot be combined with --roi or --keyframe-interval")
+
+
+def adaptive_models(args):
+    if args.adaptive_models:
+        return [m.strip() for m in args.adaptive_models.split(',') if m.strip()]
+    return [args.model]
+
+
+def open_controller(args, engine):
+    """QualityController for --target-fps (engine from build_engine), or None."""
+    if getattr(args, 'target_fps', None) is None:
+        return None
+    idle = engine if isinstance(engine, IdleEngine) else None
+    if idle is not None:
+        engine = idle.engine
+    if not isinstance(engine, AdaptiveEngine):
+        return None
+    levels = build_levels(list(engine.engines), args.imgsz or 640, engine.fixed_imgsz)
+
+    def apply(level):
+        engine.configure(level.model, level.imgsz, level.stride, level.scale)
+
+    print(f"[Adaptive] Holding {args.target_fps:g} fps over {len(levels)} quality levels")
+    return QualityController(levels, apply, budget=1.0 / args.target_fps, log_path=args.adaptive_log,
+                             measure=(lambda: idle.last_full) if idle is not None else None)
@@ -0,0 +1,130 @@
+import numpy as np
+
+from dataset import DATA_DIR, DATASET_CACHE_DIR, join_rows, load_table
+from features import ANGLE_TRIPLETS, joint_angles, landmarks_to_coco, with_mid_hip
+
+# Default camera variation, in degrees. Landmark axes are image-like
+# (x right, y down, z away from the camera), so yaw turns the body about the
+# vertical y axis, pitch tilts the camera up/down about x and roll spins the
+# image about z.
+YAW_RANGE = 60.0
+PITCH_RANGE = 20.0
+ROLL_RANGE = 10.0
+# Camera distance range in pose radii (hip to farthest joint); smaller is
+# stronger perspective
+DISTANCE_RANGE = (2.5, 8.0)
+# 2D keypoint jitter, in pose radii
+NOISE = 0.01
+
+
+def load_poses_3d(data_dir=DATA_DIR, cache_dir=DATASET_CACHE_DIR, use_cache=True):
+    """
+    (poses, labels): (N, 17, 3) float64 COCO-layout 3D landmarks, centred
+    and scaled by normalize(), and their pose labels, joined on pose_id.
+    """
+    landmarks = load_table('landmarks', data_dir, cache_dir, use_cache)
+    labels = load_table('labels', data_dir, cache_dir, use_cache)
+    li, ri = join_rows(np.asarray(landmarks.pose_ids), np.asarray(labels.pose_ids))
+    poses = landmarks_to_coco(np.asarray(landmarks.values, dtype=np.float64).reshape(-1, 33, 3))
+    return normalize(poses[li]), np.asarray(labels.column('pose'))[ri]
+
+
+def _axis_rotations(angles, i, j):
+    """(n, 3, 3) rotations by `angles` (radians) in the plane of axes i, j."""
+    c, s = np.cos(angles), np.sin(angles)
+    R = np.zeros(angles.shape + (3, 3))
+    R[..., 0, 0] = R[..., 1, 1] = R[..., 2, 2] = 1.0
+    R[..., i, i] = c
+    R[..., j, j] = c
+    R[..., i, j] = -s
+    R[..., j, i] = s
+    return R
+
+
+def rotation_matrices(yaw, pitch, roll):
+    """
+    (n, 3, 3) camera rotations R = Rz(roll) @ Rx(pitch) @ Ry(yaw) for
+    arrays of angles in degrees, composed with batched matmuls.
+    """
+    yaw, pitch, roll = (np.radians(np.asarray(a, dtype=np.float64)) for a in (yaw, pitch, roll))
+    return _axis_rotations(roll, 0, 1) @ _axis_rotations(pitch, 1, 2) @ _axis_rotations(yaw, 2, 0)
+
+
+def normalize(poses):
+    """
+    Centres poses on the mid-hip and scales each to unit radius (its
+    farthest joint at distance 1), so camera distance and noise can be
+    expressed independently of the dataset's units.
+    """
+    rel = poses - ((poses[:, 11] + poses[:, 12]) / 2)[:, None, :]
+    radius = np.sqrt((rel * rel).sum(axis=-1)).max(axis=1)
+    radius[radius == 0] = 1.0
+    return rel / radius[:, None, None]
+
+
+def project(poses, rotations, distance=None):
+    """
+    Views normalized 3D poses through rotated cameras.
+    Args:
+        poses (np.ndarray): (n, 17, 3) landmarks from normalize().
+        rotations (np.ndarray): (n, 3, 3) camera rotations.
+        distance (np.ndarray): (n,) camera distance in pose radii, or None for
+            an orthographic view.
+    Returns:
+        np.ndarray: (n, 17, 2) image-plane points, about unit scale.
+    """
+    cam = poses @ rotations.transpose(0, 2, 1)
+    if distance is None:
+        return cam[..., :2]
+    depth = distance[:, None] + cam[..., 2]
+    if not (depth > 0).all():
+        raise ValueError("Camera inside the pose: distance must exceed the pose radius "
+                         "(are the poses normalize()d?)")
+    return cam[..., :2] * (distance[:, None] / depth)[..., None]
+
+
+def augment(poses, rng, yaw=YAW_RANGE, pitch=PITCH_RANGE, roll=ROLL_RANGE,
+            distance=DISTANCE_RANGE, noise=NOISE):
+    """
+    The 7 runtime (2D) angle features of each pose seen from a random camera.
+    Args:
+        poses (np.ndarray): (n, 17, 3) landmarks from normalize(), one sample per row.
+        rng (np.random.Generator): source of the camera parameters.
+        yaw, pitch, roll (float): uniform +/- ranges in degrees.
+        distance (tuple): uniform camera distance range, None for orthographic.
+        noise (float): Gaussian 2D jitter, in pose radii.
+    Returns:
+        np.ndarray: (n, 7) float64, columns in ANGLE_COLUMNS order.
+    """
+    n = len(poses)
+    R = rotation_matrices(rng.uniform(-yaw, yaw, n),
+                          rng.uniform(-pitch, pitch, n),
+                          rng.uniform(-roll, roll, n))
+    dist = rng.uniform(*distance, n) if distance is not None else None
+    pts = project(poses, R, dist)
+    if noise:
+        pts += rng.standard_normal(pts.shape) * noise
+    return joint_angles(with_mid_hip(pts), ANGLE_TRIPLETS)
+
+
+def frontal_features(poses):
+    """
+    2D angle features of the poses as the original camera saw them (x, y
+    only): what pose_features() computes from a detector's keypoints.
+    """
+    return joint_angles(with_mid_hip(poses[..., :2]), ANGLE_TRIPLETS)
+
+
+def augmented_chunks(poses, labels, total, chunk_size=65536, seed=None, **options):
+    """
+    Streams `total` augmented samples as (X, y) chunks of at most
+    `chunk_size` rows, drawing poses uniformly with replacement. Only one
+    chunk is in memory at a time. `options` are passed to augment().
+    """
+    rng = np.random.default_rng(seed)
+    done = 0
+    while done < total:
+        n = min(chunk_size, total - done)
+        idx = rng.integers(0, len(poses), n)
+        yield augment(poses[idx], rng, **options), labels[idx]
+        done += n
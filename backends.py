@@ -0,0 +1,171 @@
+import hashlib
+import importlib.util
+import json
+import os
+import shutil
+
+import numpy as np
+
+# Directory holding exported models, override with ASTRAA_MODEL_CACHE
+MODEL_CACHE_DIR = os.environ.get('ASTRAA_MODEL_CACHE', 'model_cache')
+
+# backend name -> ultralytics export format, runtime module it needs, and
+# whether the exported graph accepts any input size / batch
+BACKENDS = {
+    'torch':       {'format': None,          'module': None,          'dynamic': True},
+    'onnx':        {'format': 'onnx',        'module': 'onnxruntime', 'dynamic': True},
+    'openvino':    {'format': 'openvino',    'module': 'openvino',    'dynamic': True},
+    'torchscript': {'format': 'torchscript', 'module': None,          'dynamic': False},
+}
+
+PRECISIONS = ('fp32', 'fp16', 'int8')
+
+# Mean keypoint error (pixels) above which an exported model is reported as inaccurate
+MAX_MEAN_ERROR_PX = 2.0
+
+
+def backend_available(name):
+    """
+    True if the runtime needed by `name` is installed.
+    """
+    spec = BACKENDS.get(name)
+    if spec is None:
+        return False
+    return spec['module'] is None or importlib.util.find_spec(spec['module']) is not None
+
+
+def available_backends():
+    return [name for name in BACKENDS if backend_available(name)]
+
+
+def file_hash(path, chunk=1 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk), b''):
+            h.update(block)
+    return h.hexdigest()[:16]
+
+
+def cache_key(model_path, backend, imgsz, precision):
+    """
+    Artifact name: model stem + content hash + every export option that
+    changes the result, so a new checkpoint or setting never reuses a stale export.
+    """
+    import ultralytics
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    return f"{stem}-{file_hash(model_path)}-{backend}-{imgsz}-{precision}-ul{ultralytics.__version__}"
+
+
+def export_cached(model_path, backend, imgsz=640, precision='fp32'):
+    """
+    Returns the path of `model_path` exported for `backend`, exporting it on
+    the first call and reusing the cached artifact afterwards.
+    Returns (path, created) where created is True if it was just exported.
+    """
+    from ultralytics import YOLO
+
+    spec = BACKENDS[backend]
+    if not os.path.exists(model_path):
+        YOLO(model_path) # Let ultralytics download the checkpoint so it can be hashed
+    os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
+    key = cache_key(model_path, backend, imgsz, precision)
+    suffix = {'onnx': '.onnx', 'openvino': '_openvino_model', 'torchscript': '.torchscript'}[backend]
+    target = os.path.join(MODEL_CACHE_DIR, key + suffix)
+    if os.path.exists(target):
+        print(f"[PoseEngine] Using cached {backend} model {target}")
+        return target, False
+
+    print(f"[PoseEngine] Exporting {model_path} to {backend} ({precision}, imgsz={imgsz}), one-time...")
+    exported = YOLO(model_path).export(
+        format=spec['format'],
+        imgsz=imgsz,
+        half=precision == 'fp16',
+        int8=precision == 'int8',
+        dynamic=spec['dynamic'],
+        verbose=False,
+    )
+    # ultralytics writes next to the checkpoint; move it into the cache under our key
+    shutil.move(str(exported), target)
+    return target, True
+
+
+def _order_people(people):
+    """Sorts detections left to right so two backends' outputs line up."""
+    if len(people) == 0:
+        return people
+    visible = people[..., 2] > 0.5
+    cx = np.where(visible, people[..., 0], np.nan)
+    with np.errstate(all='ignore'):
+        order = np.argsort(np.nan_to_num(np.nanmean(cx, axis=1), nan=np.inf))
+    return people[order]
+
+
+def default_check_frames():
+    """
+    A sample image with people in it (bundled with ultralytics) for accuracy checks.
+    """
+    import cv2
+    from ultralytics.utils import ASSETS
+    frame = cv2.imread(str(ASSETS / 'bus.jpg'))
+    return [frame] if frame is not None else []
+
+
+def check_accuracy(engine, reference, frames=None):
+    """
+    Compares keypoints from `engine` against a PyTorch `reference` engine.
+    Returns a dict with per-frame detection-count mismatches and mean / max
+    pixel error and mean confidence difference over matched joints.
+    """
+    frames = frames if frames is not None else default_check_frames()
+    count_mismatch = 0
+    errors = []
+    conf_diffs = []
+    for frame in frames:
+        ref = _order_people(reference.get_all_keypoints(frame))
+        out = _order_people(engine.get_all_keypoints(frame))
+        if len(ref) != len(out):
+            count_mismatch += 1
+        n = min(len(ref), len(out))
+        if n == 0:
+            continue
+        both = (ref[:n, :, 2] > 0.5) & (out[:n, :, 2] > 0.5)
+        err = np.linalg.norm(ref[:n, :, :2] - out[:n, :, :2], axis=2)
+        errors.append(err[both])
+        conf_diffs.append(np.abs(ref[:n, :, 2] - out[:n, :, 2]).ravel())
+
+    errors = np.concatenate(errors) if errors else np.zeros(0)
+    conf_diffs = np.concatenate(conf_diffs) if conf_diffs else np.zeros(0)
+    result = {
+        'frames': len(frames),
+        'count_mismatch': count_mismatch,
+        'mean_error_px': round(float(errors.mean()), 3) if len(errors) else None,
+        'max_error_px': round(float(errors.max()), 3) if len(errors) else None,
+        'mean_conf_diff': round(float(conf_diffs.mean()), 4) if len(conf_diffs) else None,
+    }
+    result['ok'] = (count_mismatch == 0 and result['mean_error_px'] is not None
+                    and result['mean_error_px'] <= MAX_MEAN_ERROR_PX)
+    return result
+
+
+def check_path(artifact):
+    return artifact.rstrip('/\\') + '.check.json'
+
+
+def save_check(artifact, result):
+    with open(check_path(artifact), 'w') as f:
+        json.dump(result, f, indent=2)
+
+
+def load_check(artifact):
+    path = check_path(artifact)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def report_check(backend, result):
+    status = "OK" if result.get('ok') else "WARNING: differs from PyTorch"
+    print(f"[PoseEngine] {backend} vs PyTorch on {result['frames']} frame(s): "
+          f"mean {result['mean_error_px']} px, max {result['max_error_px']} px, "
+          f"{result['count_mismatch']} count mismatch(es) -> {status}")
@@ -0,0 +1,266 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from dataset import join_rows, load_table
+from features import ANGLE_COLUMNS, landmarks_to_coco, pose_features
+from forest import load_classifier
+from game_logic import BicepCurl, ClassifierExercise, ExerciseBank
+from rules import EXERCISES, RULES, RuleExercise
+from tracker import PoseTracker
+import visuals
+
+CLASSIFIER_MODEL = 'exercise_classifier.pkl'
+BASELINE_FILE = 'bench_baseline.json'
+
+FRAME_W, FRAME_H = 1280, 720
+
+
+def dataset_keypoints():
+    """
+    (N, 17, 3) pixel-space keypoint sequence built from the landmarks table,
+    plus the matching pose labels. Landmarks are centred on the hips in
+    roughly body-sized units; they are scaled into a 1280x720 frame.
+    """
+    landmarks = load_table('landmarks')
+    coco = landmarks_to_coco(np.asarray(landmarks.values).reshape(-1, 33, 3))
+    kp = np.empty(coco.shape, dtype=np.float32)
+    kp[..., 0] = coco[..., 0] * 3.0 + FRAME_W / 2
+    kp[..., 1] = coco[..., 1] * 3.0 + FRAME_H / 2
+    kp[..., 2] = 0.9
+    labels = load_table('labels')
+    li, ri = join_rows(np.asarray(landmarks.pose_ids), np.asarray(labels.pose_ids))
+    return kp[li], np.asarray(labels.column('pose'))[ri]
+
+
+def synthetic_frames(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 255, (FRAME_H, FRAME_W, 3), dtype=np.uint8) for _ in range(n)]
+
+
+def clip_frames(path, limit):
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < limit:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def time_calls(fn, inputs, warmup=5):
+    """
+    Calls fn(x) for every x in inputs and returns per-call durations (seconds).
+    The first `warmup` calls are run but not recorded.
+    """
+    for x in inputs[:warmup]:
+        fn(x)
+    durations = np.empty(len(inputs))
+    for i, x in enumerate(inputs):
+        t0 = time.perf_counter()
+        fn(x)
+        durations[i] = time.perf_counter() - t0
+    return durations
+
+
+def summarize(durations, items_per_call=1):
+    ms = durations * 1000.0
+    total = durations.sum()
+    return {
+        'calls': int(len(durations)),
+        'mean_ms': round(float(ms.mean()), 4),
+        'p50_ms': round(float(np.percentile(ms, 50)), 4),
+        'p99_ms': round(float(np.percentile(ms, 99)), 4),
+        'throughput_per_s': round(float(len(durations) * items_per_call / total), 1) if total > 0 else 0.0,
+    }
+
+
+def run_benchmarks(iterations=500, pose_frames=30, clips=(), model_path="yolo26n-pose.pt", with_pose=True):
+    """
+    Runs every stage benchmark. Returns {stage: summary}; stages that cannot
+    run here (no model, no classifier) map to {'skipped': reason}.
+    """
+    results = {}
+    kp_seq, labels = dataset_keypoints()
+    n = min(iterations, len(kp_seq))
+    poses = [kp_seq[i] for i in range(n)]
+    groups = [kp_seq[i:i + 10] for i in range(0, n - 10)]
+    frame = np.zeros((FRAME_H, FRAME_W, 3), dtype=np.uint8)
+
+    # --- Features ---
+    results['extract_features'] = summarize(time_calls(pose_features, poses))
+    results['extract_features_x10'] = summarize(time_calls(pose_features, groups), items_per_call=10)
+
+    # --- Classifier ---
+    clf = None
+    try:
+        clf = load_classifier(CLASSIFIER_MODEL)
+    except Exception as e:
+        results['classifier'] = {'skipped': f"no classifier ({e})"}
+    feats = [pose_features(p) for p in poses]
+    if clf is not None:
+        results['classifier'] = summarize(time_calls(clf.classify, feats))
+        batch = pose_features(kp_seq[:n])
+        results['classifier_batch'] = summarize(
+            time_calls(clf.classify, [batch] * 20, warmup=2), items_per_call=len(batch))
+
+    # --- Game logic ---
+    curl = BicepCurl()
+    results['bicep_update'] = summarize(time_calls(curl.update, poses))
+    squats = ClassifierExercise('squats')
+    pairs = [(str(labels[i]), 0.8) for i in range(n)]
+    results['classifier_exercise_update'] = summarize(time_calls(lambda p: squats.update(*p), pairs))
+    # 100 players advanced together by one ExerciseBank call
+    bank = ExerciseBank()
+    slots = [BicepCurl(bank=bank).slot for _ in range(100)]
+    crowds = [kp_seq[(i + np.arange(100) * 7) % len(kp_seq)] for i in range(n)]
+    results['bicep_bank_update_x100'] = summarize(
+        time_calls(lambda p: bank.update_curls(slots, p), crowds), items_per_call=100)
+    # The same crowd, each player scored on every rule exercise in one RuleSet pass
+    rule_bank = ExerciseBank()
+    rule_slots = [RuleExercise(name, bank=rule_bank).slot for _ in range(100) for name in EXERCISES]
+    rule_poses = np.repeat(np.arange(100), len(EXERCISES))
+    results[f'rules_update_x100x{len(EXERCISES)}'] = summarize(
+        time_calls(lambda p: RULES.update(rule_bank, rule_slots, p, poses=rule_poses), crowds),
+        items_per_call=len(rule_slots))
+
+    # --- Tracking (10 people) ---
+    tracker = PoseTracker()
+    people = [np.stack([kp_seq[i]] * 10) + (np.arange(10) * 110.0)[:, None, None] * np.array([1, 0, 0], np.float32)
+              for i in range(n)]
+    results['tracker_update_x10'] = summarize(time_calls(tracker.update, people), items_per_call=10)
+
+    # --- Visuals ---
+    canvas = frame.copy()
+    results['draw_skeleton'] = summarize(time_calls(lambda p: visuals.draw_skeleton(canvas, p, True), poses))
+    results['draw_overlay'] = summarize(time_calls(lambda _: visuals.draw_overlay(canvas, curl), poses))
+
+    # --- Pose model ---
+    engine = None
+    if with_pose:
+        try:
+            from pose_engine import PoseEngine
+            engine = PoseEngine(model_path=model_path, device=0)
+        except Exception as e:
+            results['pose_get_keypoints'] = {'skipped': f"pose model unavailable ({e})"}
+    else:
+        results['pose_get_keypoints'] = {'skipped': "disabled (--no-pose)"}
+
+    pose_inputs = synthetic_frames(pose_frames)
+    if engine is not None:
+        results['pose_get_keypoints'] = summarize(time_calls(engine.get_keypoints, pose_inputs, warmup=3))
+        for path in clips:
+            frames = clip_frames(path, pose_frames)
+            if frames:
+                name = f"pose_clip_{os.path.splitext(os.path.basename(path))[0]}"
+                results[name] = summarize(time_calls(engine.get_keypoints, frames, warmup=3))
+
+    # --- End to end (camera frame in, drawn frame out) ---
+    def end_to_end(i):
+        out = frame.copy()
+        if engine is not None:
+            engine.get_keypoints(pose_inputs[i % len(pose_inputs)])
+        kp = poses[i]
+        curl.update(kp)
+        if clf is not None:
+            label, conf = clf.classify(pose_features(kp))
+            squats.update(str(label[0]), float(conf[0]))
+        visuals.draw_skeleton(out, kp, curl.is_correct_form)
+        visuals.draw_overlay(out, curl)
+    e2e_calls = list(range(min(n, pose_frames if engine is not None else n)))
+    results['end_to_end'] = summarize(time_calls(end_to_end, e2e_calls))
+    results['end_to_end']['includes_pose_model'] = engine is not None
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Stages whose p50 got slower than baseline by more than `tolerance`
+    (fraction). Returns a list of (stage, baseline_p50, current_p50).
+    """
+    regressions = []
+    for stage, current in results.items():
+        base = baseline.get(stage)
+        if not base or 'p50_ms' not in base or 'p50_ms' not in current:
+            continue
+        if current['p50_ms'] > base['p50_ms'] * (1.0 + tolerance):
+            regressions.append((stage, base['p50_ms'], current['p50_ms']))
+    return regressions
+
+
+def print_results(results):
+    print(f"{'stage':<30} {'mean ms':>10} {'p50 ms':>10} {'p99 ms':>10} {'items/s':>12}")
+    for stage, r in results.items():
+        if 'skipped' in r:
+            print(f"{stage:<30} skipped: {r['skipped']}")
+            continue
+        print(f"{stage:<30} {r['mean_ms']:>10.4f} {r['p50_ms']:>10.4f} {r['p99_ms']:>10.4f} {r['throughput_per_s']:>12.1f}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Per-stage benchmarks for the pose tracker")
+    parser.add_argument('--iterations', type=int, default=500, help="Calls per CPU-side stage")
+    parser.add_argument('--pose-frames', type=int, default=30, help="Frames for the pose model stage")
+    parser.add_argument('--clip', action='append', default=[], help="Video clip to benchmark the pose model on")
+    parser.add_argument('--model', default="yolo26n-pose.pt")
+    parser.add_argument('--no-pose', action='store_true', help="Skip the pose model stage")
+    parser.add_argument('--out', default=None, help="Write results JSON here")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help="Baseline JSON to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="Allowed p50 slowdown vs baseline as a fraction (default: 0.25)")
+    parser.add_argument('--update-baseline', action='store_true', help="Save these results as the baseline")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    results = run_benchmarks(args.iterations, args.pose_frames, args.clip, args.model, with_pose=not args.no_pose)
+    print_results(results)
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.out}")
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\nREGRESSIONS (p50 more than {args.tolerance:.0%} slower than {args.baseline}):")
+            for stage, base, current in regressions:
+                print(f"  {stage:<30} {base:.4f} ms -> {current:.4f} ms")
+            sys.exit(1)
+        print(f"\nNo regressions against {args.baseline}.")
+    else:
+        print(f"\nNo baseline at {args.baseline}; run with --update-baseline to create one.")
+
+
+if __name__ == "__main__":
+    main()
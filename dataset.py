@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+DATA_DIR = 'Dataset'
+
+# Directory holding the binary copies of the Dataset CSVs, override with ASTRAA_DATASET_CACHE
+DATASET_CACHE_DIR = os.environ.get('ASTRAA_DATASET_CACHE', 'dataset_cache')
+
+# table name -> CSV file in DATA_DIR. Every table is keyed by pose_id.
+TABLES = {
+    'labels': 'labels.csv',
+    'angles': 'angles.csv',
+    'landmarks': 'landmarks.csv',
+    '3d_distances': '3d_distances.csv',
+    'xyz_distances': 'xyz_distances.csv',
+}
+
+MANIFEST = 'manifest.json'
+CACHE_VERSION = 1
+
+
+class Table:
+    """
+    One cached Dataset table: pose_ids (N,), column names, and values as an
+    (N, C) array (float64, or a fixed-width string array for labels).
+    Arrays are read-only memory maps of the cache files.
+    """
+    def __init__(self, name, pose_ids, columns, values):
+        self.name = name
+        self.pose_ids = pose_ids
+        self.columns = columns
+        self.values = values
+
+    def __len__(self):
+        return len(self.pose_ids)
+
+    def column(self, name):
+        return self.values[:, self.columns.index(name)]
+
+    def select(self, columns):
+        """(N, len(columns)) array with the given columns, in that order."""
+        return np.ascontiguousarray(self.values[:, [self.columns.index(c) for c in columns]])
+
+
+def file_sha256(path, chunk=1 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _read_manifest(cache_dir):
+    path = os.path.join(cache_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return manifest if manifest.get('version') == CACHE_VERSION else {}
+
+
+def _write_manifest(cache_dir, manifest):
+    manifest['version'] = CACHE_VERSION
+    tmp = os.path.join(cache_dir, MANIFEST + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, os.path.join(cache_dir, MANIFEST))
+
+
+def _is_fresh(entry, source, cache_dir):
+    """
+    True if the cached table was built from the current `source`.
+    Size + mtime match is trusted; otherwise the content hash decides (so a
+    touched but unchanged file does not force a rebuild).
+    """
+    if not entry:
+        return False
+    if not all(os.path.exists(os.path.join(cache_dir, f)) for f in entry['files'].values()):
+        return False
+    st = os.stat(source)
+    if st.st_size != entry['size']:
+        return False
+    if st.st_mtime_ns == entry['mtime_ns']:
+        return True
+    if file_sha256(source) != entry['sha256']:
+        return False
+    entry['mtime_ns'] = st.st_mtime_ns
+    return True
+
+
+def _read_csv(name, source):
+    """Parses one Dataset CSV into (pose_ids, columns, values)."""
+    import pandas as pd
+    df = pd.read_csv(source)
+    columns = [c for c in df.columns if c != 'pose_id']
+    values = df[columns].to_numpy(dtype=str if name == 'labels' else np.float64)
+    return df['pose_id'].to_numpy(dtype=np.int64), columns, values
+
+
+def _build_table(name, source, cache_dir):
+    """
+    Parses one CSV and writes it as .npy files. Returns the manifest entry.
+    """
+    pose_ids, columns, values = _read_csv(name, source)
+
+    files = {'pose_ids': f"{name}.pose_ids.npy", 'values': f"{name}.values.npy"}
+    np.save(os.path.join(cache_dir, files['pose_ids']), pose_ids)
+    np.save(os.path.join(cache_dir, files['values']), np.ascontiguousarray(values))
+    st = os.stat(source)
+    return {
+        'source': os.path.basename(source),
+        'sha256': file_sha256(source),
+        'size': st.st_size,
+        'mtime_ns': st.st_mtime_ns,
+        'columns': columns,
+        'rows': int(len(pose_ids)),
+        'files': files,
+    }
+
+
+def build_cache(data_dir=DATA_DIR, cache_dir=DATASET_CACHE_DIR, tables=None, force=False):
+    """
+    Converts the Dataset CSVs into the binary cache, rebuilding only tables
+    whose source changed (or all of them with force=True).
+    Returns the names of the tables that were rebuilt.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    manifest = _read_manifest(cache_dir)
+    entries = manifest.setdefault('tables', {})
+    before = json.dumps(manifest, sort_keys=True)
+    rebuilt = []
+    for name in tables or TABLES:
+        source = os.path.join(data_dir, TABLES[name])
+        if not os.path.exists(source):
+            continue
+        if not force and _is_fresh(entries.get(name), source, cache_dir):
+            continue
+        print(f"[Dataset] Caching {source}...")
+        entries[name] = _build_table(name, source, cache_dir)
+        rebuilt.append(name)
+    if json.dumps(manifest, sort_keys=True) != before: # Rebuilt, or refreshed mtimes
+        _write_manifest(cache_dir, manifest)
+    return rebuilt
+
+
+def load_table(name, data_dir=DATA_DIR, cache_dir=DATASET_CACHE_DIR, use_cache=True):
+    """
+    Loads one Dataset table, from the binary cache (memory mapped, rebuilt if
+    stale) or straight from the CSV with use_cache=False.
+    """
+    if not use_cache:
+        return Table(name, *_read_csv(name, os.path.join(data_dir, TABLES[name])))
+
+    build_cache(data_dir, cache_dir, tables=[name])
+    entry = _read_manifest(cache_dir)['tables'][name]
+    files = entry['files']
+    return Table(
+        name,
+        np.load(os.path.join(cache_dir, files['pose_ids']), mmap_mode='r'),
+        entry['columns'],
+        np.load(os.path.join(cache_dir, files['values']), mmap_mode='r'),
+    )
+
+
+def join_rows(left_ids, right_ids):
+    """
+    Row indices (li, ri) pairing equal pose_ids, in left order: the same rows
+    and order as pd.merge(left, right, on='pose_id') for unique ids.
+    """
+    order = np.argsort(right_ids, kind='stable')
+    sorted_ids = right_ids[order]
+    pos = np.searchsorted(sorted_ids, left_ids)
+    pos = np.minimum(pos, len(sorted_ids) - 1)
+    found = sorted_ids[pos] == left_ids
+    return np.flatnonzero(found), order[pos[found]]
+
+
+def load_training_arrays(columns, feature_table='angles', data_dir=DATA_DIR,
+                         cache_dir=DATASET_CACHE_DIR, use_cache=True):
+    """
+    (X, y) for training: X is (N, len(columns)) float64 from `feature_table`,
+    y the pose labels, joined on pose_id.
+    """
+    labels = load_table('labels', data_dir, cache_dir, use_cache)
+    feats = load_table(feature_table, data_dir, cache_dir, use_cache)
+    li, fi = join_rows(np.asarray(labels.pose_ids), np.asarray(feats.pose_ids))
+    X = feats.select(columns)[fi]
+    y = np.asarray(labels.column('pose'))[li]
+    return X, y
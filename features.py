@@ -0,0 +1,127 @@
+import numpy as np
+
+# Keypoint Map (COCO)
+# 0:Nose, 1:LEye, 2:REye, 3:LEar, 4:REar, 5:LShoulder, 6:RShoulder
+# 7:LElbow, 8:RElbow, 9:LWrist, 10:RWrist, 11:LHip, 12:RHip
+# 13:LKnee, 14:RKnee, 15:LAnkle, 16:RAnkle
+#
+# Index 17 is a virtual keypoint appended by with_mid_hip(): the hip midpoint.
+MID_HIP = 17
+
+# Feature columns, in the exact order of Dataset/angles.csv (minus pose_id).
+# The classifier is trained and evaluated on this order.
+ANGLE_COLUMNS = [
+    'right_elbow_right_shoulder_right_hip',
+    'left_elbow_left_shoulder_left_hip',
+    'right_knee_mid_hip_left_knee',
+    'right_hip_right_knee_right_ankle',
+    'left_hip_left_knee_left_ankle',
+    'right_wrist_right_elbow_right_shoulder',
+    'left_wrist_left_elbow_left_shoulder',
+]
+
+# (a, b, c) keypoint indices for each column; the angle is measured at b
+ANGLE_TRIPLETS = np.array([
+    (8, 6, 12),
+    (7, 5, 11),
+    (14, MID_HIP, 13),
+    (12, 14, 16),
+    (11, 13, 15),
+    (10, 8, 6),
+    (9, 7, 5),
+], dtype=np.intp)
+
+
+def with_mid_hip(keypoints):
+    """
+    Appends the hip midpoint as keypoint 17.
+    keypoints: (..., 17, C) -> (..., 18, C)
+    """
+    mid = (keypoints[..., 11:12, :] + keypoints[..., 12:13, :]) / 2
+    return np.concatenate([keypoints, mid], axis=-2)
+
+
+def joint_angles(keypoints, triplets):
+    """
+    Angles (degrees) at vertex b of every (a, b, c) triplet, in one vectorized pass.
+    Args:
+        keypoints (np.ndarray): (..., K, 2+) points, only x, y are used.
+        triplets (np.ndarray): (T, 3) keypoint indices.
+    Returns:
+        np.ndarray: (..., T) float64. Degenerate triplets (a or c on top of b) give 0.
+    """
+    pts = np.asarray(keypoints, dtype=np.float64)
+    x = pts[..., 0]
+    y = pts[..., 1]
+    triplets = np.asarray(triplets, dtype=np.intp)
+    ia, ib, ic = triplets[:, 0], triplets[:, 1], triplets[:, 2]
+
+    # x / y components written out: cheaper than reducing a length-2 axis
+    # (and the same sums, bit for bit)
+    bx = x[..., ib]
+    by = y[..., ib]
+    bax = x[..., ia] - bx
+    bay = y[..., ia] - by
+    bcx = x[..., ic] - bx
+    bcy = y[..., ic] - by
+
+    norm_ba = np.sqrt(bax * bax + bay * bay)
+    norm_bc = np.sqrt(bcx * bcx + bcy * bcy)
+    degenerate = (norm_ba == 0) | (norm_bc == 0)
+
+    denom = norm_ba * norm_bc
+    denom[degenerate] = 1.0 # Overwritten below, avoids dividing by zero
+    cosine_angle = (bax * bcx + bay * bcy) / denom
+    # Clip to handle floating point errors
+    np.maximum(cosine_angle, -1.0, out=cosine_angle)
+    np.minimum(cosine_angle, 1.0, out=cosine_angle)
+    angles = np.degrees(np.arccos(cosine_angle, out=cosine_angle), out=cosine_angle)
+    angles[degenerate] = 0.0
+    return angles
+
+
+def angle(a, b, c):
+    """
+    Scalar angle at vertex b formed by points a and c.
+    points are [x, y, confidence] or just [x, y] arrays.
+    """
+    pts = np.stack([np.asarray(a, dtype=np.float64)[:2],
+                    np.asarray(b, dtype=np.float64)[:2],
+                    np.asarray(c, dtype=np.float64)[:2]])
+    return float(joint_angles(pts, [(0, 1, 2)])[0])
+
+
+def pose_features(keypoints):
+    """
+    The 7 classifier features for a batch of poses.
+    Args:
+        keypoints (np.ndarray): (N, 17, 3) or a single (17, 3) pose.
+    Returns:
+        np.ndarray: (N, 7) C-contiguous float64, columns in ANGLE_COLUMNS order.
+    """
+    kp = np.asarray(keypoints, dtype=np.float64).reshape(-1, 17, 3)
+    return np.ascontiguousarray(joint_angles(with_mid_hip(kp), ANGLE_TRIPLETS))
+
+
+# Dataset/landmarks.csv stores 33 MediaPipe landmarks as x_*, y_*, z_* column
+# triples (image-like axes: y points down). Index of each COCO-17 keypoint in
+# that layout.
+MEDIAPIPE_TO_COCO = np.array([
+    0,       # nose
+    2, 5,    # left / right eye
+    7, 8,    # left / right ear
+    11, 12,  # shoulders
+    13, 14,  # elbows
+    15, 16,  # wrists
+    23, 24,  # hips
+    25, 26,  # knees
+    27, 28,  # ankles
+], dtype=np.intp)
+
+
+def landmarks_to_coco(landmarks):
+    """
+    Selects the COCO-17 joints from MediaPipe landmarks.
+    landmarks: (N, 33, 3) x, y, z  ->  (N, 17, 3) x, y, z
+    """
+    return np.asarray(landmarks)[..., MEDIAPIPE_TO_COCO, :]
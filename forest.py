@@ -0,0 +1,314 @@
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+# Only NumPy is needed to evaluate a compiled forest; sklearn / joblib are
+# imported lazily, for compiling and for the pickle fallback.
+
+class CompiledForest:
+    """
+    A trained RandomForestClassifier flattened into compact node arrays.
+
+    All trees share one set of arrays; roots[t] is the first node of tree t.
+    Leaves point to themselves, so the whole forest is evaluated for a batch
+    of samples by stepping every (sample, tree) cursor max_depth times with
+    plain array indexing - no per-tree or per-sample Python loop.
+    """
+    def __init__(self, feature, threshold, left, right, value, roots, classes, max_depth):
+        self.feature = feature       # (n_nodes,) int32 split feature (0 for leaves)
+        self.threshold = threshold   # (n_nodes,) float64 split threshold
+        self.left = left             # (n_nodes,) int32 child when X[f] <= threshold
+        self.right = right           # (n_nodes,) int32 child otherwise
+        self.value = value           # (n_nodes, n_classes) float64 normalised leaf distribution
+        self.roots = roots           # (n_trees,) int32
+        self.classes = classes       # (n_classes,) labels
+        self.max_depth = int(max_depth)
+
+    @classmethod
+    def from_sklearn(cls, clf):
+        """
+        Flattens a fitted sklearn RandomForestClassifier (single output).
+        """
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for est in clf.estimators_:
+            tree = est.tree_
+            n = tree.node_count
+            is_leaf = tree.children_left == -1
+            own = np.arange(offset, offset + n, dtype=np.int32)
+
+            features.append(np.where(is_leaf, 0, tree.feature).astype(np.int32))
+            thresholds.append(tree.threshold.astype(np.float64))
+            lefts.append(np.where(is_leaf, own, tree.children_left + offset).astype(np.int32))
+            rights.append(np.where(is_leaf, own, tree.children_right + offset).astype(np.int32))
+
+            # Same normalisation as DecisionTreeClassifier.predict_proba
+            val = tree.value[:, 0, :].astype(np.float64)
+            norm = val.sum(axis=1, keepdims=True)
+            norm[norm == 0.0] = 1.0
+            values.append(val / norm)
+
+            roots.append(offset)
+            max_depth = max(max_depth, tree.max_depth)
+            offset += n
+
+        return cls(
+            feature=np.concatenate(features),
+            threshold=np.concatenate(thresholds),
+            left=np.concatenate(lefts),
+            right=np.concatenate(rights),
+            value=np.concatenate(values),
+            roots=np.array(roots, dtype=np.int32),
+            classes=np.asarray(clf.classes_),
+            max_depth=max_depth,
+        )
+
+    def save(self, path):
+        np.savez(path, feature=self.feature, threshold=self.threshold,
+                 left=self.left, right=self.right, value=self.value,
+                 roots=self.roots, classes=self.classes.astype(str),
+                 max_depth=np.array(self.max_depth))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                feature=data['feature'],
+                threshold=data['threshold'],
+                left=data['left'],
+                right=data['right'],
+                value=data['value'],
+                roots=data['roots'],
+                classes=data['classes'],
+                max_depth=int(data['max_depth']),
+            )
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    def _leaves(self, X):
+        """
+        (n_samples, n_trees) leaf node index reached by every sample in every tree.
+        """
+        # sklearn trees compare float32 inputs, do the same for exact parity
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[None, :]
+        n = X.shape[0]
+        node = np.broadcast_to(self.roots, (n, self.n_trees)).copy()
+        rows = np.arange(n)[:, None]
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+        return node
+
+    def predict_proba(self, X):
+        """
+        (n_samples, n_classes) mean of the per-tree leaf distributions.
+        """
+        leaves = self._leaves(X)
+        return self.value[leaves].sum(axis=1) / self.n_trees
+
+    def predict(self, X):
+        return self.classes[self.predict_proba(X).argmax(axis=1)]
+
+    def classify(self, X):
+        """
+        Label and confidence for a batch of feature vectors in one traversal.
+        Returns:
+            (labels, confidences): (n_samples,) arrays.
+        """
+        proba = self.predict_proba(X)
+        best = proba.argmax(axis=1)
+        return self.classes[best], proba[np.arange(len(best)), best]
+
+
+class SklearnClassifier:
+    """
+    Adapter giving any fitted sklearn classifier the classify() interface.
+    Used when no compiled forest is available.
+    """
+    def __init__(self, clf):
+        self.clf = clf
+        self.classes = np.asarray(clf.classes_)
+
+    def predict_proba(self, X):
+        return self.clf.predict_proba(X)
+
+    def predict(self, X):
+        return self.classes[self.predict_proba(X).argmax(axis=1)]
+
+    def classify(self, X):
+        proba = self.predict_proba(X)
+        best = proba.argmax(axis=1)
+        return self.classes[best], proba[np.arange(len(best)), best]
+
+
+class GatedClassifier:
+    """
+    Wraps any classify()-able model and avoids calling it when the answer is
+    already known:
+
+    - change gate: a tracked player (identified by `keys`) whose features have
+      moved less than `delta` (max abs change, degrees) since their last real
+      prediction keeps that prediction, for at most `max_stale` consecutive
+      calls before being re-evaluated;
+    - memo: other rows are looked up in a bounded LRU keyed on the features
+      quantized to `quant` degrees, so a pose seen before reuses its result.
+
+    Only the remaining rows reach the model, in one batch.
+    delta=0 disables the gate, cache_size=0 the memo.
+    """
+    def __init__(self, clf, delta=3.0, quant=2.0, cache_size=2048, max_stale=10):
+        self.clf = clf
+        self.classes = clf.classes
+        self.delta = delta
+        self.quant = quant
+        self.cache_size = cache_size
+        self.max_stale = max_stale
+        self._cache = OrderedDict() # quantized features bytes -> (label, confidence)
+        self._last = {}             # key -> [features, label, confidence, skipped calls]
+        self.gate_skips = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def _quantize(self, row):
+        return np.round(row / self.quant).astype(np.int32).tobytes()
+
+    def classify(self, X, keys=None):
+        """
+        Same as the wrapped classify(); `keys` (one hashable per row, e.g.
+        tracker IDs) enables the per-player change gate.
+        """
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X[None, :]
+        n = len(X)
+        labels = np.empty(n, dtype=self.classes.dtype)
+        confidences = np.empty(n, dtype=np.float64)
+        todo = [] # (row, cache key)
+
+        for i in range(n):
+            key = keys[i] if keys is not None else None
+            last = self._last.get(key) if key is not None else None
+            if (last is not None and self.delta > 0 and last[3] < self.max_stale
+                    and np.abs(X[i] - last[0]).max() < self.delta):
+                last[3] += 1
+                labels[i], confidences[i] = last[1], last[2]
+                self.gate_skips += 1
+                continue
+            if self.cache_size:
+                qkey = self._quantize(X[i])
+                hit = self._cache.get(qkey)
+                if hit is not None:
+                    self._cache.move_to_end(qkey)
+                    labels[i], confidences[i] = hit
+                    self.cache_hits += 1
+                    self._remember(key, X[i], hit)
+                    continue
+            else:
+                qkey = None
+            todo.append((i, qkey))
+
+        if todo:
+            self.cache_misses += len(todo)
+            rows = [i for i, _ in todo]
+            pred, conf = self.clf.classify(X[rows])
+            for (i, qkey), label, c in zip(todo, pred, conf):
+                labels[i], confidences[i] = label, c
+                if qkey is not None:
+                    self._cache[qkey] = (label, c)
+                    if len(self._cache) > self.cache_size:
+                        self._cache.popitem(last=False)
+                self._remember(keys[i] if keys is not None else None, X[i], (label, c))
+
+        return labels, confidences
+
+    def _remember(self, key, row, result):
+        if key is not None:
+            self._last[key] = [row.copy(), result[0], result[1], 0]
+
+    def forget(self, keys):
+        """Drops gate state for players that left (e.g. PoseTracker.expired)."""
+        for key in keys:
+            self._last.pop(key, None)
+
+    def stats(self):
+        calls = self.gate_skips + self.cache_hits + self.cache_misses
+        return {
+            'gate_skips': self.gate_skips,
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'model_fraction': round(self.cache_misses / calls, 3) if calls else 0.0,
+            'cache_entries': len(self._cache),
+        }
+
+
+def add_classifier_args(parser):
+    """
+    Registers the runtime classification flags (rate, smoothing, gating)
+    shared by main_with_classifier.py and replay.py.
+    """
+    parser.add_argument('--classify-every', type=int, default=3,
+                        help="Run the classifier every N frames on smoothed features (default: 3)")
+    parser.add_argument('--feature-window', type=int, default=15,
+                        help="Frames of pose features kept per player (default: 15)")
+    parser.add_argument('--feature-alpha', type=float, default=0.5,
+                        help="EMA weight of the newest frame in the classifier input (default: 0.5)")
+    parser.add_argument('--gate-delta', type=float, default=3.0,
+                        help="Reuse a player's last prediction while no feature moved more than this "
+                             "many degrees (0 disables, default: 3)")
+    parser.add_argument('--max-stale', type=int, default=10,
+                        help="Reclassify a gated player after this many reused predictions (default: 10)")
+    parser.add_argument('--cache-quant', type=float, default=2.0,
+                        help="Quantization step (degrees) of the prediction cache key (default: 2)")
+    parser.add_argument('--cache-size', type=int, default=2048,
+                        help="Cached predictions for repeated poses (0 disables, default: 2048)")
+
+
+def check_classifier_args(parser, args):
+    if args.classify_every < 1 or args.feature_window < 1 or not 0 < args.feature_alpha <= 1:
+        parser.error("--classify-every and --feature-window must be >= 1, --feature-alpha in (0, 1]")
+
+
+def gated_classifier(clf, args):
+    """Wraps clf in a GatedClassifier configured from the parsed CLI args."""
+    return GatedClassifier(clf, delta=args.gate_delta, quant=args.cache_quant,
+                           cache_size=args.cache_size, max_stale=args.max_stale)
+
+
+def compiled_path(model_path):
+    """exercise_classifier.pkl -> exercise_classifier.npz"""
+    return os.path.splitext(model_path)[0] + '.npz'
+
+
+def check_parity(clf, forest, X):
+    """
+    Compares a compiled forest against the sklearn model it came from.
+    Returns (label_mismatches, max_abs_proba_diff).
+    """
+    X = np.asarray(X)
+    ref_proba = clf.predict_proba(X)
+    proba = forest.predict_proba(X)
+    mismatches = int((clf.predict(X) != forest.classes[proba.argmax(axis=1)]).sum())
+    return mismatches, float(np.abs(ref_proba - proba).max()) if len(X) else 0.0
+
+
+def load_classifier(model_path):
+    """
+    Loads the exercise classifier, preferring the compiled forest saved next to
+    the pickle (faster to load, no sklearn import). Falls back to the joblib
+    pickle when the compiled file is missing or older than the pickle.
+    """
+    npz_path = compiled_path(model_path)
+    if os.path.exists(npz_path) and (not os.path.exists(model_path)
+                                     or os.path.getmtime(npz_path) >= os.path.getmtime(model_path)):
+        print(f"[Classifier] Using compiled forest {npz_path}")
+        return CompiledForest.load(npz_path)
+
+    import joblib
+    print(f"[Classifier] Using sklearn model {model_path}")
+    return SklearnClassifier(joblib.load(model_path))
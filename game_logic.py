@@ -1,5 +1,11 @@
+import weakref
+
 import numpy as np
 
+import features
+from metrics import metrics
+from temporal import FeatureWindow
+
 class Exercise:
     def __init__(self):
         self.reps = 0
@@ -14,109 +20,303 @@ class Exercise:
         Calculates the angle at vertex b formed by points a and c.
         points are [x, y, confidence] or just [x, y] arrays.
         """
-        # Take only x,y
-        a = np.array(a[:2])
-        b = np.array(b[:2])
-        c = np.array(c[:2])
-        
-        ba = a - b
-        bc = c - b
-        
-        # Norms
-        norm_ba = np.linalg.norm(ba)
-        norm_bc = np.linalg.norm(bc)
-        
-        if norm_ba == 0 or norm_bc == 0:
-            return 0.0
-            
-        cosine_angle = np.dot(ba, bc) / (norm_ba * norm_bc)
-        # Clip to handle floating point errors
-        cosine_angle = np.clip(cosine_angle, -1.0, 1.0)
-        angle = np.degrees(np.arccos(cosine_angle))
-        
-        return angle
+        return features.angle(a, b, c)
 
-class BicepCurl(Exercise):
-    def __init__(self):
-        super().__init__()
-        # COCO Keypoint Indices
-        self.KP_R_SHOULDER = 6
-        self.KP_R_ELBOW = 8
-        self.KP_R_WRIST = 10
-        self.KP_R_HIP = 12
-        
-        self.current_angle = 0.0
-        self.flare_angle = 0.0
+class ExerciseBank:
+    """
+    Game state of many exercises (one slot each) in parallel NumPy arrays:
+    reps, score, energy, state / feedback codes and angles. update_curls()
+    and update_predictions() advance the BicepCurl and ClassifierExercise
+    state machines of any set of slots in one vectorized call, with exactly
+    the per-object semantics (rules.RuleSet.update() does the same for
+    declarative rule exercises). BicepCurl / ClassifierExercise /
+    RuleExercise are views onto a slot; pass several of them one bank to
+    update them together.
+    Not thread-safe: use a bank from one thread.
+    """
+    # State names, codes fixed by position; rule exercises append theirs (state_code)
+    STATES = ["extension", "flexion", "start", "rest", "active"]
+    EXTENSION, FLEXION, START, REST, ACTIVE = range(5)
+    MAX_ANGLES = 4 # Smoothed angles per slot
 
-    def update(self, keypoints):
+    # Feedback strings set by the state machines, codes fixed by position
+    FEEDBACK = ["Get Ready", "Camera Obstructed", "Tuck Your Elbow!", "Good Form",
+                "FATIGUE / BAD FORM", "Uncertain...", "GO!", "GOOD REP!"]
+    (FB_READY, FB_OBSTRUCTED, FB_TUCK, FB_GOOD_FORM,
+     FB_FATIGUE, FB_UNCERTAIN, FB_GO, FB_GOOD_REP) = range(8)
+
+    # name -> (dtype, per-slot shape)
+    FIELDS = {
+        'reps': (np.int64, ()),
+        'score': (np.int64, ()),
+        'energy': (np.float64, ()),
+        'state': (np.int8, ()),
+        'correct': (np.bool_, ()),
+        'feedback': (np.int32, ()),
+        # BicepCurl
+        'flare_angle': (np.float64, ()),
+        'current_angle': (np.float64, ()),
+        'ema': (np.float64, (MAX_ANGLES,)), # Smoothed angles, BicepCurl: (flare, curl)
+        'seen': (np.bool_, ()),          # ema holds at least one sample
+        'alpha': (np.float64, ()),
+        'smoothed': (np.bool_, ()),
+        # RuleExercise
+        'rule': (np.int32, ()),          # Exercise index within its RuleSet
+        # ClassifierExercise (label codes, -1 = none)
+        'last_pred': (np.int32, ()),
+        'target': (np.int32, ()),
+        'reset': (np.int32, ()),
+        'doing': (np.int32, ()),         # Feedback code of "Doing <exercise>..."
+    }
+
+    def __init__(self, capacity=8):
+        self.capacity = 0
+        self.feedback_texts = list(self.FEEDBACK)
+        self._feedback_codes = {text: i for i, text in enumerate(self.feedback_texts)}
+        self._label_codes = {}
+        self._free = []
+        self._next = 0
+        for name, (dtype, shape) in self.FIELDS.items():
+            setattr(self, name, np.zeros((0,) + shape, dtype=dtype))
+        self._grow(capacity)
+
+    def _grow(self, capacity):
+        for name, (dtype, shape) in self.FIELDS.items():
+            arr = np.zeros((capacity,) + shape, dtype=dtype)
+            arr[:self.capacity] = getattr(self, name)
+            setattr(self, name, arr)
+        self.capacity = capacity
+
+    def allocate(self):
+        """Reserves a zeroed slot and returns its index."""
+        if self._free:
+            slot = self._free.pop()
+        else:
+            if self._next == self.capacity:
+                self._grow(max(8, 2 * self.capacity))
+            slot = self._next
+            self._next += 1
+        for name in self.FIELDS:
+            getattr(self, name)[slot] = 0
+        self.last_pred[slot] = self.target[slot] = self.reset[slot] = -1
+        return slot
+
+    def release(self, slot):
+        self._free.append(slot)
+
+    def feedback_code(self, text):
+        code = self._feedback_codes.get(text)
+        if code is None:
+            code = self._feedback_codes[text] = len(self.feedback_texts)
+            self.feedback_texts.append(text)
+        return code
+
+    @classmethod
+    def state_code(cls, name):
+        """Code of a state name, appending it to STATES (shared by all banks) if new."""
+        if name not in cls.STATES:
+            if len(cls.STATES) > np.iinfo(np.int8).max:
+                raise ValueError(f"Too many exercise states to add {name!r}")
+            cls.STATES.append(name)
+        return cls.STATES.index(name)
+
+    def label_code(self, label):
+        code = self._label_codes.get(label)
+        if code is None:
+            code = self._label_codes[label] = len(self._label_codes)
+        return code
+
+    def update_curls(self, slots, keypoints):
         """
-        Process pose keypoints and update game state.
-        keypoints: (17, 3) numpy array
+        BicepCurl.update() for every slot at once.
+        slots: (n,) distinct slot indices
+        keypoints: (n, 17, 3) one pose per slot
         """
-        # 1. Check if required points are detected
-        needed = [self.KP_R_SHOULDER, self.KP_R_ELBOW, self.KP_R_WRIST, self.KP_R_HIP]
-        for idx in needed:
-            if keypoints[idx][2] < 0.5: # Low confidence
-                self.feedback = "Camera Obstructed"
-                self.is_correct_form = False
+        slots = np.asarray(slots, dtype=np.intp)
+        kp = np.asarray(keypoints)
+        if not len(slots):
+            return
+
+        # 1. Required points detected? (count_nonzero and mask assignment are
+        # far cheaper than any() / where() on the small arrays of a live frame)
+        low = kp[:, BicepCurl.REQUIRED, 2] < 0.5 # Low confidence
+        if np.count_nonzero(low):
+            ok = ~low.any(axis=1)
+            obstructed = slots[~ok]
+            self.feedback[obstructed] = self.FB_OBSTRUCTED
+            self.correct[obstructed] = False
+            slots, kp = slots[ok], kp[ok]
+            if not len(slots):
                 return
+        s = slots
 
-        # Extract Points
-        s = keypoints[self.KP_R_SHOULDER]
-        e = keypoints[self.KP_R_ELBOW]
-        w = keypoints[self.KP_R_WRIST]
-        h = keypoints[self.KP_R_HIP]
+        # Flare and curl angles of every pose in one pass, smoothed like FeatureWindow.ema
+        angles = features.joint_angles(kp, BicepCurl.ANGLE_TRIPLETS)
+        ema = self.ema[s, :2]
+        ema += (angles - ema) * self.alpha[s][:, None]
+        first = ~self.seen[s]
+        if np.count_nonzero(first):
+            ema[first] = angles[first]
+            self.seen[s] = True
+        self.ema[s, :2] = ema
+        smoothed = self.smoothed[s]
+        if np.count_nonzero(smoothed):
+            angles[smoothed] = ema[smoothed]
+        flare, curl = angles[:, 0], angles[:, 1]
+        self.flare_angle[s] = flare
+        self.current_angle[s] = curl
 
-        # 2. Analyze Form (Elbow Flare)
-        # Angle at Shoulder (S) between Hip (H) and Elbow (E)
-        self.flare_angle = self.calculate_angle(h, s, e)
-        
-        # Valid flare is usually < 20-30 degrees
-        if self.flare_angle > 20: 
-            self.is_correct_form = False
-            self.feedback = "Tuck Your Elbow!"
-            self.energy -= 0.5 # Drain energy
-        else:
-            self.is_correct_form = True
-            self.feedback = "Good Form"
-            self.energy = min(100, self.energy + 0.2) # Regen
-
-        # 3. Analyze Repetition (Flexion/Extension)
-        # Angle at Elbow (E) between Shoulder (S) and Wrist (W)
-        self.current_angle = self.calculate_angle(s, e, w)
-
-        # State Machine
-        if self.state == "extension":
-            # Waiting to curl up
-            if self.current_angle < 40: # Fully curled
-                # Only count rep if form was good recently? 
-                # For MVP, just check current form
-                if self.is_correct_form:
-                    self.state = "flexion"
-                    self.reps += 1
-                    self.score += 100
-                    # Trigger visual pop or sound in main
-        
-        elif self.state == "flexion":
-            # Waiting to extend down
-            if self.current_angle > 160: # Fully extended
-                self.state = "extension"
+        # 2. Form (elbow flare)
+        bad = flare > BicepCurl.FLARE_LIMIT
+        energy = self.energy[s]
+        drained = energy - 0.5
+        np.minimum(energy + 0.2, 100, out=energy)
+        energy[bad] = drained[bad]
+        feedback = np.full(len(s), self.FB_GOOD_FORM, dtype=np.int32)
+        feedback[bad] = self.FB_TUCK
+        self.correct[s] = ~bad
+
+        # 3. Rep state machine
+        state = self.state[s]
+        curled = (state == self.EXTENSION) & (curl < BicepCurl.CURLED_ANGLE) & ~bad
+        extended = (state == self.FLEXION) & (curl > BicepCurl.EXTENDED_ANGLE)
+        if np.count_nonzero(curled):
+            self.reps[s] += curled
+            self.score[s] += 100 * curled
+            state[curled] = self.FLEXION
+        if np.count_nonzero(extended):
+            state[extended] = self.EXTENSION
+        self.state[s] = state
 
         # Energy clamp
-        if self.energy < 0:
-            self.energy = 0
-            self.feedback = "FATIGUE / BAD FORM"
+        fatigued = energy < 0
+        if np.count_nonzero(fatigued):
+            energy[fatigued] = 0.0
+            feedback[fatigued] = self.FB_FATIGUE
+        self.energy[s] = energy
+        self.feedback[s] = feedback
+
+    def update_predictions(self, slots, labels, confidences):
+        """
+        ClassifierExercise.update() for every slot at once.
+        slots: (n,) distinct slot indices
+        labels: (n,) predicted label strings (e.g. 'squats_down')
+        confidences: (n,) floats
+        """
+        slots = np.asarray(slots, dtype=np.intp)
+        if not len(slots):
+            return
+        pred = np.array([self.label_code(str(label)) for label in labels], dtype=np.int32)
+        conf = np.asarray(confidences, dtype=np.float64)
 
+        uncertain = conf < 0.4
+        self.feedback[slots[uncertain]] = self.FB_UNCERTAIN
+        s, pred = slots[~uncertain], pred[~uncertain]
+        if not len(s):
+            return
+
+        # State transitions, only when the prediction changed
+        state = self.state[s]
+        target, reset = self.target[s], self.reset[s]
+        changed = pred != self.last_pred[s]
+        go = changed & (pred == target) & (state == self.REST)
+        rep = changed & ~go & (pred == reset) & (state == self.ACTIVE)
+        init = changed & ~go & ~rep & (state == self.START)
+        state = np.where(go, self.ACTIVE, state)
+        state = np.where(rep, self.REST, state)
+        state = np.where(init & (pred == reset), self.REST, state)
+        state = np.where(init & (pred == target), self.ACTIVE, state)
+        self.state[s] = state
+        self.last_pred[s] = pred
+        self.reps[s] += rep
+        self.score[s] += 100 * rep
+        energy = np.where(rep, np.minimum(100, self.energy[s] + 5), self.energy[s])
+        feedback = np.where(go, self.FB_GO, np.where(rep, self.FB_GOOD_REP, self.feedback[s]))
+
+        # Recognised target / reset pose: good form
+        known = (pred == target) | (pred == reset)
+        self.correct[s] |= known
+        self.feedback[s] = np.where(known, self.doing[s], feedback)
+        self.energy[s] = np.where(known, np.minimum(100, energy + 0.1), energy)
 
-class ClassifierExercise(Exercise):
+
+class BankedExercise(Exercise):
+    """
+    An Exercise whose state lives in one slot of an ExerciseBank (a private
+    one unless `bank` is given). Attributes read and write the bank arrays.
+    """
+    def __init__(self, bank=None):
+        self.bank = bank if bank is not None else ExerciseBank(1)
+        self.slot = self.bank.allocate()
+        weakref.finalize(self, self.bank.release, self.slot)
+        super().__init__()
+
+    reps = property(lambda self: int(self.bank.reps[self.slot]),
+                    lambda self, v: self.bank.reps.__setitem__(self.slot, v))
+    score = property(lambda self: int(self.bank.score[self.slot]),
+                     lambda self, v: self.bank.score.__setitem__(self.slot, v))
+    energy = property(lambda self: float(self.bank.energy[self.slot]),
+                      lambda self, v: self.bank.energy.__setitem__(self.slot, v))
+    is_correct_form = property(lambda self: bool(self.bank.correct[self.slot]),
+                               lambda self, v: self.bank.correct.__setitem__(self.slot, v))
+    state = property(lambda self: ExerciseBank.STATES[self.bank.state[self.slot]],
+                     lambda self, v: self.bank.state.__setitem__(self.slot, ExerciseBank.STATES.index(v)))
+    feedback = property(lambda self: self.bank.feedback_texts[self.bank.feedback[self.slot]],
+                        lambda self, v: self.bank.feedback.__setitem__(self.slot, self.bank.feedback_code(v)))
+
+
+class BicepCurl(BankedExercise):
+    # Thresholds (degrees), class attributes so replay.py can tune them
+    FLARE_LIMIT = 20     # Elbow flare above this is bad form
+    CURLED_ANGLE = 40    # Elbow angle below this completes the curl
+    EXTENDED_ANGLE = 160 # Elbow angle above this resets for the next rep
+
+    # COCO Keypoint Indices
+    KP_R_SHOULDER = 6
+    KP_R_ELBOW = 8
+    KP_R_WRIST = 10
+    KP_R_HIP = 12
+    REQUIRED = np.array([KP_R_SHOULDER, KP_R_ELBOW, KP_R_WRIST, KP_R_HIP])
+
+    # Both angles this exercise needs, evaluated in one joint_angles() pass:
+    # flare = at Shoulder (S) between Hip (H) and Elbow (E)
+    # curl  = at Elbow (E) between Shoulder (S) and Wrist (W)
+    ANGLE_TRIPLETS = np.array([
+        (KP_R_HIP, KP_R_SHOULDER, KP_R_ELBOW),
+        (KP_R_SHOULDER, KP_R_ELBOW, KP_R_WRIST),
+    ])
+
+    def __init__(self, smoothing=None, bank=None):
+        """
+        smoothing: optional EMA weight (0-1] of the newest frame. When set,
+        form and rep thresholds use smoothed angles, which stops keypoint
+        jitter around a threshold from flipping the state machine.
+        bank: ExerciseBank to keep the state in (see ExerciseBank.update_curls)
+        """
+        super().__init__(bank)
+        self.smoothing = smoothing
+        self.bank.alpha[self.slot] = smoothing or 0.5
+        self.bank.smoothed[self.slot] = bool(smoothing)
+
+    current_angle = property(lambda self: float(self.bank.current_angle[self.slot]))
+    flare_angle = property(lambda self: float(self.bank.flare_angle[self.slot]))
+
+    def update(self, keypoints):
+        """
+        Process pose keypoints and update game state.
+        keypoints: (17, 3) numpy array
+        """
+        self.bank.update_curls([self.slot], np.asarray(keypoints)[None])
+
+
+class ClassifierExercise(BankedExercise):
     """
     Generic exercise class that relies on external Classifier predictions 
     (e.g., 'squats_down', 'squats_up') rather than manual angle calculations.
     """
-    def __init__(self, exercise_name="squats"):
-        super().__init__()
+    def __init__(self, exercise_name="squats", bank=None):
+        super().__init__(bank)
         self.exercise_name = exercise_name # e.g. "squats", "pushups", "jumping_jacks"
-        self.last_pred = ""
         self.state = "start"
         
         # Define what constitutes a "rep" for this exercise
@@ -129,54 +329,128 @@ class ClassifierExercise(Exercise):
             self.target_state = "pullups_up"
             self.reset_state = "pullups_down"
 
+        bank = self.bank
+        bank.target[self.slot] = bank.label_code(self.target_state)
+        bank.reset[self.slot] = bank.label_code(self.reset_state)
+        bank.doing[self.slot] = bank.feedback_code(f"Doing {exercise_name}...")
+
+    @property
+    def last_pred(self):
+        code = self.bank.last_pred[self.slot]
+        if code < 0:
+            return ""
+        return next(label for label, c in self.bank._label_codes.items() if c == code)
+
     def update(self, prediction, confidence):
         """
         prediction: str (e.g. 'squats_down')
         confidence: float
         """
-        if confidence < 0.4:
-            self.feedback = "Uncertain..."
-            return
+        self.bank.update_predictions([self.slot], [prediction], [confidence])
 
-        # Basic filtering to avoid flickering
-        if prediction == self.last_pred:
-            pass # Stable state
-        else:
-            # State transition detection
-            self.handle_transition(prediction)
-            self.last_pred = prediction
-
-        # Form feedback is implicit in the classifier's ability to detect it at all?
-        # Or we can say if it's "Uncertain" often, form is bad.
-        # For now, if we match the target/reset states, we assume Good Form.
-        if prediction in [self.target_state, self.reset_state]:
-            self.is_correct_form = True
-            self.feedback = f"Doing {self.exercise_name}..."
-            self.energy = min(100, self.energy + 0.1)
-        else:
-            # Maybe detecting "standing" or other exercises
-            pass
 
-    def handle_transition(self, new_state):
-        # State Machine
-        # simple 2-state: RECOVER -> ACTIVE -> RECOVER (Count Rep)
+class ClassifierPlayer:
+    """
+    Game state for one tracked person: a ClassifierExercise per supported
+    exercise (these persist reps/score across the session) plus the one
+    currently being performed.
+    """
+    EXERCISES = ['squats', 'pushups', 'jumping_jacks', 'pullups', 'situp']
+
+    def __init__(self, window=15, alpha=0.5, bank=None):
+        """
+        bank: ExerciseBank to keep the games in; give every player the same
+        one so update_players() advances them all in one call
+        """
+        # Initialize Games for each supported exercise, sharing one bank
+        if bank is None:
+            bank = ExerciseBank(len(self.EXERCISES))
+        self.games = {name: ClassifierExercise(name, bank) for name in self.EXERCISES}
+
+        # This player's recent pose features; the classifier reads window.ema
+        self.window = FeatureWindow(len(features.ANGLE_COLUMNS), window=window, alpha=alpha)
+        
+        # active_game will point to one of the instances in 'games'
+        self.active_game = None 
+        self.active_exercise_name = "None"
+
+    def observe(self, feature_row):
+        """Adds this frame's (7,) pose features to the window."""
+        self.window.push(feature_row)
+
+    def update(self, pred_label, confidence):
+        """
+        pred_label: str classifier output for this player (e.g. 'squats_down')
+        confidence: float
+        """
+        # E. Update Active Game
+        if self.switch(pred_label, confidence):
+            self.active_game.update(pred_label, confidence)
+
+    def switch(self, pred_label, confidence):
+        """
+        Switches the active game to the predicted exercise when confident.
+        Returns the active game (None before the first confident prediction).
+        """
+        # C. Determine Exercise Type (e.g. "squats" from "squats_down")
+        exercise_type = pred_label.rsplit('_', 1)[0] # "squats_down" -> "squats"
         
-        # If we were in reset state and moved to target state
-        if new_state == self.target_state and self.state == "rest":
-            self.state = "active"
-            self.feedback = "GO!"
-            
-        # If we were active and moved back to reset/rest state -> REP COMPLETE
-        elif new_state == self.reset_state and self.state == "active":
-            self.state = "rest"
-            self.reps += 1
-            self.score += 100
-            self.feedback = "GOOD REP!"
-            self.energy = min(100, self.energy + 5)
-            
-        # Initialization
-        elif self.state == "start":
-            if new_state == self.reset_state:
-                self.state = "rest"
-            elif new_state == self.target_state:
-                self.state = "active"
+        # D. Switch Game Mode if needed
+        # Only switch if high confidence and different from current
+        if confidence > 0.6:
+            if exercise_type in self.games:
+                self.active_game = self.games[exercise_type]
+                self.active_exercise_name = exercise_type
+        return self.active_game
+
+
+def update_players(players, labels, confidences):
+    """
+    ClassifierPlayer.update() for many players: switches each one's active
+    game, then advances all active games with one
+    ExerciseBank.update_predictions() call per bank (one in total when the
+    players share a bank).
+    """
+    batches = {} # id(bank) -> (bank, slots, labels, confidences)
+    for player, label, confidence in zip(players, labels, confidences):
+        label, confidence = str(label), float(confidence)
+        game = player.switch(label, confidence)
+        if game is not None:
+            _, slots, batch_labels, batch_conf = batches.setdefault(id(game.bank), (game.bank, [], [], []))
+            slots.append(game.slot)
+            batch_labels.append(label)
+            batch_conf.append(confidence)
+    for bank, slots, batch_labels, batch_conf in batches.values():
+        bank.update_predictions(slots, batch_labels, batch_conf)
+
+
+def classify_players(clf, players, visible, classify=True, smoothed=True):
+    """
+    One frame of the classifier game for every visible player, batched:
+    pushes each player's pose features into their window and, when
+    `classify` is set, classifies all of them in one call and updates their
+    games (see update_players()).
+
+    clf: GatedClassifier (per-player gating is keyed on the player IDs)
+    players: PlayerGames of ClassifierPlayer
+    visible: {player_id: (17, 3) keypoints}
+    smoothed: classify the players' EMA features (True) or this frame's raw ones
+    Returns (pids, labels, confidences) of the players that were classified.
+    """
+    pids = list(visible)
+    if not pids:
+        return [], [], []
+    # A. Extract Features
+    with metrics.timer("features"):
+        feats = features.pose_features(np.stack([visible[pid] for pid in pids]))
+    for pid, row in zip(pids, feats):
+        players.get(pid).observe(row)
+    if not classify:
+        return [], [], []
+
+    # B. Predict Exercise: label + confidence in one pass
+    with metrics.timer("classify"):
+        X = np.stack([players.get(pid).window.ema for pid in pids]) if smoothed else feats
+        labels, confidences = clf.classify(X, keys=pids) # e.g. "squats_down"
+    update_players([players.get(pid) for pid in pids], labels, confidences)
+    return pids, labels, confidences
@@ -0,0 +1,145 @@
+import time
+
+import cv2
+
+from metrics import metrics
+from pose_engine import _empty_keypoints
+
+
+class IdleEngine:
+    """
+    Wraps a pose engine so an empty station stops paying for full inference.
+
+    Active: every frame goes to the model. After `idle_after` seconds in
+    which nobody was detected the engine goes idle: frames are only polled
+    `poll_fps` times a second, by differencing a small (poll_width wide),
+    blurred grayscale copy against the previous poll, and return no
+    detections. It wakes, running the model on that very frame, when more
+    than `motion_ratio` of the pixels changed by more than `pixel_threshold`.
+    Every `check_every` seconds an idle poll also runs the model regardless,
+    and wakes if somebody is found (e.g. walked in too slowly to trip the
+    motion test).
+
+    Same get_keypoints / get_all_keypoints contract as PoseEngine.
+    """
+    def __init__(self, engine, idle_after=3.0, poll_fps=10.0, motion_ratio=0.01, pixel_threshold=25,
+                 check_every=10.0, poll_width=160):
+        self.engine = engine
+        self.idle_after = idle_after
+        self.poll_interval = 1.0 / poll_fps
+        self.motion_ratio = motion_ratio
+        self.pixel_threshold = pixel_threshold
+        self.check_every = check_every
+        self.poll_width = poll_width
+
+        self.idle = False
+        self.last_full = False # Whether the last call ran the model
+        now = time.perf_counter()
+        self._last_person = now
+        self._mode_since = now
+        self._last_poll = 0.0
+        self._last_check = 0.0
+        self._quiet_since = 0.0 # Last idle poll that saw no motion
+        self._prev = None
+
+        # Counters
+        self.mode_seconds = {'active': 0.0, 'idle': 0.0}
+        self.full_frames = 0
+        self.polls = 0
+        self.skipped = 0
+        self.wakes = {'motion': 0, 'check': 0}
+        self.wake_latencies = []
+
+    def __getattr__(self, name):
+        return getattr(self.engine, name)
+
+    def _small(self, frame):
+        h, w = frame.shape[:2]
+        small = cv2.resize(frame, (self.poll_width, max(1, h * self.poll_width // w)),
+                           interpolation=cv2.INTER_LINEAR)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        # Sensor noise must not read as motion
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def _moved(self, small):
+        prev, self._prev = self._prev, small
+        if prev is None or prev.shape != small.shape:
+            return False
+        changed = cv2.threshold(cv2.absdiff(small, prev), self.pixel_threshold, 255, cv2.THRESH_BINARY)[1]
+        return cv2.countNonZero(changed) > self.motion_ratio * small.size
+
+    def _set_mode(self, idle, now):
+        self.mode_seconds['idle' if self.idle else 'active'] += now - self._mode_since
+        self._mode_since = now
+        self.idle = idle
+        metrics.set_counter("idle", int(idle))
+
+    def get_all_keypoints(self, frame):
+        now = time.perf_counter()
+        self.last_full = False
+        if not self.idle:
+            people = self.engine.get_all_keypoints(frame)
+            self.full_frames += 1
+            self.last_full = True
+            if len(people):
+                self._last_person = now
+            elif now - self._last_person >= self.idle_after:
+                self._set_mode(True, now)
+                self._prev = self._small(frame) # Reference for the first poll
+                self._last_poll = self._last_check = self._quiet_since = now
+            return people
+
+        if now - self._last_poll < self.poll_interval:
+            self.skipped += 1
+            return _empty_keypoints()
+        self._last_poll = now
+        self.polls += 1
+        moved = self._moved(self._small(frame))
+        if not moved and now - self._last_check < self.check_every:
+            self._quiet_since = now
+            return _empty_keypoints()
+
+        # Motion (or a periodic check): full inference on this very frame
+        people = self.engine.get_all_keypoints(frame)
+        self.full_frames += 1
+        self.last_full = True
+        if not moved:
+            self._last_check = now
+            if not len(people):
+                return people
+        done = time.perf_counter()
+        # Upper bound on "motion started -> full inference result": the
+        # motion began at the earliest just after the last quiet poll
+        latency = done - self._quiet_since
+        self.wake_latencies.append(latency)
+        self.wakes['motion' if moved else 'check'] += 1
+        metrics.record("idle_wake", latency)
+        metrics.count("idle_wakes")
+        self._set_mode(False, done)
+        self._last_person = done
+        return people
+
+    def get_keypoints(self, frame):
+        people = self.get_all_keypoints(frame)
+        if len(people) == 0:
+            return None
+        return people[0]
+
+    def idle_report(self):
+        seconds = dict(self.mode_seconds)
+        seconds['idle' if self.idle else 'active'] += time.perf_counter() - self._mode_since
+        total = seconds['active'] + seconds['idle']
+        lat = self.wake_latencies
+        return {
+            'mode': 'idle' if self.idle else 'active',
+            'active_s': round(seconds['active'], 1),
+            'idle_s': round(seconds['idle'], 1),
+            'idle_fraction': round(seconds['idle'] / total, 3) if total else 0.0,
+            'full_frames': self.full_frames,
+            'polls': self.polls,
+            'skipped_frames': self.skipped,
+            'wakes': dict(self.wakes),
+            'wake_ms_mean': round(1000.0 * sum(lat) / len(lat), 1) if lat else None,
+            'wake_ms_max': round(1000.0 * max(lat), 1) if lat else None,
+        }
@@ -0,0 +1,125 @@
+import cv2
+import numpy as np
+
+class KeyframeEngine:
+    """
+    Wraps a PoseEngine so the full model only runs on keyframes.
+
+    Between keyframes the last keypoints are propagated with sparse pyramidal
+    Lucas-Kanade optical flow on the joints themselves (N_people * 17 points,
+    one cv2.calcOpticalFlowPyrLK call per direction). A new keyframe is
+    forced when:
+      - max_interval frames have passed since the last one,
+      - too few joints could be followed (occlusion, fast motion),
+      - the mean flow error or forward-backward error is too large,
+      - the last keyframe found nobody (keep looking every frame).
+
+    Propagated joints keep their confidence multiplied by conf_decay per
+    frame, so downstream confidence checks see them age rather than stay
+    artificially certain. Exposes the same get_keypoints / get_all_keypoints
+    contract as PoseEngine.
+    """
+    def __init__(self, engine, max_interval=4, min_tracked=0.7, max_flow_error=20.0,
+                 fb_threshold=2.0, conf_threshold=0.5, conf_decay=0.98,
+                 win_size=21, max_level=3):
+        self.engine = engine
+        self.max_interval = max_interval
+        self.min_tracked = min_tracked       # Fraction of confident joints that must be followed
+        self.max_flow_error = max_flow_error # Mean LK patch error above which we re-detect
+        self.fb_threshold = fb_threshold     # Max forward-backward distance (pixels) for a joint
+        self.conf_threshold = conf_threshold # Only joints above this are propagated
+        self.conf_decay = conf_decay
+        self.lk_params = dict(
+            winSize=(win_size, win_size),
+            maxLevel=max_level,
+            criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03),
+        )
+
+        self.prev_gray = None
+        self.prev_people = None
+        self.frames_since_keyframe = 0
+        self.force_keyframe = True
+
+        # Counters
+        self.keyframes = 0
+        self.propagated = 0
+
+    def __getattr__(self, name):
+        # Anything not overridden (batch API, model, device...) goes to the wrapped engine
+        return getattr(self.engine, name)
+
+    @property
+    def keyframe_ratio(self):
+        total = self.keyframes + self.propagated
+        return self.keyframes / total if total else 0.0
+
+    def reset(self):
+        self.force_keyframe = True
+
+    def _detect(self, frame, gray):
+        people = self.engine.get_all_keypoints(frame)
+        self.keyframes += 1
+        self.frames_since_keyframe = 0
+        self.prev_gray = gray
+        self.prev_people = people
+        # Nobody found: there is nothing to propagate, look again next frame
+        self.force_keyframe = len(people) == 0
+        return people
+
+    def _propagate(self, gray):
+        people = self.prev_people.copy()
+        conf = people[..., 2]
+        tracked = conf > self.conf_threshold
+        if not tracked.any():
+            return None
+
+        pts = people[..., :2][tracked].reshape(-1, 1, 2).astype(np.float32)
+        nxt, status, err = cv2.calcOpticalFlowPyrLK(self.prev_gray, gray, pts, None, **self.lk_params)
+        back, back_status, _ = cv2.calcOpticalFlowPyrLK(gray, self.prev_gray, nxt, None, **self.lk_params)
+
+        fb_error = np.linalg.norm((back - pts).reshape(-1, 2), axis=1)
+        ok = (status.ravel() == 1) & (back_status.ravel() == 1) & (fb_error < self.fb_threshold)
+
+        if ok.mean() < self.min_tracked:
+            return None
+        if err.ravel()[ok].mean() > self.max_flow_error:
+            return None
+
+        # Followed joints move and age; lost ones drop to zero confidence
+        moved = people[..., :2][tracked]
+        moved[ok] = nxt.reshape(-1, 2)[ok]
+        people[..., :2][tracked] = moved
+        new_conf = conf[tracked] * self.conf_decay
+        new_conf[~ok] = 0.0
+        people[..., 2][tracked] = new_conf
+        return people
+
+    def get_all_keypoints(self, frame):
+        """
+        Returns:
+            np.ndarray: (N_people, 17, 3), from the model on keyframes and
+                        from optical flow in between.
+        """
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+        if self.force_keyframe or self.prev_gray is None or self.frames_since_keyframe + 1 >= self.max_interval:
+            return self._detect(frame, gray)
+
+        people = self._propagate(gray)
+        if people is None:
+            return self._detect(frame, gray)
+
+        self.propagated += 1
+        self.frames_since_keyframe += 1
+        self.prev_gray = gray
+        self.prev_people = people
+        return people
+
+    def get_keypoints(self, frame):
+        """
+        Same contract as PoseEngine.get_keypoints: (17, 3) or None.
+        """
+        people = self.get_all_keypoints(frame)
+        if len(people) == 0:
+            return None
+        return people[0]
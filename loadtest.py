@@ -0,0 +1,185 @@
+import argparse
+import asyncio
+import json
+import time
+
+import cv2
+import numpy as np
+
+from pipeline import SyntheticSource
+from server import DEFAULT_PORT, MODES, encode_message, read_message
+
+
+class PoseClient:
+    """
+    Minimal client for server.py: connects, says hello, sends frames and
+    yields the server's replies. Also usable as a stand-in camera station.
+    """
+    def __init__(self, reader, writer, session):
+        self.reader = reader
+        self.writer = writer
+        self.session = session
+
+    @classmethod
+    async def connect(cls, host='127.0.0.1', port=DEFAULT_PORT, mode='bicep_curl'):
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(encode_message({'type': 'hello', 'mode': mode}))
+        await writer.drain()
+        msg = await read_message(reader)
+        if msg is None or msg[0].get('type') != 'welcome':
+            writer.close()
+            raise ConnectionError(msg[0].get('message') if msg else "connection closed")
+        return cls(reader, writer, msg[0]['session'])
+
+    async def send_frame(self, seq, payload, encoding='jpeg', shape=None):
+        header = {'type': 'frame', 'seq': seq, 'encoding': encoding}
+        if shape is not None:
+            header['shape'] = list(shape)
+        self.writer.write(encode_message(header, payload))
+        await self.writer.drain()
+
+    async def replies(self):
+        while True:
+            msg = await read_message(self.reader)
+            if msg is None:
+                return
+            yield msg[0]
+
+    async def close(self):
+        try:
+            self.writer.write(encode_message({'type': 'bye'}))
+            await self.writer.drain()
+        except ConnectionError:
+            pass
+        self.writer.close()
+
+
+def load_frames(video=None, count=60, width=640, height=480, quality=80):
+    """JPEG-encoded frames from a video file, or synthetic ones."""
+    frames = []
+    if video:
+        cap = cv2.VideoCapture(video)
+        while len(frames) < count:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(cv2.resize(frame, (width, height)))
+        cap.release()
+    if not frames:
+        source = SyntheticSource(width, height, count=count)
+        while True:
+            ok, frame = source.read()
+            if not ok:
+                break
+            frames.append(frame)
+    params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+    return [cv2.imencode('.jpg', f, params)[1].tobytes() for f in frames]
+
+
+async def run_client(index, args, frames, stats):
+    try:
+        client = await PoseClient.connect(args.host, args.port, args.mode)
+    except (OSError, ConnectionError) as e:
+        stats['errors'].append(f"client {index}: {e}")
+        return
+
+    sent = {} # seq -> send time
+    latencies = stats['latencies']
+
+    async def receive():
+        async for reply in client.replies():
+            kind = reply.get('type')
+            t = sent.pop(reply.get('seq'), None)
+            if kind == 'result':
+                stats['results'] += 1
+                if t is not None:
+                    latencies.append(time.perf_counter() - t)
+            elif kind == 'dropped':
+                stats['dropped'] += 1
+            elif kind == 'error':
+                stats['errors'].append(f"client {index}: {reply.get('message')}")
+
+    receiver = asyncio.create_task(receive())
+    interval = 1.0 / args.fps
+    start = time.perf_counter()
+    seq = 0
+    # Stagger clients so they do not all send on the same tick
+    next_time = start + interval * index / max(1, args.clients)
+    try:
+        while time.perf_counter() - start < args.duration:
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            sent[seq] = time.perf_counter()
+            await client.send_frame(seq, frames[seq % len(frames)])
+            stats['sent'] += 1
+            seq += 1
+            next_time += interval
+        # Give in-flight frames a moment to come back
+        deadline = time.perf_counter() + 2.0
+        while sent and time.perf_counter() < deadline:
+            await asyncio.sleep(0.01)
+    except ConnectionError as e:
+        stats['errors'].append(f"client {index}: {e}")
+    finally:
+        await client.close()
+        receiver.cancel()
+        stats['lost'] += len(sent)
+
+
+async def run_load(args):
+    frames = load_frames(args.video, args.frames, args.width, args.height, args.quality)
+    stats = {'sent': 0, 'results': 0, 'dropped': 0, 'lost': 0, 'latencies': [], 'errors': []}
+    start = time.perf_counter()
+    await asyncio.gather(*(run_client(i, args, frames, stats) for i in range(args.clients)))
+    elapsed = time.perf_counter() - start
+
+    lat = np.array(stats['latencies']) * 1000.0
+    report = {
+        'clients': args.clients,
+        'target_fps_per_client': args.fps,
+        'duration_s': round(elapsed, 2),
+        'sent': stats['sent'],
+        'results': stats['results'],
+        'dropped': stats['dropped'],
+        'lost': stats['lost'],
+        'throughput_fps': round(stats['results'] / elapsed, 2) if elapsed > 0 else 0.0,
+        'latency_ms': {
+            'p50': round(float(np.percentile(lat, 50)), 2),
+            'p95': round(float(np.percentile(lat, 95)), 2),
+            'p99': round(float(np.percentile(lat, 99)), 2),
+            'max': round(float(lat.max()), 2),
+        } if len(lat) else None,
+        'errors': stats['errors'][:10],
+    }
+    return report
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load test for server.py")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--fps', type=float, default=15.0, help="Frames per second per client")
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds of sending")
+    parser.add_argument('--mode', default='bicep_curl', choices=MODES)
+    parser.add_argument('--video', default=None, help="Video file to send instead of synthetic frames")
+    parser.add_argument('--frames', type=int, default=60, help="Distinct frames cycled through")
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=480)
+    parser.add_argument('--quality', type=int, default=80, help="JPEG quality")
+    parser.add_argument('--out', default=None, help="Write the report JSON here")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    report = asyncio.run(run_load(args))
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
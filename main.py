@@ -1,77 +1,160 @@
+# First import: startup timing is measured from here
+from startup import startup, add_startup_args
+
+import argparse
 import cv2
-import time
 import sys
+from functools import partial
+import numpy as np
 
 # Import local modules
 try:
-    from pose_engine import PoseEngine
-    from game_logic import BicepCurl
+    from pose_engine import add_engine_args, build_engine
+    from game_logic import BicepCurl, ExerciseBank
+    from rules import EXERCISES, RULES, RuleExercise
+    from tracker import PoseTracker, PlayerGames
+    from pipeline import Pipeline, add_source_args, open_source
+    from metrics import add_metrics_args, configure_metrics, metrics
+    from recording import add_recording_args, open_recorder
+    from adaptive import add_adaptive_args, check_adaptive_args, open_controller
+    from shm_pipeline import ProcessPipeline, add_process_args, check_process_args
     import visuals
 except ImportError as e:
     print(f"Error importing modules: {e}")
     sys.exit(1)
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Gamified Pose Tracker (Bicep Curl)")
+    add_source_args(parser)
+    add_engine_args(parser)
+    add_metrics_args(parser)
+    add_startup_args(parser)
+    add_recording_args(parser)
+    add_adaptive_args(parser)
+    add_process_args(parser)
+    parser.add_argument('--exercise', default='bicep_curl', choices=sorted(EXERCISES),
+                        help="Exercise to score (rules in rules.py, default: bicep_curl)")
+    args = parser.parse_args()
+    check_adaptive_args(parser, args)
+    check_process_args(parser, args)
+    return args
+
 def main():
+    args = parse_args()
+    configure_metrics(args)
+    startup.mark("imports")
     print("--- PROJECT: GAMIFIED POSE TRACKER ---")
-    
-    try:
-        engine = PoseEngine(model_path="yolo26n-pose.pt", device=0)
-    except Exception as e:
-        print("CRITICAL ERROR: Could not load PoseEngineModel.")
-        print(f"Details: {e}")
-        return    
-    game = BicepCurl()
-    print("Opening Webcam...")
-    cap = cv2.VideoCapture(0)
-    if not cap.isOpened():
-        print("Error: Could not open webcam.")
-        return
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
-    print("Game Started! Stand back and perform a Bicep Curl.")
+
+    engine = source = None # With --workers, loaded / opened by their own processes
+    if not args.workers:
+        try:
+            with startup.phase("load_pose_model"):
+                engine = build_engine(args)
+        except Exception as e:
+            print("CRITICAL ERROR: Could not load PoseEngineModel.")
+            print(f"Details: {e}")
+            return
+        if not args.no_warmup:
+            # Pay the first-inference cost now, before the camera is open
+            with startup.phase("warmup"):
+                engine.warmup()
+    # One game per tracked player, so reps never jump between bodies
+    # Their state shares one bank, advanced for everyone in a single update
+    # (bicep curls keep their hand-written BicepCurl path, other exercises run
+    # through the rule engine)
+    tracker = PoseTracker()
+    bank = ExerciseBank()
+    if args.exercise == 'bicep_curl':
+        new_game, update_games = BicepCurl, bank.update_curls
+    else:
+        new_game = partial(RuleExercise, args.exercise)
+        update_games = partial(RULES.update, bank)
+    players = PlayerGames(lambda: new_game(bank=bank))
+    idle_game = new_game() # Shown while nobody is in view
+    if not args.workers:
+        print("Opening Webcam...")
+        with startup.phase("open_camera"):
+            source = open_source(args, width=1280, height=720, flip=True)
+        if not source.is_opened():
+            print("Error: Could not open webcam.")
+            return
+    recorder = open_recorder(args)
+    controller = open_controller(args, engine)
+    print(f"Game Started! Stand back and perform a {args.exercise.replace('_', ' ').title()}.")
     print("Press 'q' to Quit.")
-    prev_time = 0
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            print("Error: Failed to grab frame.")
-            time.sleep(1)
-            continue
-
-        
-        frame = cv2.flip(frame, 1)
-
-        
-        keypoints = engine.get_keypoints(frame)
-
-        
-        if keypoints is not None:
-            game.update(keypoints)
-        else:
-            
-            game.feedback = "Looking for Player..."
-            
-            
+
+    # Inference stage (worker thread): pose + tracking + game logic
+    def process(frame):
+        return handle(engine.get_all_keypoints(frame))
+
+    # Tracking + game logic for one frame's detections
+    def handle(people):
+        if recorder is not None:
+            recorder.write(people)
+        visible = tracker.update(people)
+        players.sync(visible, tracker.expired)
+
+        if visible:
+            update_games([players.get(pid).slot for pid in visible],
+                         np.stack(list(visible.values())))
+
+        primary = tracker.primary_id()
+        if primary is None:
+            idle_game.feedback = "Looking for Player..."
+
+        startup.mark_first_frame()
+        return visible, primary
+
+    # Render stage (main thread): runs at camera rate with the latest keypoints
+    def render(frame, result):
+        visible, primary = result if result is not None else ({}, None)
+
         # 6. Visualization
-        visuals.draw_skeleton(frame, keypoints, game.is_correct_form)
-        visuals.draw_overlay(frame, game)
+        for pid, keypoints in visible.items():
+            player_game = players.get(pid)
+            if player_game is None: # Expired since this result was produced
+                continue
+            visuals.draw_skeleton(frame, keypoints, player_game.is_correct_form)
+            if len(visible) > 1:
+                visuals.draw_player_label(frame, keypoints, pid)
+
+        game = players.get(primary) if primary is not None else None
+        visuals.draw_overlay(frame, game or idle_game)
 
-        # FPS Counter
-        curr_time = time.time()
-        fps = 1 / (curr_time - prev_time) if prev_time > 0 else 0
-        prev_time = curr_time
-        
-        cv2.putText(frame, f"FPS: {int(fps)}", (10, 20), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+        # FPS Counter (display rate / inference rate)
+        fps = pipeline.render_stats.rate
+        inf_fps = pipeline.infer_stats.rate
+        cv2.putText(frame, f"FPS: {int(fps)}  INF: {int(inf_fps)}", (10, 20), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
 
-        # 7. Render
-        cv2.imshow('GAMIFIED POSE TRACKER', frame)
+        if metrics.hud_visible:
+            visuals.draw_metrics_hud(frame, metrics.cached_snapshot())
+        return frame
 
-        # Exit condition
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
+    # 7. Render
+    window_name = None if args.headless else 'GAMIFIED POSE TRACKER'
+    if args.workers:
+        pipeline = ProcessPipeline(partial(open_source, args, width=1280, height=720, flip=True),
+                                   partial(build_engine, args), handle, render,
+                                   workers=args.workers, warmup=not args.no_warmup, window_name=window_name,
+                                   max_frames=args.max_frames, on_key=metrics.handle_key)
+    else:
+        pipeline = Pipeline(source, process, render, window_name=window_name,
+                            max_frames=args.max_frames, on_key=metrics.handle_key,
+                            on_latency=controller.observe if controller else None)
+    pipeline.run()
+    if recorder is not None:
+        recorder.close()
 
-    cap.release()
-    cv2.destroyAllWindows()
+    if source is not None:
+        source.release()
+    metrics.close()
+    pipeline.print_report()
+    if controller is not None:
+        print(f"Adaptive quality: {controller.report()}")
+    if args.idle_after is not None: # Not allowed with --workers
+        print(f"Idle mode: {engine.idle_report()}")
+    if args.startup_log:
+        startup.log(args.startup_log)
     print("Game Exited.")
 
 if __name__ == "__main__":
@@ -1,14 +1,26 @@
+# First import: startup timing is measured from here
+from startup import startup, add_startup_args
+
+import argparse
 import cv2
-import time
 import sys
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import numpy as np
-import joblib
-import pandas as pd
 
 # Import local modules
 try:
-    from pose_engine import PoseEngine
-    from game_logic import ClassifierExercise
+    from pose_engine import add_engine_args, build_engine
+    from game_logic import ClassifierPlayer, ExerciseBank, classify_players
+    from tracker import PoseTracker, PlayerGames
+    from features import ANGLE_COLUMNS, pose_features
+    from forest import add_classifier_args, check_classifier_args, gated_classifier, load_classifier
+    from pipeline import Pipeline, add_source_args, open_source
+    from metrics import add_metrics_args, configure_metrics, metrics
+    from recording import add_recording_args, open_recorder
+    from adaptive import add_adaptive_args, check_adaptive_args, open_controller
+    from shm_pipeline import ProcessPipeline, add_process_args, check_process_args
     import visuals
 except ImportError as e:
     print(f"Error importing modules: {e}")
@@ -16,174 +28,178 @@ except ImportError as e:
 
 CLASSIFIER_MODEL = 'exercise_classifier.pkl'
 
-def calculate_angle_2d(a, b, c):
-    """
-    Calculates angle 2D similarly to how we assume angles.csv was generated.
-    Points are (x, y)
-    """
-    a = np.array(a[:2])
-    b = np.array(b[:2])
-    c = np.array(c[:2])
-    
-    ba = a - b
-    bc = c - b
-    
-    norm_ba = np.linalg.norm(ba)
-    norm_bc = np.linalg.norm(bc)
-    
-    if norm_ba == 0 or norm_bc == 0:
-        return 0.0
-        
-    cosine_angle = np.dot(ba, bc) / (norm_ba * norm_bc)
-    cosine_angle = np.clip(cosine_angle, -1.0, 1.0)
-    angle = np.degrees(np.arccos(cosine_angle))
-    return angle
+# Features are passed as a plain array in ANGLE_COLUMNS order; classifiers
+# pickled before that change were fitted on a DataFrame and would warn every frame.
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
 
 def extract_features(keypoints):
     """
     Extracts the EXACT 7 features used in training from YOLO keypoints.
-    KEYPOINTS are (17, 3) --> [x, y, conf]
+    KEYPOINTS are (17, 3) --> [x, y, conf], or a batch of poses (N, 17, 3).
+    Returns a contiguous (N, 7) float array in ANGLE_COLUMNS order.
     """
-    # Keypoint Map (COCO)
-    # 0:Nose, 1:LEye, 2:REye, 3:LEar, 4:REar, 5:LShoulder, 6:RShoulder
-    # 7:LElbow, 8:RElbow, 9:LWrist, 10:RWrist, 11:LHip, 12:RHip
-    # 13:LKnee, 14:RKnee, 15:LAnkle, 16:RAnkle
-    
-    kp = keypoints # Access shortcut
-    
-    # 1. right_elbow_right_shoulder_right_hip
-    feat1 = calculate_angle_2d(kp[8], kp[6], kp[12])
-    
-    # 2. left_elbow_left_shoulder_left_hip
-    feat2 = calculate_angle_2d(kp[7], kp[5], kp[11])
-    
-    # 3. right_knee_mid_hip_left_knee
-    mid_hip = (kp[11][:2] + kp[12][:2]) / 2
-    feat3 = calculate_angle_2d(kp[14], mid_hip, kp[13])
-    
-    # 4. right_hip_right_knee_right_ankle
-    feat4 = calculate_angle_2d(kp[12], kp[14], kp[16])
-    
-    # 5. left_hip_left_knee_left_ankle
-    feat5 = calculate_angle_2d(kp[11], kp[13], kp[15])
-    
-    # 6. right_wrist_right_elbow_right_shoulder
-    feat6 = calculate_angle_2d(kp[10], kp[8], kp[6])
-    
-    # 7. left_wrist_left_elbow_left_shoulder
-    feat7 = calculate_angle_2d(kp[9], kp[7], kp[5])
-    
-    features = pd.DataFrame([{
-        'right_elbow_right_shoulder_right_hip': feat1,
-        'left_elbow_left_shoulder_left_hip': feat2,
-        'right_knee_mid_hip_left_knee': feat3,
-        'right_hip_right_knee_right_ankle': feat4,
-        'left_hip_left_knee_left_ankle': feat5,
-        'right_wrist_right_elbow_right_shoulder': feat6,
-        'left_wrist_left_elbow_left_shoulder': feat7
-    }])
-    
-    return features
+    return pose_features(keypoints)
+
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Astraa Tracker with exercise classifier")
+    add_source_args(parser)
+    add_engine_args(parser)
+    add_metrics_args(parser)
+    add_startup_args(parser)
+    add_recording_args(parser)
+    add_adaptive_args(parser)
+    add_classifier_args(parser)
+    add_process_args(parser)
+    args = parser.parse_args()
+    check_classifier_args(parser, args)
+    check_adaptive_args(parser, args)
+    check_process_args(parser, args)
+    return args
 
 def main():
+    args = parse_args()
+    configure_metrics(args)
+    startup.mark("imports")
     print("--- PROJECT: GAMIFIED POSE TRACKER (W/ CLASSIFIER) ---")
     print(f"Loading Classifier: {CLASSIFIER_MODEL}...")
+    # Classifier and pose model load concurrently (torch/ultralytics imports
+    # and checkpoint loading dominate, the classifier hides behind them)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        # Compiled forest if train_model.py exported one, else the sklearn pickle
+        clf_future = pool.submit(startup.timed("load_classifier", load_classifier), CLASSIFIER_MODEL)
+        # With --workers, every inference process loads its own pose model
+        engine_future = None if args.workers else pool.submit(startup.timed("load_pose_model", build_engine), args)
     try:
-        clf = joblib.load(CLASSIFIER_MODEL)
+        clf = clf_future.result()
         print("Classifier loaded successfully.")
     except Exception as e:
         print(f"Could not load classifier: {e}")
         return
 
-    try:
-        engine = PoseEngine(model_path="yolo26n-pose.pt", device=0)
-    except Exception as e:
-        print("CRITICAL ERROR: Could not load PoseEngineModel.")
-        return
+    engine = None
+    if engine_future is not None:
+        try:
+            engine = engine_future.result()
+        except Exception as e:
+            print("CRITICAL ERROR: Could not load PoseEngineModel.")
+            return
 
-    # Initialize Games for each supported exercise
-    # These persist reps/score across the session
-    games = {
-        'squats': ClassifierExercise('squats'),
-        'pushups': ClassifierExercise('pushups'),
-        'jumping_jacks': ClassifierExercise('jumping_jacks'),
-        'pullups': ClassifierExercise('pullups'),
-        'situp': ClassifierExercise('situp')
-    }
-    
-    # active_game will point to one of the instances in 'games'
-    active_game = None 
-    active_exercise_name = "None"
-    
-    # Open Webcam
-    cap = cv2.VideoCapture(0)
-    if not cap.isOpened():
-        print("Error: Camera not found.")
-        return
+    if not args.no_warmup:
+        # Pay the first-inference cost now, before the camera is open
+        with startup.phase("warmup"):
+            if engine is not None:
+                engine.warmup()
+            clf.classify(np.zeros((1, len(ANGLE_COLUMNS))))
+
+    # Skip the model for players holding a pose and for poses seen before
+    clf = gated_classifier(clf, args)
+
+    # One ClassifierPlayer per tracked person, so predictions from different
+    # bodies never feed the same rep state machine. Their games share one
+    # bank, advanced for everyone in a single update
+    tracker = PoseTracker()
+    bank = ExerciseBank()
+    players = PlayerGames(lambda: ClassifierPlayer(args.feature_window, args.feature_alpha, bank=bank))
+    frame_index = 0
+    
+    # Open Webcam (with --workers, the capture process does)
+    source = None
+    if not args.workers:
+        with startup.phase("open_camera"):
+            source = open_source(args)
+        if not source.is_opened():
+            print("Error: Camera not found.")
+            return
 
+    recorder = open_recorder(args)
+    controller = open_controller(args, engine)
     print("Starting Main Loop. Press 'q' to quit.")
-    
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
 
+    # Inference stage (worker thread): pose, tracking, classifier and game logic.
+    # Returns a snapshot for the render stage.
+    def process(frame):
         # Inference
-        keypoints = engine.get_keypoints(frame)
-        
-        # If person detected
-        if keypoints is not None:
-            # 1. Visualize Skeleton
-            visuals.draw_skeleton(frame, keypoints, is_correct=True)
-            
-            # 2. Key Logic
+        return handle(engine.get_all_keypoints(frame))
+
+    # Tracking, classifier and game logic for one frame's detections
+    def handle(people):
+        nonlocal frame_index
+        if recorder is not None:
+            recorder.write(people)
+        visible = tracker.update(people)
+        players.sync(visible, tracker.expired)
+        clf.forget(tracker.expired)
+
+        # 2. Key Logic, batched over every player in view: features every
+        # frame into each player's window, the classifier every N frames
+        if visible:
             try:
-                # A. Extract Features
-                feats = extract_features(keypoints)
-                
-                # B. Predict Exercise
-                pred_label = clf.predict(feats)[0] # e.g. "squats_down"
-                probs = clf.predict_proba(feats)[0]
-                confidence = np.max(probs)
-                
-                # C. Determine Exercise Type (e.g. "squats" from "squats_down")
-                exercise_type = pred_label.rsplit('_', 1)[0] # "squats_down" -> "squats"
-                
-                # D. Switch Game Mode if needed
-                # Only switch if high confidence and different from current
-                if confidence > 0.6:
-                    if exercise_type in games:
-                        active_game = games[exercise_type]
-                        active_exercise_name = exercise_type
-                
-                # E. Update Active Game
-                if active_game:
-                    active_game.update(pred_label, confidence)
-                    
-                    # F. Draw Game Overlay
-                    visuals.draw_overlay(frame, active_game)
-                    
-                    # Draw Active Exercise Label manually if not in overlay
-                    cv2.putText(frame, f"MODE: {active_exercise_name.upper()}", (20, 30), 
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 255), 2)
-                    
+                classify_players(clf, players, visible, classify=frame_index % args.classify_every == 0)
             except Exception as e:
                 # print(f"Logic Error: {e}")
                 pass
-            
-        else:
+            metrics.set_counter("classify_gate_skips", clf.gate_skips)
+            metrics.set_counter("classify_cache_hits", clf.cache_hits)
+            metrics.set_counter("classify_model_rows", clf.cache_misses)
+        frame_index += 1
+
+        startup.mark_first_frame()
+        return visible, tracker.primary_id()
+
+    # Render stage (main thread): draws the newest frame with the latest result
+    def render(frame, result):
+        if metrics.hud_visible:
+            visuals.draw_metrics_hud(frame, metrics.cached_snapshot())
+        if result is None:
+            return frame
+        visible, primary = result
+
+        # 1. Visualize Skeletons
+        for pid, keypoints in visible.items():
+            visuals.draw_skeleton(frame, keypoints, is_correct=True)
+            if len(visible) > 1:
+                visuals.draw_player_label(frame, keypoints, pid)
+
+        player = players.get(primary) if primary is not None else None
+        if player is not None:
+            if player.active_game:
+                # F. Draw Game Overlay
+                visuals.draw_overlay(frame, player.active_game)
+                
+                # Draw Active Exercise Label manually if not in overlay
+                cv2.putText(frame, f"MODE: {player.active_exercise_name.upper()}", (20, 30), 
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 255), 2)
+        elif not visible:
             cv2.putText(frame, "No Person Detected", (10, 50), 
                         cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+        return frame
 
-        # Show Frame
-        cv2.imshow("Astraa Tracker - Gamified", frame)
-        
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
+    # Show Frame
+    window_name = None if args.headless else "Astraa Tracker - Gamified"
+    if args.workers:
+        pipeline = ProcessPipeline(partial(open_source, args), partial(build_engine, args), handle, render,
+                                   workers=args.workers, warmup=not args.no_warmup, window_name=window_name,
+                                   max_frames=args.max_frames, on_key=metrics.handle_key)
+    else:
+        pipeline = Pipeline(source, process, render, window_name=window_name,
+                            max_frames=args.max_frames, on_key=metrics.handle_key,
+                            on_latency=controller.observe if controller else None)
+    pipeline.run()
+    if recorder is not None:
+        recorder.close()
 
-    cap.release()
-    cv2.destroyAllWindows()
+    if source is not None:
+        source.release()
+    metrics.close()
+    pipeline.print_report()
+    if controller is not None:
+        print(f"Adaptive quality: {controller.report()}")
+    if args.idle_after is not None: # Not allowed with --workers
+        print(f"Idle mode: {engine.idle_report()}")
+    print(f"Classifier gating: {clf.stats()}")
+    if args.startup_log:
+        startup.log(args.startup_log)
 
 if __name__ == "__main__":
     main()
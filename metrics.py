@@ -0,0 +1,250 @@
+import csv
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+class RollingHistogram:
+    """
+    Latency samples (milliseconds) for the last `window` events of one stage,
+    kept in a preallocated ring buffer.
+    """
+    def __init__(self, window=600):
+        self.samples = np.zeros(window, dtype=np.float64)
+        self.window = window
+        self.index = 0
+        self.total = 0 # All-time count
+
+    def record(self, ms):
+        self.samples[self.index] = ms
+        self.index = (self.index + 1) % self.window
+        self.total += 1
+
+    def values(self):
+        return self.samples[:min(self.total, self.window)]
+
+    def summary(self):
+        vals = self.values()
+        if len(vals) == 0:
+            return {'count': self.total, 'mean_ms': 0.0, 'p50_ms': 0.0, 'p99_ms': 0.0, 'max_ms': 0.0}
+        p50, p99 = np.percentile(vals, [50, 99])
+        return {
+            'count': self.total,
+            'mean_ms': round(float(vals.mean()), 3),
+            'p50_ms': round(float(p50), 3),
+            'p99_ms': round(float(p99), 3),
+            'max_ms': round(float(vals.max()), 3),
+        }
+
+
+class _NullTimer:
+    """Returned by Metrics.timer() while disabled: does nothing."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ('metrics', 'stage', 'start')
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.record(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class Metrics:
+    """
+    Per-stage latency registry.
+
+    Code reports into it with
+        with metrics.timer("pose"):
+            ...
+    or metrics.record(stage, seconds). While disabled, timer() hands back a
+    shared no-op object and record() returns immediately, so instrumented hot
+    paths cost one attribute check.
+    """
+    def __init__(self, window=600):
+        self.enabled = False
+        self.window = window
+        self.hud_visible = False
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._exporter = None
+        self._server = None
+        self._cached = None # (perf_counter time, snapshot) for the HUD
+
+    def enable(self, hud=False):
+        self.enabled = True
+        self.hud_visible = hud
+
+    def timer(self, stage):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, stage)
+
+    def record(self, stage, seconds):
+        if not self.enabled:
+            return
+        with self._lock:
+            hist = self._histograms.get(stage)
+            if hist is None:
+                hist = self._histograms[stage] = RollingHistogram(self.window)
+            hist.record(seconds * 1000.0)
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def set_counter(self, name, value):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = value
+
+    def snapshot(self):
+        """
+        {'stages': {stage: summary}, 'counters': {...}, 'time': unix seconds}
+        """
+        with self._lock:
+            stages = {name: hist.summary() for name, hist in self._histograms.items()}
+            counters = dict(self._counters)
+        return {'time': round(time.time(), 3), 'stages': stages, 'counters': counters}
+
+    def cached_snapshot(self, max_age=0.5):
+        """
+        snapshot(), recomputed at most every max_age seconds. Cheap enough to
+        call from the render loop every frame.
+        """
+        now = time.perf_counter()
+        if self._cached is None or now - self._cached[0] > max_age:
+            self._cached = (now, self.snapshot())
+        return self._cached[1]
+
+    def handle_key(self, key):
+        """Keyboard hook for the render loop: 'h' toggles the HUD."""
+        if key == ord('h'):
+            self.hud_visible = not self.hud_visible
+
+    # --- Export ---
+
+    def export(self, path):
+        """
+        Appends one snapshot to `path`: a CSV row per stage (.csv) or one JSON
+        line (anything else).
+        """
+        snap = self.snapshot()
+        if path.endswith('.csv'):
+            new_file = not os.path.exists(path)
+            with open(path, 'a', newline='') as f:
+                writer = csv.writer(f)
+                if new_file:
+                    writer.writerow(['time', 'stage', 'count', 'mean_ms', 'p50_ms', 'p99_ms', 'max_ms'])
+                for stage, s in snap['stages'].items():
+                    writer.writerow([snap['time'], stage, s['count'], s['mean_ms'], s['p50_ms'], s['p99_ms'], s['max_ms']])
+        else:
+            with open(path, 'a') as f:
+                f.write(json.dumps(snap) + "\n")
+
+    def start_exporter(self, path, interval=5.0):
+        """
+        Exports a snapshot every `interval` seconds on a daemon thread.
+        """
+        stop = threading.Event()
+
+        def loop():
+            while not stop.wait(interval):
+                try:
+                    self.export(path)
+                except OSError as e:
+                    print(f"[Metrics] Export failed: {e}")
+
+        thread = threading.Thread(target=loop, name="metrics-export", daemon=True)
+        thread.start()
+        self._exporter = (stop, thread, path)
+
+    def serve(self, port=9100, host='127.0.0.1'):
+        """
+        Serves the current snapshot as JSON at http://host:port/metrics.
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip('/') not in ('', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = json.dumps(registry.snapshot()).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass # Keep the console for the app
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+        print(f"[Metrics] Serving http://{host}:{port}/metrics")
+
+    def close(self):
+        """Stops background export/serving and writes a final snapshot."""
+        if self._exporter is not None:
+            stop, thread, path = self._exporter
+            stop.set()
+            thread.join(timeout=1.0)
+            self.export(path)
+            self._exporter = None
+        if self._server is not None:
+            self._server.shutdown()
+            self._server = None
+
+
+# Shared registry the whole app reports into
+metrics = Metrics()
+
+
+def add_metrics_args(parser):
+    parser.add_argument('--metrics', action='store_true',
+                        help="Enable per-stage latency instrumentation (press 'h' for the HUD)")
+    parser.add_argument('--metrics-export', default=None,
+                        help="Periodically append metrics to this .csv or .jsonl file")
+    parser.add_argument('--metrics-interval', type=float, default=5.0,
+                        help="Seconds between exports (default: 5)")
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help="Serve metrics JSON on http://127.0.0.1:PORT/metrics")
+
+
+def configure_metrics(args):
+    """
+    Enables the shared registry according to the parsed CLI args.
+    Any export or serving option implies --metrics.
+    """
+    if not (args.metrics or args.metrics_export or args.metrics_port):
+        return metrics
+    metrics.enable(hud=args.metrics)
+    if args.metrics_export:
+        metrics.start_exporter(args.metrics_export, args.metrics_interval)
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+    return metrics
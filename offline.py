@@ -0,0 +1,317 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+import numpy as np
+
+from forest import GatedClassifier
+from game_logic import BicepCurl, ClassifierPlayer, ExerciseBank, classify_players
+from rules import RuleExercise, RuleSet, exercise_rules
+from tracker import PoseTracker, PlayerGames
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.webm', '.m4v')
+
+
+class SessionScorer:
+    """
+    Headless game logic for a recorded session: tracks players and runs both
+    the BicepCurl rules and the classifier game for everyone in view.
+    Feed it one frame's detections at a time with step().
+
+    By default every frame's raw features are classified. With
+    smoothed=True and classify_every > 1 (and a GatedClassifier for clf) the
+    classifier game runs exactly like main_with_classifier.py's live loop.
+
+    rules: names of rule exercises (rules.EXERCISES) to also score every
+    player on; all of them advance in one RuleSet.update() per frame.
+    """
+    def __init__(self, clf=None, classify_every=1, smoothed=False, window=15, alpha=0.5, rules=()):
+        if clf is not None and not isinstance(clf, GatedClassifier):
+            clf = GatedClassifier(clf, delta=0, cache_size=0) # Pass-through
+        self.clf = clf
+        self.classify_every = classify_every
+        self.smoothed = smoothed
+        self.tracker = PoseTracker()
+        self.curls = ExerciseBank()
+        self.bicep = PlayerGames(lambda: BicepCurl(bank=self.curls))
+        self.games = ExerciseBank() # Every player's classifier games
+        self.classified = PlayerGames(lambda: ClassifierPlayer(window, alpha, bank=self.games))
+        self.rule_names = list(rules)
+        self.rules = RuleSet(exercise_rules(self.rule_names)) if self.rule_names else None
+        self.rule_bank = ExerciseBank()
+        self.ruled = PlayerGames(lambda: [RuleExercise(name, self.rules, bank=self.rule_bank)
+                                          for name in self.rule_names])
+        self.last_visible = {} # {player_id: (17, 3)} from the last step()
+        self._steps = 0
+
+    def step(self, frame_index, people):
+        """
+        Args:
+            frame_index (int): Frame number within the session.
+            people (np.ndarray): (N, 17, 3) detections for this frame.
+        Returns:
+            dict: JSON-serializable per-frame record, including rep events.
+        """
+        visible = self.tracker.update(people)
+        self.last_visible = visible
+        self.bicep.sync(visible, self.tracker.expired)
+        self.classified.sync(visible, self.tracker.expired)
+        self.ruled.sync(visible, self.tracker.expired)
+
+        # Every classifier game's reps before this frame, for rep events (the
+        # active game may switch during this step)
+        reps_before = {pid: {name: game.reps for name, game in self.classified.get(pid).games.items()}
+                       for pid in visible}
+        predictions = {}
+        if self.clf is not None:
+            self.clf.forget(self.tracker.expired)
+        if visible and self.clf is not None:
+            pids, labels, confidences = classify_players(
+                self.clf, self.classified, visible,
+                classify=self._steps % self.classify_every == 0, smoothed=self.smoothed)
+            predictions = {pid: (label, conf) for pid, label, conf in zip(pids, labels, confidences)}
+        self._steps += 1
+
+        # Every player's curl state machine in one call
+        curl_slots = [self.bicep.get(pid).slot for pid in visible]
+        curl_reps = self.curls.reps[curl_slots]
+        if visible:
+            poses = np.stack(list(visible.values()))
+            self.curls.update_curls(curl_slots, poses)
+
+        # ... and every player's rule exercises in another, sharing each pose's angles
+        rule_slots = [game.slot for pid in visible for game in self.ruled.get(pid)]
+        rule_reps = self.rule_bank.reps[rule_slots]
+        if rule_slots:
+            self.rules.update(self.rule_bank, rule_slots, poses,
+                         poses=np.repeat(np.arange(len(visible)), len(self.rule_names)))
+        rule_reps = iter(rule_reps)
+
+        players = []
+        events = []
+        for pid, before in zip(visible, curl_reps):
+            curl = self.bicep.get(pid)
+            if curl.reps > before:
+                events.append({'player': pid, 'type': 'rep', 'exercise': 'bicep_curl', 'reps': curl.reps})
+
+            record = {
+                'id': pid,
+                'bicep': {
+                    'reps': curl.reps,
+                    'score': curl.score,
+                    'state': curl.state,
+                    'feedback': curl.feedback,
+                    'energy': round(float(curl.energy), 2),
+                    'angle': round(float(curl.current_angle), 2),
+                },
+            }
+            if self.rule_names:
+                record['rules'] = {}
+                for game, before in zip(self.ruled.get(pid), rule_reps):
+                    if game.reps > before:
+                        events.append({'player': pid, 'type': 'rep', 'exercise': game.exercise_name,
+                                       'reps': game.reps})
+                    record['rules'][game.exercise_name] = {
+                        'reps': game.reps,
+                        'score': game.score,
+                        'state': game.state,
+                        'feedback': game.feedback,
+                        'energy': round(float(game.energy), 2),
+                    }
+
+            if pid in predictions:
+                label, conf = predictions[pid]
+                player = self.classified.get(pid)
+                game = player.active_game
+                if game is not None and game.reps > reps_before[pid][player.active_exercise_name]:
+                    events.append({'player': pid, 'type': 'rep', 'exercise': player.active_exercise_name,
+                                   'reps': game.reps})
+                record['prediction'] = str(label)
+                record['confidence'] = round(float(conf), 4)
+                record['exercise'] = player.active_exercise_name
+                record['exercise_reps'] = game.reps if game else 0
+
+            players.append(record)
+
+        return {'frame': frame_index, 'players': players, 'events': events}
+
+
+def find_videos(paths):
+    """
+    Expands files and directories (recursively) into a sorted list of
+    (video path, output name). The name is the video's path relative to the
+    directory it was found in (or its file name), without the extension, so
+    a/day1/set.mp4 and a/day2/set.mp4 get separate outputs.
+    """
+    videos = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for f in files:
+                    if f.lower().endswith(VIDEO_EXTENSIONS):
+                        video = os.path.join(root, f)
+                        videos.append((video, os.path.splitext(os.path.relpath(video, path))[0]))
+        elif os.path.isfile(path):
+            videos.append((path, os.path.splitext(os.path.basename(path))[0]))
+        else:
+            print(f"[Offline] Skipping missing path: {path}")
+    return sorted(videos)
+
+
+def video_info(path):
+    cap = cv2.VideoCapture(path)
+    fps = max(cap.get(cv2.CAP_PROP_FPS) or 0.0, 0.0)
+    frames = max(int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0), 0)
+    cap.release()
+    return fps, frames
+
+
+# Per-process state, built once by _init_worker
+_ENGINE = None
+_CLF = None
+_IMGSZ = None
+
+
+def _init_worker(model_path, classifier_path, imgsz, threads):
+    global _ENGINE, _CLF, _IMGSZ
+    import torch
+    from pose_engine import PoseEngine
+    from forest import load_classifier
+
+    # Split the cores between workers instead of every worker grabbing all of them
+    if threads:
+        torch.set_num_threads(threads)
+    cv2.setNumThreads(1)
+
+    _ENGINE = PoseEngine(model_path=model_path, device=0)
+    _IMGSZ = imgsz
+    _CLF = None
+    if classifier_path:
+        try:
+            _CLF = load_classifier(classifier_path)
+        except Exception as e:
+            print(f"[Offline] Classifier unavailable ({e}), scoring bicep curls only")
+
+
+def process_video(path, out_dir, name=None):
+    """
+    Scores one video. Writes <name>.jsonl (one record per frame) and
+    <name>.npz (keypoints, frame index and player ID per detection) under
+    out_dir, name defaulting to the video's file name without extension.
+    Returns a summary dict.
+    """
+    if name is None:
+        name = os.path.splitext(os.path.basename(path))[0]
+    jsonl_path = os.path.join(out_dir, f"{name}.jsonl")
+    npz_path = os.path.join(out_dir, f"{name}.npz")
+    os.makedirs(os.path.dirname(jsonl_path), exist_ok=True)
+
+    scorer = SessionScorer(_CLF)
+    kp_rows, frame_rows, id_rows = [], [], []
+    n_frames = 0
+    n_events = 0
+
+    t0 = time.perf_counter()
+    with open(jsonl_path, 'w') as out:
+        for frame_index, people in enumerate(_ENGINE.stream_keypoints(path, imgsz=_IMGSZ)):
+            record = scorer.step(frame_index, people)
+            out.write(json.dumps(record) + "\n")
+            n_frames += 1
+            n_events += len(record['events'])
+
+            for player in record['players']:
+                kp_rows.append(scorer.last_visible[player['id']])
+                frame_rows.append(frame_index)
+                id_rows.append(player['id'])
+    elapsed = time.perf_counter() - t0
+
+    np.savez(npz_path,
+             keypoints=np.array(kp_rows, dtype=np.float32).reshape(-1, 17, 3),
+             frame=np.array(frame_rows, dtype=np.int64),
+             player_id=np.array(id_rows, dtype=np.int64))
+
+    fps, _ = video_info(path)
+    video_seconds = n_frames / fps if fps else 0.0
+    return {
+        'video': path,
+        'frames': n_frames,
+        'rep_events': n_events,
+        'seconds': round(elapsed, 3),
+        'fps': round(n_frames / elapsed, 2) if elapsed > 0 else 0.0,
+        'realtime_factor': round(video_seconds / elapsed, 2) if elapsed > 0 else 0.0,
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Headless batch scoring of recorded sessions")
+    parser.add_argument('paths', nargs='+', help="Video files or directories")
+    parser.add_argument('--out', default='offline_results', help="Output directory")
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="Number of worker processes")
+    parser.add_argument('--threads', type=int, default=None,
+                        help="Torch threads per worker (default: cores / workers)")
+    parser.add_argument('--model', default="yolo26n-pose.pt", help="Pose model checkpoint")
+    parser.add_argument('--imgsz', type=int, default=None, help="Inference size")
+    parser.add_argument('--classifier', default='exercise_classifier.pkl',
+                        help="Exercise classifier ('' to disable)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    videos = find_videos(args.paths)
+    if not videos:
+        print("No videos found.")
+        sys.exit(1)
+    # Two inputs writing the same output files would overwrite (or, in the
+    # pool, race on) each other
+    seen = {}
+    for path, name in videos:
+        if name in seen:
+            print(f"[Offline] {path} and {seen[name]} would both write {name}.jsonl, "
+                  f"pass them in separate runs or directories")
+            sys.exit(1)
+        seen[name] = path
+    os.makedirs(args.out, exist_ok=True)
+
+    workers = max(1, min(args.workers, len(videos)))
+    threads = args.threads or max(1, (os.cpu_count() or 1) // workers)
+    print(f"[Offline] {len(videos)} videos, {workers} workers x {threads} threads -> {args.out}")
+    init_args = (args.model, args.classifier, args.imgsz, threads)
+
+    t0 = time.perf_counter()
+    summaries = []
+    if workers == 1:
+        _init_worker(*init_args)
+        for path, name in videos:
+            summary = process_video(path, args.out, name)
+            summaries.append(summary)
+            print(f"  {summary['video']}: {summary['frames']} frames, {summary['fps']} fps, "
+                  f"{summary['realtime_factor']}x realtime, {summary['rep_events']} reps")
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=init_args) as pool:
+            futures = {pool.submit(process_video, path, args.out, name): path for path, name in videos}
+            for future in as_completed(futures):
+                try:
+                    summary = future.result()
+                except Exception as e:
+                    print(f"  {futures[future]}: FAILED ({e})")
+                    continue
+                summaries.append(summary)
+                print(f"  {summary['video']}: {summary['frames']} frames, {summary['fps']} fps, "
+                      f"{summary['realtime_factor']}x realtime, {summary['rep_events']} reps")
+    elapsed = time.perf_counter() - t0
+
+    total_frames = sum(s['frames'] for s in summaries)
+    print(f"[Offline] Done: {total_frames} frames in {elapsed:.1f}s "
+          f"({total_frames / elapsed if elapsed > 0 else 0:.1f} fps overall)")
+    with open(os.path.join(args.out, 'summary.json'), 'w') as f:
+        json.dump({'videos': summaries, 'seconds': round(elapsed, 3), 'frames': total_frames}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
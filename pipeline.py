@@ -0,0 +1,358 @@
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+from metrics import metrics
+
+
+class LatestQueue:
+    """
+    Bounded "latest-frame-wins" queue.
+    When full, putting a new item silently evicts the oldest one and counts it
+    as dropped, so consumers always see the freshest data instead of a backlog.
+    """
+    def __init__(self, maxsize=1):
+        self._items = deque()
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """
+        Blocks until an item is available.
+        Returns None on timeout or once the queue is closed and drained.
+        """
+        with self._cond:
+            if not self._items and not self._closed:
+                self._cond.wait(timeout)
+            if self._items:
+                return self._items.popleft()
+            return None
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed
+
+
+class StageStats:
+    """
+    Throughput counter for one pipeline stage.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.busy = 0.0 # Seconds spent doing actual work
+        self.start = None
+        self.end = None
+        self._last = None
+        self._rate = 0.0 # Smoothed instantaneous rate (for on-screen display)
+
+    def record(self, duration):
+        now = time.perf_counter()
+        if self.start is None:
+            self.start = now
+        if self._last is not None:
+            dt = now - self._last
+            if dt > 0:
+                self._rate = 0.9 * self._rate + 0.1 * (1.0 / dt) if self._rate else 1.0 / dt
+        self._last = now
+        self.end = now
+        self.count += 1
+        self.busy += duration
+        metrics.record(self.name, duration)
+
+    @property
+    def fps(self):
+        """Average throughput over the whole run."""
+        if self.start is None or self.end is None or self.end <= self.start:
+            return 0.0
+        return (self.count - 1) / (self.end - self.start)
+
+    @property
+    def rate(self):
+        """Smoothed recent throughput."""
+        return self._rate
+
+    @property
+    def mean_ms(self):
+        return 1000.0 * self.busy / self.count if self.count else 0.0
+
+
+class CameraSource:
+    """
+    Frame source backed by cv2.VideoCapture (webcam index or video file path).
+    """
+    def __init__(self, src=0, width=None, height=None, flip=False, realtime=False):
+        self.src = src
+        self.flip = flip
+        # Webcams block on read() at their own rate; files are read as fast as
+        # possible unless realtime pacing is requested.
+        self.is_live = isinstance(src, int)
+        self.cap = cv2.VideoCapture(src)
+        if width:
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        if height:
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+
+        self.frame_interval = 0.0
+        if realtime and not self.is_live:
+            fps = self.cap.get(cv2.CAP_PROP_FPS)
+            if fps and fps > 0:
+                self.frame_interval = 1.0 / fps
+        self._next_time = None
+
+    def is_opened(self):
+        return self.cap.isOpened()
+
+    def read(self):
+        """
+        Returns (ok, frame). ok=False with frame=None means end of stream for
+        files; for live cameras it is a transient failure.
+        """
+        if self.frame_interval:
+            now = time.perf_counter()
+            if self._next_time is not None and now < self._next_time:
+                time.sleep(self._next_time - now)
+            self._next_time = max(now, self._next_time or now) + self.frame_interval
+
+        ret, frame = self.cap.read()
+        if not ret:
+            return False, None
+        if self.flip:
+            frame = cv2.flip(frame, 1)
+        return True, frame
+
+    def release(self):
+        self.cap.release()
+
+
+class SyntheticSource:
+    """
+    Deterministic synthetic frame source for headless runs and benchmarks.
+    Produces a moving gradient so consecutive frames differ.
+    """
+    def __init__(self, width=1280, height=720, count=300, fps=None):
+        self.width = width
+        self.height = height
+        self.count = count
+        self.is_live = False
+        self.frame_interval = 1.0 / fps if fps else 0.0
+        self._index = 0
+        self._base = np.tile(np.arange(width, dtype=np.uint8), (height, 1))
+
+    def is_opened(self):
+        return True
+
+    def read(self):
+        if self.count is not None and self._index >= self.count:
+            return False, None
+        if self.frame_interval:
+            time.sleep(self.frame_interval)
+        shifted = np.roll(self._base, self._index * 4, axis=1)
+        frame = np.dstack([shifted, shifted, shifted])
+        self._index += 1
+        return True, frame
+
+    def release(self):
+        pass
+
+
+def add_source_args(parser):
+    """
+    Registers the frame-source / runtime CLI flags shared by the main scripts.
+    """
+    parser.add_argument('--source', default='0',
+                        help="Webcam index, video file path, or 'synthetic' (default: 0)")
+    parser.add_argument('--headless', action='store_true',
+                        help="Run without opening a display window")
+    parser.add_argument('--max-frames', type=int, default=None,
+                        help="Stop after this many captured frames")
+    parser.add_argument('--realtime', action='store_true',
+                        help="Pace video files at their native FPS instead of reading flat out")
+
+
+def open_source(args, width=None, height=None, flip=False):
+    """
+    Builds a frame source from the parsed CLI args.
+    """
+    if args.source == 'synthetic':
+        return SyntheticSource(width or 1280, height or 720, count=args.max_frames or 300)
+    src = int(args.source) if args.source.isdigit() else args.source
+    # Mirror only the live webcam, recorded footage is already the right way round
+    return CameraSource(src, width=width, height=height,
+                        flip=flip and isinstance(src, int), realtime=args.realtime)
+
+
+class Pipeline:
+    """
+    Three-stage runtime: capture -> inference -> render.
+
+    Capture and inference run on worker threads connected by latest-frame-wins
+    queues, so inference always works on the freshest frame and never lets the
+    camera buffer fill up with stale ones. Render runs on the calling thread
+    (cv2.imshow must stay on the main thread) at camera rate, drawing each
+    captured frame with the most recent inference result.
+
+    process(frame) -> result        called on the inference thread
+    render(frame, result) -> frame  called on the render thread, result may be None
+    on_key(key)                     called with every key pressed in the window but 'q'
+    on_latency(seconds)             called on the inference thread after every process()
+    """
+    def __init__(self, source, process, render=None, window_name=None, max_frames=None, on_key=None,
+                 on_latency=None):
+        self.source = source
+        self.process = process
+        self.render = render
+        self.on_key = on_key
+        self.on_latency = on_latency
+        self.window_name = window_name
+        self.max_frames = max_frames
+
+        self.infer_queue = LatestQueue(maxsize=1)
+        self.display_queue = LatestQueue(maxsize=1)
+
+        self.capture_stats = StageStats("capture")
+        self.infer_stats = StageStats("inference")
+        self.render_stats = StageStats("render")
+
+        self._stop = threading.Event()
+        self._latest = None # (seq, result) of the newest inference output
+        self._latest_lock = threading.Lock()
+        self._threads = []
+
+    def stop(self):
+        self._stop.set()
+
+    @property
+    def latest(self):
+        with self._latest_lock:
+            return self._latest
+
+    def _capture_loop(self):
+        seq = 0
+        try:
+            while not self._stop.is_set():
+                t0 = time.perf_counter()
+                ok, frame = self.source.read()
+                if not ok:
+                    if getattr(self.source, 'is_live', False):
+                        print("Error: Failed to grab frame.")
+                        time.sleep(1)
+                        continue
+                    break # End of file / synthetic stream
+                self.capture_stats.record(time.perf_counter() - t0)
+                self.infer_queue.put((seq, frame))
+                self.display_queue.put((seq, frame))
+                seq += 1
+                if self.max_frames is not None and seq >= self.max_frames:
+                    break
+        finally:
+            self.infer_queue.close()
+
+    def _inference_loop(self):
+        try:
+            while not self._stop.is_set():
+                item = self.infer_queue.get(timeout=0.1)
+                if item is None:
+                    if self.infer_queue.closed:
+                        break
+                    continue
+                seq, frame = item
+                t0 = time.perf_counter()
+                result = self.process(frame)
+                elapsed = time.perf_counter() - t0
+                self.infer_stats.record(elapsed)
+                if self.on_latency is not None:
+                    self.on_latency(elapsed)
+                with self._latest_lock:
+                    self._latest = (seq, result)
+        finally:
+            # Render drains whatever is left, then stops
+            self.display_queue.close()
+
+    def run(self):
+        """
+        Runs until the source is exhausted, stop() is called, or 'q' is pressed.
+        Returns the report dict.
+        """
+        self._threads = [
+            threading.Thread(target=self._capture_loop, name="capture", daemon=True),
+            threading.Thread(target=self._inference_loop, name="inference", daemon=True),
+        ]
+        for t in self._threads:
+            t.start()
+
+        try:
+            while not self._stop.is_set():
+                item = self.display_queue.get(timeout=0.1)
+                if item is None:
+                    if self.display_queue.closed:
+                        break
+                    continue
+                _, frame = item
+                latest = self.latest
+                result = latest[1] if latest is not None else None
+
+                t0 = time.perf_counter()
+                if self.render is not None:
+                    # Drawing needs a private copy: inference may still be
+                    # reading this very array
+                    frame = self.render(frame.copy(), result)
+                self.render_stats.record(time.perf_counter() - t0)
+                metrics.set_counter("dropped_inference", self.infer_queue.dropped)
+                metrics.set_counter("dropped_render", self.display_queue.dropped)
+
+                if self.window_name:
+                    cv2.imshow(self.window_name, frame)
+                    key = cv2.waitKey(1) & 0xFF
+                    if key == ord('q'):
+                        break
+                    if key != 0xFF and self.on_key is not None:
+                        self.on_key(key)
+        finally:
+            self._stop.set()
+            for t in self._threads:
+                t.join(timeout=2.0)
+            if self.window_name:
+                cv2.destroyAllWindows()
+
+        return self.report()
+
+    def report(self):
+        """
+        Per-stage throughput and dropped-frame counts.
+        """
+        report = {}
+        for stats in (self.capture_stats, self.infer_stats, self.render_stats):
+            report[stats.name] = {
+                'frames': stats.count,
+                'fps': round(stats.fps, 2),
+                'mean_ms': round(stats.mean_ms, 3),
+            }
+        report['inference']['dropped'] = self.infer_queue.dropped
+        report['render']['dropped'] = self.display_queue.dropped
+        return report
+
+    def print_report(self):
+        print("--- Pipeline Report ---")
+        for name, stats in self.report().items():
+            dropped = f", dropped {stats['dropped']}" if 'dropped' in stats else ""
+            print(f"  {name:<10} {stats['frames']:>6} frames  {stats['fps']:>7.2f} fps  "
+                  f"{stats['mean_ms']:>8.3f} ms/frame{dropped}")
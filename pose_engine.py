@@ -1,16 +1,48 @@
-import torch
 import numpy as np
-from ultralytics import YOLO
+
+from metrics import metrics
+
+# torch and ultralytics take seconds to import, so they are imported inside
+# the methods that need them; importing this module stays cheap.
+
+NUM_KEYPOINTS = 17
+
+def _empty_keypoints():
+    return np.zeros((0, NUM_KEYPOINTS, 3), dtype=np.float32)
 
 class PoseEngine:
     """
     Wrapper class for YOLO26-Pose loading and inference.
+
+    backend selects the runtime: 'torch' (the .pt checkpoint) or an exported
+    'onnx' / 'openvino' / 'torchscript' model, built once and cached by
+    backends.export_cached(). precision ('fp32', 'fp16', 'int8') applies to
+    exported backends. Output format is identical for every backend.
     """
-    def __init__(self, model_path="yolo26n-pose.pt", device=0):
+    def __init__(self, model_path="yolo26n-pose.pt", device=0, imgsz=None, backend='torch', precision='fp32'):
+        import torch
+        from ultralytics import YOLO
+
+        # Inference input size, None = ultralytics default (640)
+        self.imgsz = imgsz
+        self.model_path = model_path
+        self.backend = backend
+        self.precision = precision
+        self.artifact = None       # Exported model in use (non-torch backends)
+        self.exported_now = False  # True if the artifact was created by this instance
+        self.fixed_imgsz = False   # Static-shape exports only accept their export size
         self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
         # If user insisted on a specific device index:
         if isinstance(device, int) and 'cuda' in self.device:
             self.device = f'cuda:{device}'
+
+        if backend != 'torch':
+            try:
+                self._load_exported()
+                return
+            except Exception as e:
+                print(f"[PoseEngine] {backend} backend unavailable ({e}), falling back to PyTorch.")
+                self.backend = 'torch'
         
         print(f"[PoseEngine] Loading {model_path} on {self.device}...")
         try:
@@ -21,6 +53,23 @@ class PoseEngine:
             print("Please ensure 'yolo26n-pose.pt' exists or use a standard YOLOv8 pose model like 'yolov8n-pose.pt'.")
             raise e
 
+    def _load_exported(self):
+        from ultralytics import YOLO
+        import backends
+        if self.backend not in backends.BACKENDS:
+            raise ValueError(f"unknown backend '{self.backend}'")
+        if not backends.backend_available(self.backend):
+            raise ImportError(f"{backends.BACKENDS[self.backend]['module']} is not installed")
+
+        self.imgsz = self.imgsz or 640
+        self.artifact, self.exported_now = backends.export_cached(
+            self.model_path, self.backend, self.imgsz, self.precision)
+        self.fixed_imgsz = not backends.BACKENDS[self.backend]['dynamic']
+        # Exported CPU runtimes manage their own device
+        self.device = 'cpu'
+        print(f"[PoseEngine] Loading {self.artifact} ({self.backend}, {self.precision})...")
+        self.model = YOLO(self.artifact, task='pose')
+
     def get_keypoints(self, frame):
         """
         Runs inference on the frame and returns keypoints for the primary person.
@@ -32,7 +81,8 @@ class PoseEngine:
         """
         # Run inference
         # verbose=False for speed
-        results = self.model(frame, verbose=False, stream=False)
+        with metrics.timer("pose"):
+            results = self.model(frame, verbose=False, stream=False, **self._predict_kwargs())
         
         if not results:
             return None
@@ -51,3 +101,161 @@ class PoseEngine:
                 return kp
         
         return None
+
+    def _predict_kwargs(self, imgsz=None):
+        imgsz = self.imgsz if self.fixed_imgsz else (imgsz or self.imgsz)
+        return {'imgsz': imgsz} if imgsz else {}
+
+    def warmup(self, shape=(720, 1280, 3), runs=2, imgsz=None):
+        """
+        Runs inference on a blank frame so the first real frame doesn't pay
+        for lazy initialisation (graph build, allocator growth, thread pools).
+        """
+        dummy = np.zeros(shape, dtype=np.uint8)
+        for _ in range(runs):
+            self.get_keypoints_batch([dummy], imgsz=imgsz)
+
+    def get_keypoints_batch(self, frames, imgsz=None):
+        """
+        Runs a single batched forward pass over several frames (e.g. one frame
+        from each camera stream, or a buffered chunk of one stream).
+        Args:
+            frames (list[np.ndarray]): BGR frames. They may differ in size,
+                                       ultralytics letterboxes each one.
+            imgsz (int): Optional inference size override for this call.
+        Returns:
+            list[np.ndarray]: One array per input frame, shape (N_people, 17, 3)
+                              in that frame's pixel coordinates. N_people is 0
+                              when nobody was detected.
+        """
+        if len(frames) == 0:
+            return []
+
+        with metrics.timer("pose"):
+            results = self.model(list(frames), verbose=False, stream=False, **self._predict_kwargs(imgsz))
+
+        # Gather every detection tensor, then do ONE device->host copy for the
+        # whole batch instead of a .cpu().numpy() round trip per frame.
+        tensors = []
+        counts = []
+        for result in results:
+            kps = result.keypoints
+            if kps is not None and kps.data is not None and kps.data.shape[0] > 0 and kps.data.shape[1] > 0:
+                tensors.append(kps.data)
+                counts.append(kps.data.shape[0])
+            else:
+                counts.append(0)
+
+        if not tensors:
+            return [_empty_keypoints() for _ in frames]
+
+        import torch
+        stacked = torch.cat(tensors, dim=0).cpu().numpy()
+        return np.split(stacked, np.cumsum(counts)[:-1])
+
+    def get_all_keypoints(self, frame, imgsz=None):
+        """
+        Returns keypoints for every detected person in the frame.
+        Returns:
+            np.ndarray: Shape (N_people, 17, 3), N_people may be 0.
+        """
+        return self.get_keypoints_batch([frame], imgsz=imgsz)[0]
+
+    def stream_keypoints(self, source, imgsz=None):
+        """
+        Runs the model over a whole video (file path, directory, glob...) using
+        ultralytics' stream=True generator, so results are produced and
+        released one frame at a time instead of being materialized up front.
+        Yields:
+            np.ndarray: (N_people, 17, 3) per frame, in order.
+        """
+        for result in self.model(source, verbose=False, stream=True, **self._predict_kwargs(imgsz)):
+            kps = result.keypoints
+            if kps is not None and kps.data is not None and kps.data.shape[0] > 0 and kps.data.shape[1] > 0:
+                yield kps.data.cpu().numpy()
+            else:
+                yield _empty_keypoints()
+
+
+def add_engine_args(parser):
+    """
+    Registers the pose-engine CLI flags shared by the main scripts.
+    """
+    parser.add_argument('--model', default="yolo26n-pose.pt",
+                        help="Pose model checkpoint (default: yolo26n-pose.pt)")
+    parser.add_argument('--backend', default='torch', choices=['torch', 'onnx', 'openvino', 'torchscript'],
+                        help="Inference runtime; non-torch backends are exported once and cached")
+    parser.add_argument('--precision', default='fp32', choices=['fp32', 'fp16', 'int8'],
+                        help="Precision for exported backends (default: fp32)")
+    parser.add_argument('--imgsz', type=int, default=None,
+                        help="Inference input size (default: model default, 640)")
+    parser.add_argument('--check-backend', action='store_true',
+                        help="Compare the selected backend's keypoints against PyTorch at startup")
+    parser.add_argument('--keyframe-interval', type=int, default=1,
+                        help="Run the full model every N frames and propagate keypoints "
+                             "with optical flow in between (1 = every frame)")
+    parser.add_argument('--roi', action='store_true',
+                        help="Single-player ROI mode: infer on a crop around the player")
+    parser.add_argument('--roi-imgsz', type=int, default=320,
+                        help="Inference size used on the ROI crop (default: 320)")
+    parser.add_argument('--idle-after', type=float, default=None, metavar='SECONDS',
+                        help="Go idle after this long without a player: skip the model and poll "
+                             "for motion on downscaled frames until someone shows up")
+    parser.add_argument('--idle-fps', type=float, default=10.0,
+                        help="Motion polls per second while idle (default: 10)")
+    parser.add_argument('--idle-motion', type=float, default=0.01,
+                        help="Fraction of changed pixels that wakes full inference (default: 0.01)")
+
+
+def build_engine(args):
+    """
+    Builds the PoseEngine described by the parsed CLI args, wrapped with the
+    requested speed-ups. Raises if the model cannot be loaded.
+    """
+    from startup import configure_threads
+    configure_threads(getattr(args, 'threads', None))
+    engine = PoseEngine(model_path=args.model, device=0, imgsz=args.imgsz,
+                        backend=args.backend, precision=args.precision)
+    if engine.backend != 'torch':
+        check_backend(engine, force=args.check_backend)
+    if getattr(args, 'target_fps', None) is not None:
+        # Every variant the quality controller may switch to, loaded now
+        from adaptive import AdaptiveEngine, adaptive_models
+        engines = {}
+        for model in adaptive_models(args):
+            engines[model] = engine if model == args.model else PoseEngine(
+                model_path=model, device=0, imgsz=args.imgsz, backend=args.backend, precision=args.precision)
+        engine = AdaptiveEngine(engines)
+    if args.roi:
+        from roi import RoiEngine
+        print(f"[PoseEngine] ROI mode: cropped inference at imgsz={args.roi_imgsz}")
+        engine = RoiEngine(engine, crop_imgsz=args.roi_imgsz)
+    # Keyframes wrap ROI, so the keyframes themselves use cropped inference
+    if args.keyframe_interval > 1:
+        from keyframe import KeyframeEngine
+        print(f"[PoseEngine] Keyframe mode: full inference every {args.keyframe_interval} frames")
+        engine = KeyframeEngine(engine, max_interval=args.keyframe_interval)
+    # Outermost: while idle nothing below runs at all
+    if getattr(args, 'idle_after', None) is not None:
+        from idle import IdleEngine
+        print(f"[PoseEngine] Idle mode after {args.idle_after:g}s without a player "
+              f"(motion polls at {args.idle_fps:g} fps)")
+        engine = IdleEngine(engine, idle_after=args.idle_after, poll_fps=args.idle_fps,
+                            motion_ratio=args.idle_motion)
+    return engine
+
+
+def check_backend(engine, force=False, frames=None):
+    """
+    Accuracy check of an exported-backend engine against the PyTorch model.
+    Runs when the artifact was just exported (or force=True) and stores the
+    result next to the artifact; later starts just report the stored result.
+    """
+    import backends
+    result = None if force or engine.exported_now else backends.load_check(engine.artifact)
+    if result is None:
+        reference = PoseEngine(model_path=engine.model_path, device=0, imgsz=engine.imgsz)
+        result = backends.check_accuracy(engine, reference, frames)
+        backends.save_check(engine.artifact, result)
+    backends.report_check(engine.backend, result)
+    return result
@@ -0,0 +1,145 @@
+import os
+import struct
+import time
+
+import numpy as np
+
+NUM_KEYPOINTS = 17
+
+# File layout: a 64-byte header followed by fixed-size little-endian records,
+# one per detection. A frame with nobody in view still gets one record
+# (person = -1, count = 0) so replays see the same frame sequence. Records are
+# only ever appended, so a file cut short by a crash loses at most the last
+# partial record.
+MAGIC = b'ASTRAREC'
+VERSION = 1
+HEADER = struct.Struct('<8sIIId32x') # magic, version, record size, keypoints, created (unix s)
+RECORD_DTYPE = np.dtype([
+    ('t', '<f8'),       # Seconds since recording start
+    ('frame', '<u4'),   # Processed-frame index
+    ('person', '<i2'),  # Detection index within the frame, -1 for an empty frame
+    ('count', '<u2'),   # Detections in this frame
+    ('kp', '<f4', (NUM_KEYPOINTS, 3)),
+])
+
+
+class Recorder:
+    """
+    Appends each processed frame's raw detections (the PoseEngine output,
+    before tracking) with a timestamp. Call write() from one thread only.
+    """
+    def __init__(self, path, flush_every=30):
+        self.path = path
+        self.flush_every = flush_every
+        self._file = open(path, 'xb') # Never overwrite an existing recording
+        self._file.write(HEADER.pack(MAGIC, VERSION, RECORD_DTYPE.itemsize, NUM_KEYPOINTS, time.time()))
+        self._start = time.perf_counter()
+        self._empty = np.zeros(1, dtype=RECORD_DTYPE)
+        self.frames = 0
+
+    def write(self, people, t=None):
+        """
+        people: (N, 17, 3) detections for one frame (N may be 0).
+        t: timestamp in seconds; defaults to time since the recorder started.
+        """
+        t = time.perf_counter() - self._start if t is None else t
+        n = len(people)
+        if n == 0:
+            rec = self._empty
+            rec['person'] = -1
+            rec['count'] = 0
+        else:
+            rec = np.empty(n, dtype=RECORD_DTYPE)
+            rec['person'] = np.arange(n)
+            rec['count'] = n
+            rec['kp'] = people
+        rec['t'] = t
+        rec['frame'] = self.frames
+        self._file.write(rec.tobytes())
+        self.frames += 1
+        if self.frames % self.flush_every == 0:
+            self._file.flush()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class Recording:
+    """
+    Read-only view of a recording. `records` is a memory map of the whole
+    file; frames are located with one vectorized pass, so opening is cheap
+    even for long sessions.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            magic, version, record_size, keypoints, created = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a recording")
+        if version != VERSION or record_size != RECORD_DTYPE.itemsize or keypoints != NUM_KEYPOINTS:
+            raise ValueError(f"{path}: unsupported recording format (version {version})")
+        self.created = created
+
+        count = (os.path.getsize(path) - HEADER.size) // RECORD_DTYPE.itemsize # Drops a torn tail
+        if count > 0:
+            self.records = np.memmap(path, dtype=RECORD_DTYPE, mode='r', offset=HEADER.size, shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=RECORD_DTYPE)
+        frame = np.asarray(self.records['frame'])
+        self._starts = np.flatnonzero(np.diff(frame, prepend=-1) != 0) if count else np.zeros(0, np.int64)
+        self._ends = np.append(self._starts[1:], count)
+
+    def __len__(self):
+        """Number of frames."""
+        return len(self._starts)
+
+    @property
+    def duration(self):
+        if not len(self.records):
+            return 0.0
+        return float(self.records['t'][-1] - self.records['t'][0])
+
+    def frames(self):
+        """
+        Yields (frame_index, t, people) in order; people is (N, 17, 3) float32.
+        """
+        kp = self.records['kp']
+        frame = self.records['frame']
+        t = self.records['t']
+        person = self.records['person']
+        empty = np.zeros((0, NUM_KEYPOINTS, 3), dtype=np.float32)
+        for s, e in zip(self._starts.tolist(), self._ends.tolist()):
+            people = empty if person[s] < 0 else np.asarray(kp[s:e])
+            yield int(frame[s]), float(t[s]), people
+
+    def info(self):
+        return {
+            'path': self.path,
+            'frames': len(self),
+            'detections': int((np.asarray(self.records['person']) >= 0).sum()),
+            'duration_s': round(self.duration, 3),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.created)),
+            'bytes': os.path.getsize(self.path),
+        }
+
+
+def add_recording_args(parser):
+    parser.add_argument('--record', default=None, metavar='PATH',
+                        help="Record every processed frame's keypoints to PATH (see replay.py)")
+
+
+def open_recorder(args):
+    """Recorder for --record, or None."""
+    if not getattr(args, 'record', None):
+        return None
+    recorder = Recorder(args.record)
+    print(f"[Recorder] Recording keypoints to {args.record}")
+    return recorder
@@ -0,0 +1,155 @@
+import argparse
+import hashlib
+import json
+import sys
+import time
+
+import game_logic
+from forest import add_classifier_args, check_classifier_args, gated_classifier, load_classifier
+from offline import SessionScorer
+from recording import Recording
+from rules import EXERCISES
+
+CLASSIFIER_MODEL = 'exercise_classifier.pkl'
+
+# game_logic thresholds --set may change: class name -> attribute names
+TUNABLE = {
+    'BicepCurl': ('FLARE_LIMIT', 'CURLED_ANGLE', 'EXTENDED_ANGLE'),
+}
+
+
+def apply_overrides(overrides):
+    """
+    Applies `Class.ATTR=value` overrides to the game_logic thresholds in
+    TUNABLE (e.g. BicepCurl.FLARE_LIMIT=22.5) so they can be tuned against
+    a recording. Values are set as floats.
+    """
+    for item in overrides:
+        name, sep, value = item.partition('=')
+        cls_name, _, attr = name.partition('.')
+        if not sep or attr not in TUNABLE.get(cls_name, ()):
+            allowed = ', '.join(f"{c}.{a}" for c, attrs in TUNABLE.items() for a in attrs)
+            raise ValueError(f"Unknown override {item!r}, tunable thresholds: {allowed}")
+        cls = getattr(game_logic, cls_name)
+        try:
+            setattr(cls, attr, float(value))
+        except ValueError:
+            raise ValueError(f"Override {item!r} needs a number") from None
+
+
+def replay(recording, clf=None, args=None, out=None, rules=()):
+    """
+    Runs the session's detections through tracking and game logic
+    (plus the named rule exercises, see rules.EXERCISES).
+    A fresh scorer (and classifier gate state) is built per call, so
+    repeated replays of the same recording produce identical records.
+    Returns a summary dict including a sha256 digest of all records.
+    """
+    if clf is not None and args is not None:
+        clf = gated_classifier(clf, args)
+        scorer = SessionScorer(clf, classify_every=args.classify_every, smoothed=True,
+                               window=args.feature_window, alpha=args.feature_alpha, rules=rules)
+    else:
+        scorer = SessionScorer(clf, rules=rules)
+
+    digest = hashlib.sha256()
+    players = {}
+    events = 0
+    t0 = time.perf_counter()
+    for frame_index, _, people in recording.frames():
+        record = scorer.step(frame_index, people)
+        line = json.dumps(record)
+        digest.update(line.encode())
+        if out is not None:
+            out.write(line + "\n")
+        events += len(record['events'])
+        for player in record['players']:
+            players[player['id']] = player
+    elapsed = time.perf_counter() - t0
+
+    return {
+        'frames': len(recording),
+        'rep_events': events,
+        'players': {pid: {'bicep_reps': p['bicep']['reps'], 'bicep_score': p['bicep']['score'],
+                          'exercise': p.get('exercise'), 'exercise_reps': p.get('exercise_reps'),
+                          **({'rule_reps': {name: r['reps'] for name, r in p['rules'].items()}}
+                             if 'rules' in p else {})}
+                    for pid, p in sorted(players.items())},
+        'seconds': round(elapsed, 4),
+        'fps': round(len(recording) / elapsed, 1) if elapsed > 0 else 0.0,
+        'sha256': digest.hexdigest(),
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay a session recorded with --record")
+    parser.add_argument('recording', help="Recording file (.rec)")
+    parser.add_argument('--info', action='store_true', help="Print the recording's header info and exit")
+    parser.add_argument('--out', default=None, help="Write per-frame records (JSONL) here")
+    parser.add_argument('--classifier', default=CLASSIFIER_MODEL,
+                        help="Exercise classifier ('' to score bicep curls only)")
+    parser.add_argument('--raw-classifier', action='store_true',
+                        help="Classify every frame's raw features (offline.py behaviour) "
+                             "instead of the live smoothed / gated path")
+    parser.add_argument('--set', dest='overrides', action='append', default=[], metavar='CLASS.ATTR=VALUE',
+                        help="Override a game_logic threshold: BicepCurl.FLARE_LIMIT, CURLED_ANGLE or "
+                             "EXTENDED_ANGLE, e.g. BicepCurl.FLARE_LIMIT=22.5 "
+                             "(repeatable, also applies to --rules bicep_curl)")
+    parser.add_argument('--repeat', type=int, default=1,
+                        help="Replay N times, checking every run gives the same digest")
+    parser.add_argument('--rules', default='', metavar='NAME[,NAME...]',
+                        help=f"Also score these rule exercises ({', '.join(EXERCISES)})")
+    add_classifier_args(parser)
+    args = parser.parse_args()
+    check_classifier_args(parser, args)
+    args.rules = [name for name in args.rules.split(',') if name]
+    for name in args.rules:
+        if name not in EXERCISES:
+            parser.error(f"--rules: unknown exercise {name!r}")
+    if args.repeat < 1:
+        parser.error("--repeat must be >= 1")
+    return args
+
+
+def main():
+    args = parse_args()
+    recording = Recording(args.recording)
+    if args.info:
+        print(json.dumps(recording.info(), indent=2))
+        return
+
+    clf = None
+    if args.classifier:
+        try:
+            clf = load_classifier(args.classifier)
+        except Exception as e:
+            print(f"[Replay] Classifier unavailable ({e}), scoring bicep curls only")
+
+    try:
+        apply_overrides(args.overrides)
+    except ValueError as e:
+        print(f"[Replay] {e}")
+        sys.exit(2)
+
+    digests = set()
+    for run in range(args.repeat):
+        out = open(args.out, 'w') if args.out and run == 0 else None
+        try:
+            summary = replay(recording, clf, None if args.raw_classifier else args, out, rules=args.rules)
+        finally:
+            if out is not None:
+                out.close()
+        digests.add(summary['sha256'])
+        print(f"[Replay] run {run + 1}: {summary['frames']} frames in {summary['seconds']}s "
+              f"({summary['fps']} fps), digest {summary['sha256'][:16]}")
+
+    for pid, player in summary['players'].items():
+        print(f"  P{pid}: {player}")
+    print(f"[Replay] {summary['rep_events']} rep events")
+    if len(digests) > 1:
+        print("[Replay] WARNING: runs produced different records")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import numpy as np
+
+class RoiEngine:
+    """
+    Wraps a PoseEngine to run inference on a crop around the tracked player.
+
+    After a full-frame detection, each frame is cropped to the previous
+    player's keypoint box (expanded by `expand`) and inferred at the smaller
+    crop_imgsz. Keypoints are mapped back to full-frame coordinates, so the
+    (17, 3) / (N, 17, 3) output contract is unchanged.
+
+    Falls back to full-frame detection on the same frame when:
+      - there is no previous player box (start-up, player lost),
+      - nobody is found in the crop,
+      - the player's joints come within edge_margin of a crop edge that is
+        not also a frame edge (they may be leaving the crop),
+    and every full_every frames, so newcomers are still noticed.
+    """
+    def __init__(self, engine, crop_imgsz=320, expand=1.6, min_size=192,
+                 edge_margin=0.04, conf_threshold=0.5, full_every=60):
+        self.engine = engine
+        self.crop_imgsz = crop_imgsz
+        self.expand = expand               # Crop size relative to the keypoint box
+        self.min_size = min_size           # Minimum crop side in pixels
+        self.edge_margin = edge_margin     # Fraction of crop size treated as "near the edge"
+        self.conf_threshold = conf_threshold
+        self.full_every = full_every
+
+        self.box = None # (x1, y1, x2, y2) of the player's confident keypoints
+        self.frames_since_full = 0
+
+        # Counters
+        self.full_frames = 0
+        self.roi_frames = 0
+
+    def __getattr__(self, name):
+        return getattr(self.engine, name)
+
+    def reset(self):
+        self.box = None
+
+    def _keypoint_box(self, kp):
+        visible = kp[:, 2] > self.conf_threshold
+        if not visible.any():
+            return None
+        pts = kp[visible, :2]
+        return np.concatenate([pts.min(axis=0), pts.max(axis=0)])
+
+    def _select(self, people):
+        """
+        Index of the player to follow: largest confident-keypoint box.
+        Returns (index, box) or (None, None).
+        """
+        best, best_box, best_area = None, None, -1.0
+        for i, kp in enumerate(people):
+            box = self._keypoint_box(kp)
+            if box is None:
+                continue
+            area = (box[2] - box[0]) * (box[3] - box[1])
+            if area > best_area:
+                best, best_box, best_area = i, box, area
+        return best, best_box
+
+    def _crop_rect(self, frame_shape):
+        h, w = frame_shape[:2]
+        cx = (self.box[0] + self.box[2]) / 2
+        cy = (self.box[1] + self.box[3]) / 2
+        bw = max((self.box[2] - self.box[0]) * self.expand, self.min_size)
+        bh = max((self.box[3] - self.box[1]) * self.expand, self.min_size)
+        x1 = int(max(0, cx - bw / 2))
+        y1 = int(max(0, cy - bh / 2))
+        x2 = int(min(w, cx + bw / 2))
+        y2 = int(min(h, cy + bh / 2))
+        return x1, y1, x2, y2
+
+    def _near_edge(self, box, rect, frame_shape):
+        h, w = frame_shape[:2]
+        x1, y1, x2, y2 = rect
+        mx = self.edge_margin * (x2 - x1)
+        my = self.edge_margin * (y2 - y1)
+        # An edge shared with the frame is not a reason to re-detect
+        return ((x1 > 0 and box[0] < x1 + mx) or (y1 > 0 and box[1] < y1 + my) or
+                (x2 < w and box[2] > x2 - mx) or (y2 < h and box[3] > y2 - my))
+
+    def _full_frame(self, frame):
+        people = self.engine.get_all_keypoints(frame)
+        self.full_frames += 1
+        self.frames_since_full = 0
+        _, self.box = self._select(people)
+        return people
+
+    def get_all_keypoints(self, frame, imgsz=None):
+        """
+        Returns:
+            np.ndarray: (N_people, 17, 3) in full-frame coordinates. In ROI
+                        mode only people inside the crop are returned.
+        """
+        if self.box is None or self.frames_since_full + 1 >= self.full_every:
+            return self._full_frame(frame)
+
+        rect = self._crop_rect(frame.shape)
+        x1, y1, x2, y2 = rect
+        if x2 - x1 < 2 or y2 - y1 < 2:
+            return self._full_frame(frame)
+
+        crop = frame[y1:y2, x1:x2]
+        people = self.engine.get_all_keypoints(crop, imgsz=imgsz or self.crop_imgsz)
+        idx, box = self._select(people)
+        if idx is None:
+            return self._full_frame(frame)
+
+        # Back to full-frame coordinates
+        people = people.copy()
+        people[..., 0] += x1
+        people[..., 1] += y1
+        box = box + np.array([x1, y1, x1, y1], dtype=box.dtype)
+
+        if self._near_edge(box, rect, frame.shape):
+            return self._full_frame(frame)
+
+        self.box = box
+        self.roi_frames += 1
+        self.frames_since_full += 1
+        return people
+
+    def get_keypoints(self, frame):
+        """
+        Same contract as PoseEngine.get_keypoints: (17, 3) for the followed
+        player, or None.
+        """
+        people = self.get_all_keypoints(frame)
+        idx, _ = self._select(people)
+        if idx is None:
+            return None
+        return people[idx]
@@ -0,0 +1,385 @@
+import weakref
+
+import numpy as np
+
+import features
+from game_logic import BankedExercise, BicepCurl, ExerciseBank
+
+# COCO keypoint names, plus the hip midpoint features.with_mid_hip() appends
+KEYPOINTS = {
+    'nose': 0, 'left_eye': 1, 'right_eye': 2, 'left_ear': 3, 'right_ear': 4,
+    'left_shoulder': 5, 'right_shoulder': 6, 'left_elbow': 7, 'right_elbow': 8,
+    'left_wrist': 9, 'right_wrist': 10, 'left_hip': 11, 'right_hip': 12,
+    'left_knee': 13, 'right_knee': 14, 'left_ankle': 15, 'right_ankle': 16,
+    'mid_hip': features.MID_HIP,
+}
+
+MIN_CONFIDENCE = 0.5 # Required joints below this: "Camera Obstructed"
+MAX_ENERGY = 100.0
+
+# An exercise is a plain dict:
+#   name         unique exercise name
+#   angles       {angle name: (a, b, c) joint names}, the angle at b, in degrees
+#   required     joints that must be detected (default: every joint of `angles`)
+#   form         checks in priority order, each {'when': [conditions],
+#                'feedback': text, 'energy': delta}; a check is broken when
+#                all its conditions hold. Every broken check's energy delta
+#                applies and the first one's feedback is shown.
+#   good_form    {'feedback': text, 'energy': delta} when no check is broken
+#                (energy capped at MAX_ENERGY)
+#   states       state names, the first is the initial state
+#   transitions  {'from': state, 'to': state, 'when': [conditions],
+#                'good_form': only with no broken check, 'rep': counts a rep,
+#                'score': points per rep (100), 'energy': delta}; the first
+#                one from the current state whose conditions hold fires
+#   display      angle shown on the overlay (game.current_angle)
+# A condition is (angle name, '>' or '<', degrees). Energy below 0 is
+# clamped and shows "FATIGUE / BAD FORM".
+
+def bicep_curl_rule():
+    """
+    Same rules as game_logic.BicepCurl, with its current thresholds (so
+    replay.py --set overrides apply). BicepCurl's update_curls() stays the
+    hand-written path for it; they give identical bank state.
+    """
+    return {
+        'name': 'bicep_curl',
+        'angles': {
+            'flare': ('right_hip', 'right_shoulder', 'right_elbow'),
+            'curl': ('right_shoulder', 'right_elbow', 'right_wrist'),
+        },
+        'form': [
+            {'when': [('flare', '>', BicepCurl.FLARE_LIMIT)], 'feedback': "Tuck Your Elbow!", 'energy': -0.5},
+        ],
+        'good_form': {'feedback': "Good Form", 'energy': 0.2},
+        'states': ['extension', 'flexion'],
+        'transitions': [
+            {'from': 'extension', 'to': 'flexion', 'when': [('curl', '<', BicepCurl.CURLED_ANGLE)],
+             'good_form': True, 'rep': True},
+            {'from': 'flexion', 'to': 'extension', 'when': [('curl', '>', BicepCurl.EXTENDED_ANGLE)]},
+        ],
+        'display': 'curl',
+    }
+
+
+BICEP_CURL = bicep_curl_rule()
+
+# Starting thresholds, to be tuned against recordings (replay.py --rules)
+SQUAT = {
+    'name': 'squat',
+    'angles': {
+        'knee': ('right_hip', 'right_knee', 'right_ankle'),
+        'hip': ('right_shoulder', 'right_hip', 'right_knee'),
+    },
+    'form': [
+        {'when': [('hip', '<', 50)], 'feedback': "Chest Up!", 'energy': -0.5},
+    ],
+    'good_form': {'feedback': "Good Form", 'energy': 0.2},
+    'states': ['up', 'down'],
+    'transitions': [
+        {'from': 'up', 'to': 'down', 'when': [('knee', '<', 100)], 'good_form': True},
+        {'from': 'down', 'to': 'up', 'when': [('knee', '>', 160)], 'rep': True, 'energy': 2.0},
+    ],
+    'display': 'knee',
+}
+
+LATERAL_RAISE = {
+    'name': 'lateral_raise',
+    'angles': {
+        'right_raise': ('right_hip', 'right_shoulder', 'right_elbow'),
+        'left_raise': ('left_hip', 'left_shoulder', 'left_elbow'),
+        'right_arm': ('right_shoulder', 'right_elbow', 'right_wrist'),
+        'left_arm': ('left_shoulder', 'left_elbow', 'left_wrist'),
+    },
+    'form': [
+        {'when': [('right_raise', '>', 110)], 'feedback': "Stop at Shoulder Height!", 'energy': -0.5},
+        {'when': [('left_raise', '>', 110)], 'feedback': "Stop at Shoulder Height!", 'energy': -0.5},
+        {'when': [('right_arm', '<', 140)], 'feedback': "Straighten Your Arms!", 'energy': -0.2},
+        {'when': [('left_arm', '<', 140)], 'feedback': "Straighten Your Arms!", 'energy': -0.2},
+    ],
+    'good_form': {'feedback': "Good Form", 'energy': 0.2},
+    'states': ['down', 'up'],
+    'transitions': [
+        {'from': 'down', 'to': 'up', 'when': [('right_raise', '>', 80), ('left_raise', '>', 80)],
+         'good_form': True, 'rep': True},
+        {'from': 'up', 'to': 'down', 'when': [('right_raise', '<', 25), ('left_raise', '<', 25)]},
+    ],
+    'display': 'right_raise',
+}
+
+EXERCISES = {rule['name']: rule for rule in (BICEP_CURL, SQUAT, LATERAL_RAISE)}
+
+
+def exercise_rules(names):
+    """Rules of the named exercises, bicep_curl with BicepCurl's current thresholds."""
+    return [bicep_curl_rule() if name == 'bicep_curl' else EXERCISES[name] for name in names]
+
+
+class RuleSet:
+    """
+    Exercise rules compiled into padded index / threshold arrays, so one
+    update() advances every slot of an ExerciseBank, whatever exercise each
+    one runs: joint angles for the union of all rules' triplets are computed
+    once per pose, then form checks, transitions and energy are evaluated as
+    array operations over (slot, check, condition). No per-exercise Python
+    runs per frame.
+    """
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self.names = [rule['name'] for rule in self.rules]
+        self.index = {name: i for i, name in enumerate(self.names)}
+        if len(self.index) != len(self.names):
+            raise ValueError(f"Duplicate exercise names in {self.names}")
+        self.texts = [] # Feedback strings, mapped to each bank's codes by _codes()
+        self._text_index = {}
+        self._bank_codes = weakref.WeakKeyDictionary()
+        triplets = {} # (a, b, c) -> column of the shared joint_angles() pass
+
+        compiled = [self._compile(rule, triplets) for rule in self.rules]
+        self.triplets = np.array(list(triplets), dtype=np.intp).reshape(-1, 3)
+        self.mid_hip = bool((self.triplets == features.MID_HIP).any())
+
+        def stack(key, fill, dtype):
+            # Pads every rule's (F, C) / (F,) / () entries to a common shape
+            items = [np.asarray(c[key], dtype=dtype) for c in compiled]
+            shape = np.max([item.shape for item in items], axis=0) if items[0].ndim else ()
+            out = np.full((len(items),) + tuple(np.maximum(shape, 1)), fill, dtype=dtype)
+            for i, item in enumerate(items):
+                out[(i,) + tuple(slice(0, n) for n in item.shape)] = item
+            return out
+
+        self.angle_cols = stack('angle_cols', 0, np.intp)   # (E, A) into triplets
+        self.required = stack('required', False, np.bool_) # (E, 17)
+        self.display = stack('display', 0, np.intp)         # (E,) into angle_cols
+        self.initial = stack('initial', 0, np.int8)
+        self.good_energy = stack('good_energy', 0.0, np.float64)
+        self.good_feedback = stack('good_feedback', 0, np.intp)
+        # Form checks (E, F) and their conditions (E, F, C)
+        self.form_valid = stack('form_valid', False, np.bool_)
+        self.form_energy = stack('form_energy', 0.0, np.float64)
+        self.form_feedback = stack('form_feedback', 0, np.intp)
+        self.form_cond = self._stack_conditions(stack, 'form')
+        # Transitions (E, R) and their conditions (E, R, C)
+        self.tr_valid = stack('tr_valid', False, np.bool_)
+        self.tr_from = stack('tr_from', -1, np.int8)
+        self.tr_to = stack('tr_to', 0, np.int8)
+        self.tr_good = stack('tr_good', False, np.bool_)
+        self.tr_rep = stack('tr_rep', False, np.bool_)
+        self.tr_score = stack('tr_score', 0, np.int64)
+        self.tr_energy = stack('tr_energy', 0.0, np.float64)
+        self.tr_cond = self._stack_conditions(stack, 'tr')
+
+    @staticmethod
+    def _stack_conditions(stack, prefix):
+        # (angle index, is '>', degrees, used); unused padding always holds
+        return (stack(f'{prefix}_angle', 0, np.intp), stack(f'{prefix}_above', False, np.bool_),
+                stack(f'{prefix}_value', 0.0, np.float64), stack(f'{prefix}_used', False, np.bool_))
+
+    def _text(self, text):
+        if text not in self._text_index:
+            self._text_index[text] = len(self.texts)
+            self.texts.append(text)
+        return self._text_index[text]
+
+    def _compile(self, rule, triplets):
+        name = rule['name']
+
+        def joint(j):
+            if j not in KEYPOINTS:
+                raise ValueError(f"{name}: unknown joint {j!r}")
+            return KEYPOINTS[j]
+
+        angles = list(rule['angles'])
+        if not 0 < len(angles) <= ExerciseBank.MAX_ANGLES:
+            raise ValueError(f"{name}: needs 1 to {ExerciseBank.MAX_ANGLES} angles, got {len(angles)}")
+        cols = [triplets.setdefault(tuple(joint(j) for j in rule['angles'][a]), len(triplets)) for a in angles]
+
+        required = np.zeros(17, dtype=bool)
+        joints = rule.get('required') or [j for a in angles for j in rule['angles'][a]]
+        for j in joints:
+            index = joint(j)
+            if index == features.MID_HIP:
+                required[[KEYPOINTS['left_hip'], KEYPOINTS['right_hip']]] = True
+            else:
+                required[index] = True
+
+        def conditions(items, what):
+            out = []
+            for item in items:
+                conds = list(item['when'])
+                for angle, op, value in conds:
+                    if angle not in angles or op not in ('>', '<'):
+                        raise ValueError(f"{name}: bad {what} condition {(angle, op, value)!r}")
+                out.append([(angles.index(angle), op == '>', float(value)) for angle, op, value in conds])
+            width = max([len(c) for c in out], default=0)
+            padded = [c + [(0, False, 0.0)] * (width - len(c)) for c in out]
+            used = [[True] * len(c) + [False] * (width - len(c)) for c in out]
+            if not out:
+                return [np.zeros((0, 0))] * 3 + [np.zeros((0, 0), dtype=bool)]
+            return ([[c[0] for c in row] for row in padded], [[c[1] for c in row] for row in padded],
+                    [[c[2] for c in row] for row in padded], used)
+
+        states = list(rule['states'])
+        codes = {state: ExerciseBank.state_code(state) for state in states}
+        for t in rule['transitions']:
+            if t['from'] not in codes or t['to'] not in codes:
+                raise ValueError(f"{name}: transition between unknown states {t['from']!r} -> {t['to']!r}")
+        display = rule.get('display', angles[0])
+        if display not in angles:
+            raise ValueError(f"{name}: unknown display angle {display!r}")
+
+        form, transitions = rule.get('form', []), rule['transitions']
+        good = rule.get('good_form', {})
+        compiled = {
+            'angle_cols': cols,
+            'required': required,
+            'display': angles.index(display),
+            'initial': codes[states[0]],
+            'good_energy': good.get('energy', 0.0),
+            'good_feedback': self._text(good.get('feedback', "Good Form")),
+            'form_valid': [True] * len(form),
+            'form_energy': [check.get('energy', 0.0) for check in form],
+            'form_feedback': [self._text(check['feedback']) for check in form],
+            'tr_valid': [True] * len(transitions),
+            'tr_from': [codes[t['from']] for t in transitions],
+            'tr_to': [codes[t['to']] for t in transitions],
+            'tr_good': [t.get('good_form', False) for t in transitions],
+            'tr_rep': [t.get('rep', False) for t in transitions],
+            'tr_score': [t.get('score', 100) if t.get('rep') else 0 for t in transitions],
+            'tr_energy': [t.get('energy', 0.0) for t in transitions],
+        }
+        for prefix, items, what in (('form', form, 'form'), ('tr', transitions, 'transition')):
+            (compiled[f'{prefix}_angle'], compiled[f'{prefix}_above'],
+             compiled[f'{prefix}_value'], compiled[f'{prefix}_used']) = conditions(items, what)
+        return compiled
+
+    def _codes(self, bank):
+        # This rule set's feedback texts as the bank's feedback codes
+        codes = self._bank_codes.get(bank)
+        if codes is None:
+            codes = self._bank_codes[bank] = np.array([bank.feedback_code(t) for t in self.texts],
+                                                      dtype=np.int32)
+        return codes
+
+    @staticmethod
+    def _holds(angles, ex, cond):
+        # Whether all conditions of each (slot, check) hold: (n, A) -> (n, K)
+        index, above, value, used = (c[ex] for c in cond)
+        n, k, c = index.shape
+        vals = np.take_along_axis(angles, index.reshape(n, k * c), axis=1).reshape(n, k, c)
+        return (np.where(above, vals > value, vals < value) | ~used).all(axis=2)
+
+    def initial_state(self, name):
+        return ExerciseBank.STATES[self.initial[self.index[name]]]
+
+    def update(self, bank, slots, keypoints, poses=None):
+        """
+        Advances every slot (a RuleExercise of this rule set) by one frame.
+        slots: (n,) distinct slot indices
+        keypoints: (P, 17, 3) poses
+        poses: (n,) pose row of each slot (default: slot i uses row i), so
+               one person can run several exercises off one angle pass
+        """
+        slots = np.asarray(slots, dtype=np.intp)
+        if not len(slots):
+            return
+        kp = np.asarray(keypoints)
+        poses = np.arange(len(slots)) if poses is None else np.asarray(poses, dtype=np.intp)
+        ex = bank.rule[slots]
+        codes = self._codes(bank)
+
+        # 1. Required joints detected?
+        low = kp[:, :17, 2] < MIN_CONFIDENCE
+        if np.count_nonzero(low):
+            obstructed = (low[poses] & self.required[ex]).any(axis=1)
+            if np.count_nonzero(obstructed):
+                bank.feedback[slots[obstructed]] = bank.FB_OBSTRUCTED
+                bank.correct[slots[obstructed]] = False
+                ok = ~obstructed
+                slots, poses, ex = slots[ok], poses[ok], ex[ok]
+                if not len(slots):
+                    return
+        s = slots
+        rows = np.arange(len(s))
+
+        # 2. Every rule's angles in one pass per pose, then each slot's own
+        # columns, smoothed like BicepCurl
+        points = features.with_mid_hip(kp) if self.mid_hip else kp
+        angles = features.joint_angles(points, self.triplets)[poses[:, None], self.angle_cols[ex]]
+        width = angles.shape[1]
+        ema = bank.ema[s, :width]
+        ema += (angles - ema) * bank.alpha[s][:, None]
+        first = ~bank.seen[s]
+        if np.count_nonzero(first):
+            ema[first] = angles[first]
+            bank.seen[s] = True
+        bank.ema[s, :width] = ema
+        smoothed = bank.smoothed[s]
+        if np.count_nonzero(smoothed):
+            angles[smoothed] = ema[smoothed]
+        bank.current_angle[s] = angles[rows, self.display[ex]]
+
+        # 3. Form checks
+        broken = self._holds(angles, ex, self.form_cond) & self.form_valid[ex]
+        bad = broken.any(axis=1)
+        energy = bank.energy[s]
+        drained = energy + np.where(broken, self.form_energy[ex], 0.0).sum(axis=1)
+        energy = np.minimum(energy + self.good_energy[ex], MAX_ENERGY)
+        energy[bad] = drained[bad]
+        feedback = codes[np.where(bad, self.form_feedback[ex, broken.argmax(axis=1)], self.good_feedback[ex])]
+        bank.correct[s] = ~bad
+
+        # 4. State machine: first transition out of the current state that holds
+        state = bank.state[s]
+        fires = (self._holds(angles, ex, self.tr_cond) & self.tr_valid[ex]
+                 & (self.tr_from[ex] == state[:, None]) & ~(self.tr_good[ex] & bad[:, None]))
+        moved = fires.any(axis=1)
+        if np.count_nonzero(moved):
+            t = fires.argmax(axis=1)
+            rep = moved & self.tr_rep[ex, t]
+            bank.reps[s] += rep
+            bank.score[s] += np.where(rep, self.tr_score[ex, t], 0)
+            energy = np.where(moved, np.minimum(energy + self.tr_energy[ex, t], MAX_ENERGY), energy)
+            bank.state[s] = np.where(moved, self.tr_to[ex, t], state)
+
+        # Energy clamp
+        fatigued = energy < 0
+        if np.count_nonzero(fatigued):
+            energy[fatigued] = 0.0
+            feedback[fatigued] = bank.FB_FATIGUE
+        bank.energy[s] = energy
+        bank.feedback[s] = feedback
+
+
+RULES = RuleSet(EXERCISES.values())
+
+
+class RuleExercise(BankedExercise):
+    """
+    An exercise driven by a declarative rule (see EXERCISES), e.g.
+    RuleExercise('squat'). Give several of them one bank and advance them
+    together with rules.update(bank, slots, keypoints).
+    """
+    def __init__(self, exercise_name, rules=None, smoothing=None, bank=None):
+        """
+        rules: RuleSet holding the exercise (default: RULES)
+        smoothing: optional EMA weight (0-1] of the newest frame, as in BicepCurl
+        """
+        super().__init__(bank)
+        self.rules = rules if rules is not None else RULES
+        if exercise_name not in self.rules.index:
+            raise ValueError(f"Unknown exercise {exercise_name!r}, expected one of {self.rules.names}")
+        self.exercise_name = exercise_name
+        self.bank.rule[self.slot] = self.rules.index[exercise_name]
+        self.state = self.rules.initial_state(exercise_name)
+        self.smoothing = smoothing
+        self.bank.alpha[self.slot] = smoothing or 0.5
+        self.bank.smoothed[self.slot] = bool(smoothing)
+
+    current_angle = property(lambda self: float(self.bank.current_angle[self.slot]))
+
+    def update(self, keypoints):
+        """
+        keypoints: (17, 3) numpy array
+        """
+        self.rules.update(self.bank, [self.slot], np.asarray(keypoints)[None])
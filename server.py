@@ -0,0 +1,430 @@
+import argparse
+import asyncio
+import itertools
+import json
+import struct
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from features import pose_features
+from forest import GatedClassifier, load_classifier
+from game_logic import BicepCurl, ClassifierPlayer, ExerciseBank, update_players
+from metrics import add_metrics_args, configure_metrics, metrics
+from tracker import PoseTracker
+
+# --- Wire protocol ---
+# Every message is: u32 big-endian header length, a UTF-8 JSON header, then
+# header['payload'] bytes of binary payload (0 if absent).
+#
+# client -> server
+#   {"type": "hello", "mode": "bicep_curl" | "classifier"}
+#   {"type": "frame", "seq": n, "encoding": "jpeg" | "raw", "shape": [h, w, 3], "payload": size} + bytes
+#   {"type": "bye"}
+# server -> client
+#   {"type": "welcome", "session": id, "mode": ...}
+#   {"type": "result", "seq": n, "people": k, "keypoints": [[x, y, conf] * 17] | null,
+#    "exercise": str, "reps": int, "score": int, "feedback": str, "energy": float,
+#    "correct_form": bool, "server_ms": float}
+#   {"type": "dropped", "seq": n}   frame superseded by a newer one before it was processed
+#   {"type": "error", "message": str}
+
+HEADER = struct.Struct('!I')
+MAX_HEADER = 64 * 1024
+MAX_PAYLOAD = 32 * 1024 * 1024
+
+DEFAULT_PORT = 8765
+MODES = ('bicep_curl', 'classifier')
+
+
+async def read_message(reader):
+    """
+    Returns (header, payload) for the next message, or None at EOF.
+    Raises ValueError on a malformed or oversized message.
+    """
+    try:
+        (size,) = HEADER.unpack(await reader.readexactly(HEADER.size))
+        if size > MAX_HEADER:
+            raise ValueError(f"header too large ({size} bytes)")
+        header = json.loads(await reader.readexactly(size))
+        if not isinstance(header, dict):
+            raise ValueError("header is not an object")
+        payload_size = int(header.get('payload', 0))
+        if not 0 <= payload_size <= MAX_PAYLOAD:
+            raise ValueError(f"bad payload size {payload_size}")
+        payload = await reader.readexactly(payload_size) if payload_size else b''
+    except asyncio.IncompleteReadError:
+        return None
+    return header, payload
+
+
+def encode_message(header, payload=b''):
+    if payload:
+        header = dict(header, payload=len(payload))
+    body = json.dumps(header).encode()
+    return HEADER.pack(len(body)) + body + payload
+
+
+def decode_frame(header, payload):
+    """BGR image from a frame message, or None if it cannot be decoded."""
+    if header.get('encoding', 'jpeg') == 'raw':
+        shape = tuple(header.get('shape', ()))
+        if len(shape) != 3 or int(np.prod(shape)) != len(payload):
+            return None
+        return np.frombuffer(payload, dtype=np.uint8).reshape(shape)
+    return cv2.imdecode(np.frombuffer(payload, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+class Session:
+    """
+    One connected client: its own tracker and game state, plus a single
+    pending-frame slot. A frame arriving while the previous one still waits
+    for a batch replaces it (the old one is reported as dropped), so a slow
+    server never builds a backlog for any client.
+    """
+    # Results are not sent while more than this many bytes are unsent to the client
+    MAX_WRITE_BUFFER = 256 * 1024
+
+    def __init__(self, sid, writer, mode, bank=None):
+        self.id = sid
+        self.writer = writer
+        self.mode = mode
+        self.tracker = PoseTracker()
+        self.game = BicepCurl(bank=bank) if mode == 'bicep_curl' else ClassifierPlayer(bank=bank)
+        self.pending = None # (header, payload, received loop time)
+        self.queued = False # In the batcher's ready queue
+        self.closed = False
+        self.frames = 0
+        self.results = 0
+        self.dropped = 0
+        self.unsent = 0
+
+    def offer(self, header, payload, now):
+        """Stores a new frame. Returns the seq of the frame it replaced, if any."""
+        replaced = self.pending[0].get('seq') if self.pending is not None else None
+        self.pending = (header, payload, now)
+        self.frames += 1
+        if replaced is not None:
+            self.dropped += 1
+        return replaced
+
+    def take(self):
+        item, self.pending = self.pending, None
+        self.queued = False
+        return item
+
+    def send(self, header):
+        """
+        Queues a message without waiting. Results for a client that stops
+        reading are discarded instead of buffered without bound.
+        """
+        if self.closed:
+            return False
+        if self.writer.transport.get_write_buffer_size() > self.MAX_WRITE_BUFFER:
+            self.unsent += 1
+            return False
+        self.writer.write(encode_message(header))
+        return True
+
+    def state(self):
+        game = self.game
+        if self.mode == 'classifier':
+            active = game.active_game
+            return {
+                'exercise': game.active_exercise_name,
+                'reps': active.reps if active else 0,
+                'score': active.score if active else 0,
+                'feedback': active.feedback if active else "Get Ready",
+                'energy': round(float(active.energy), 1) if active else 100.0,
+                'correct_form': bool(active.is_correct_form) if active else True,
+            }
+        return {
+            'exercise': 'bicep_curl',
+            'reps': game.reps,
+            'score': game.score,
+            'feedback': game.feedback,
+            'energy': round(float(game.energy), 1),
+            'correct_form': bool(game.is_correct_form),
+        }
+
+
+class MicroBatcher:
+    """
+    Collects pending frames from all sessions into batches for one
+    PoseEngine. A batch is dispatched when it holds max_batch frames or when
+    the oldest frame in it has waited max_wait seconds, whichever comes
+    first. Inference runs on a single worker thread, so the event loop keeps
+    reading frames (and dropping stale ones) while a batch is running.
+    """
+    def __init__(self, engine, clf=None, max_batch=8, max_wait=0.010):
+        self.engine = engine
+        self.clf = clf
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.ready = deque()
+        self._event = asyncio.Event()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pose")
+        # Game state of all sessions, either mode (only touched on the event loop)
+        self.curls = ExerciseBank()
+        self.batches = 0
+        self.frames = 0
+
+    def submit(self, session):
+        if not session.queued:
+            session.queued = True
+            self.ready.append(session)
+        self._event.set()
+
+    def _next_batch(self):
+        batch = []
+        while self.ready and len(batch) < self.max_batch:
+            session = self.ready.popleft()
+            item = session.take()
+            if item is not None and not session.closed:
+                batch.append((session, item))
+        return batch
+
+    def _infer(self, frames):
+        """Worker thread: decode + one batched forward pass."""
+        images = [decode_frame(header, payload) for header, payload, _ in frames]
+        valid = [i for i, img in enumerate(images) if img is not None]
+        people = self.engine.get_keypoints_batch([images[i] for i in valid])
+        out = [None] * len(frames)
+        for i, p in zip(valid, people):
+            out[i] = p
+        return out
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._event.wait()
+            if not self.ready:
+                self._event.clear()
+                continue
+            # Wait for more frames, but never past the oldest frame's deadline
+            oldest = min((s.pending[2] for s in self.ready if s.pending is not None), default=loop.time())
+            deadline = oldest + self.max_wait
+            while len(self.ready) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                self._event.clear()
+                try:
+                    await asyncio.wait_for(self._event.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+
+            batch = self._next_batch()
+            if not self.ready:
+                self._event.clear()
+            if not batch:
+                continue
+
+            start = loop.time()
+            for _, (_, _, received) in batch:
+                metrics.record("server_queue", start - received)
+            try:
+                people = await loop.run_in_executor(self._executor, self._infer, [item for _, item in batch])
+            except Exception as e:
+                print(f"[Server] Inference failed: {e}")
+                for session, (header, _, _) in batch:
+                    session.send({'type': 'error', 'message': "inference failed", 'seq': header.get('seq')})
+                continue
+            self.batches += 1
+            self.frames += len(batch)
+            metrics.count("server_batches")
+            metrics.count("server_frames", len(batch))
+            self._apply(batch, people, loop.time())
+
+    def _apply(self, batch, people, now):
+        """Event loop: tracking, game logic and replies for a finished batch."""
+        primaries = []
+        for (session, _), found in zip(batch, people):
+            kp = None
+            if found is not None and not session.closed:
+                visible = session.tracker.update(found)
+                pid = session.tracker.primary_id()
+                kp = visible.get(pid) if pid is not None else None
+            primaries.append(kp)
+
+        # Classifier sessions are classified together, one row per session, and
+        # their games advanced in one bank update. Closed sessions are skipped:
+        # classify() would re-create the gate state forgotten when they closed.
+        rows = [i for i, ((session, _), kp) in enumerate(zip(batch, primaries))
+                if kp is not None and session.mode == 'classifier' and self.clf is not None
+                and not session.closed]
+        if rows:
+            feats = pose_features(np.stack([primaries[i] for i in rows]))
+            players = [batch[i][0].game for i in rows]
+            for player, row in zip(players, feats):
+                player.observe(row)
+            with metrics.timer("classify"):
+                labels, confidences = self.clf.classify(
+                    np.stack([p.window.ema for p in players]), keys=[batch[i][0].id for i in rows])
+            update_players(players, labels, confidences)
+
+        # Bicep curl sessions share one bank: a single update for the batch
+        curls = [i for i, ((session, _), kp) in enumerate(zip(batch, primaries))
+                 if kp is not None and session.mode == 'bicep_curl' and not session.closed]
+        if curls:
+            self.curls.update_curls([batch[i][0].game.slot for i in curls],
+                                    np.stack([primaries[i] for i in curls]))
+
+        for (session, (header, _, received)), found, kp in zip(batch, people, primaries):
+            if session.closed:
+                continue
+            if found is None:
+                session.send({'type': 'error', 'message': "could not decode frame", 'seq': header.get('seq')})
+                continue
+            reply = {
+                'type': 'result',
+                'seq': header.get('seq'),
+                'people': int(len(found)),
+                'keypoints': np.round(kp, 2).tolist() if kp is not None else None,
+                'server_ms': round((now - received) * 1000.0, 2),
+            }
+            reply.update(session.state())
+            if session.send(reply):
+                session.results += 1
+            metrics.record("server_latency", now - received)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+class PoseServer:
+    def __init__(self, engine, clf=None, max_batch=8, max_wait=0.010, max_sessions=32):
+        self.batcher = MicroBatcher(engine, clf, max_batch, max_wait)
+        self.clf = clf
+        self.max_sessions = max_sessions
+        self.sessions = {}
+        self._ids = itertools.count(1)
+        self._started = time.perf_counter()
+
+    async def handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        session = None
+        try:
+            msg = await read_message(reader)
+            if msg is None:
+                return
+            header, _ = msg
+            mode = header.get('mode', 'bicep_curl')
+            error = None
+            if header.get('type') != 'hello':
+                error = "expected hello"
+            elif mode not in MODES:
+                error = f"unknown mode '{mode}'"
+            elif mode == 'classifier' and self.clf is None:
+                error = "server has no classifier loaded"
+            elif len(self.sessions) >= self.max_sessions:
+                error = "server full"
+            if error:
+                writer.write(encode_message({'type': 'error', 'message': error}))
+                await writer.drain()
+                return
+
+            session = Session(next(self._ids), writer, mode, self.batcher.curls)
+            self.sessions[session.id] = session
+            session.send({'type': 'welcome', 'session': session.id, 'mode': mode,
+                          'max_batch': self.batcher.max_batch})
+            print(f"[Server] Session {session.id} connected ({mode}), {len(self.sessions)} active")
+
+            while True:
+                msg = await read_message(reader)
+                if msg is None:
+                    break
+                header, payload = msg
+                kind = header.get('type')
+                if kind == 'frame':
+                    replaced = session.offer(header, payload, loop.time())
+                    if replaced is not None:
+                        session.send({'type': 'dropped', 'seq': replaced})
+                        metrics.count("server_dropped")
+                    self.batcher.submit(session)
+                elif kind == 'bye':
+                    break
+        except (ConnectionError, ValueError) as e:
+            print(f"[Server] Session {session.id if session else '?'}: {e}")
+        finally:
+            if session is not None:
+                session.closed = True
+                self.sessions.pop(session.id, None)
+                if isinstance(self.clf, GatedClassifier):
+                    self.clf.forget([session.id])
+                print(f"[Server] Session {session.id} closed: {session.frames} frames, "
+                      f"{session.results} results, {session.dropped} dropped")
+            writer.close()
+
+    def report(self):
+        elapsed = time.perf_counter() - self._started
+        b = self.batcher
+        return {
+            'batches': b.batches,
+            'frames': b.frames,
+            'mean_batch': round(b.frames / b.batches, 2) if b.batches else 0.0,
+            'fps': round(b.frames / elapsed, 2) if elapsed > 0 else 0.0,
+        }
+
+    async def serve(self, host='127.0.0.1', port=DEFAULT_PORT):
+        server = await asyncio.start_server(self.handle, host, port)
+        batcher = asyncio.create_task(self.batcher.run())
+        print(f"[Server] Listening on {host}:{port} (max batch {self.batcher.max_batch}, "
+              f"max wait {self.batcher.max_wait * 1000:.0f} ms)")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+            self.batcher.close()
+
+
+def parse_args():
+    from pose_engine import add_engine_args
+    parser = argparse.ArgumentParser(description="Multi-client pose service")
+    add_engine_args(parser)
+    add_metrics_args(parser)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--max-batch', type=int, default=8, help="Frames per inference batch (default: 8)")
+    parser.add_argument('--max-wait-ms', type=float, default=10.0,
+                        help="Longest a frame waits for its batch to fill (default: 10)")
+    parser.add_argument('--max-sessions', type=int, default=32)
+    parser.add_argument('--classifier', default='exercise_classifier.pkl',
+                        help="Classifier for 'classifier' sessions ('' to disable)")
+    parser.add_argument('--threads', type=int, default=None,
+                        help="CPU threads for torch inference (default: all cores)")
+    args = parser.parse_args()
+    if args.roi or args.keyframe_interval > 1 or args.idle_after is not None:
+        parser.error("--roi / --keyframe-interval / --idle-after track a single stream and cannot be used by the server")
+    return args
+
+
+def main():
+    from pose_engine import build_engine
+    args = parse_args()
+    configure_metrics(args)
+    engine = build_engine(args)
+    clf = None
+    if args.classifier:
+        try:
+            clf = GatedClassifier(load_classifier(args.classifier))
+        except Exception as e:
+            print(f"[Server] No classifier ({e}), 'classifier' sessions are disabled")
+
+    server = PoseServer(engine, clf, max_batch=args.max_batch, max_wait=args.max_wait_ms / 1000.0,
+                        max_sessions=args.max_sessions)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        metrics.close()
+        print(f"[Server] {server.report()}")
+
+
+if __name__ == "__main__":
+    main()
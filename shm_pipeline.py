@@ -0,0 +1,450 @@
+import multiprocessing as mp
+import os
+import queue
+import signal
+import time
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from metrics import metrics
+from pipeline import Pipeline, StageStats
+
+MAX_PEOPLE = 32 # Detections published per frame, extra ones are dropped
+NUM_KEYPOINTS = 17
+
+# control.state entries
+CAPTURED = 0     # Frames published by the capture process
+NEWEST_TAKEN = 1 # Sequence number of the newest frame claimed by a worker
+READY = 2        # Workers with a loaded model
+
+# control.stats columns, one row for capture then one per worker
+COUNT, BUSY, START, END = range(4)
+
+
+class SharedArrays:
+    """
+    Named NumPy arrays packed into one SharedMemory block.
+    layout: [(field, shape, dtype)], every field becomes an attribute. The
+    creating process owns the block and unlinks it on close(); the others
+    attach with SharedArrays.attach(spec()).
+    """
+    def __init__(self, layout, name=None):
+        self.layout = layout
+        offsets, size = [], 0
+        for _, shape, dtype in layout:
+            size = -(-size // 8) * 8 # 8-byte align every array
+            offsets.append(size)
+            size += int(np.prod(shape)) * np.dtype(dtype).itemsize
+        self.created = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.created, size=max(size, 1))
+        for (field, shape, dtype), offset in zip(layout, offsets):
+            setattr(self, field, np.ndarray(shape, dtype, buffer=self.shm.buf, offset=offset))
+
+    def spec(self):
+        return self.layout, self.shm.name
+
+    @classmethod
+    def attach(cls, spec):
+        layout, name = spec
+        return cls(layout, name)
+
+    def close(self):
+        for field, _, _ in self.layout:
+            self.__dict__.pop(field, None)
+        try:
+            self.shm.close()
+        except BufferError:
+            pass # A view is still referenced (e.g. by the model); unmapped at exit
+        if self.created:
+            self.shm.unlink()
+
+
+def _control_layout(slots, workers):
+    return [
+        ('seq', (slots,), 'i8'),      # Frame sequence number per ring slot, -1 = empty or being written
+        ('pins', (slots,), 'i4'),     # Readers currently using the slot
+        ('state', (3,), 'i8'),
+        ('stats', (1 + workers, 4), 'f8'),
+        ('result_seq', (workers,), 'i8'), # Frame the worker's latest result belongs to, -1 = none
+        ('result_ms', (workers,), 'f8'),
+        ('result_count', (workers,), 'i4'),
+        ('result_kp', (workers, MAX_PEOPLE, NUM_KEYPOINTS, 3), 'f4'),
+    ]
+
+
+def _record(stats, row, t0, t1):
+    # Same bookkeeping as StageStats.record, in shared memory
+    if stats[row, COUNT] == 0:
+        stats[row, START] = t1
+    stats[row, END] = t1
+    stats[row, COUNT] += 1
+    stats[row, BUSY] += t1 - t0
+
+
+def _get(q, stopped):
+    """Blocks on q until an item arrives or stopped() is true (then None)."""
+    while not stopped():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return None
+
+
+def _read(source, stop):
+    """(frame or None at end of stream, read start, read end)"""
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        ok, frame = source.read()
+        if ok:
+            return frame, t0, time.perf_counter()
+        if not getattr(source, 'is_live', False):
+            break # End of file / synthetic stream
+        print("Error: Failed to grab frame.")
+        time.sleep(1)
+    return None, 0.0, 0.0
+
+
+def _publish(control, ring, cond, seq, frame):
+    with cond:
+        # Never a slot someone is reading; an empty one first, else the oldest frame.
+        # There are more slots than possible readers, so one is always free.
+        free = np.flatnonzero(control.pins == 0)
+        slot = free[np.argmin(control.seq[free])]
+        control.seq[slot] = -1 # Invisible to readers while it is written
+    dst = ring.pixels[slot]
+    if frame.shape != dst.shape:
+        # Sources keep one size; this only guards a camera renegotiating its resolution
+        frame = cv2.resize(frame, (dst.shape[1], dst.shape[0]))
+    dst[...] = frame
+    with cond:
+        control.seq[slot] = seq
+        control.state[CAPTURED] = seq + 1
+        cond.notify_all()
+
+
+def _ignore_sigint():
+    # Ctrl+C reaches the whole process group; the UI process turns it into a
+    # clean stop. An interrupt inside a shared Condition would corrupt it.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _capture_main(source_factory, control_spec, cond, stop, done, shape_q, ring_q, max_frames):
+    _ignore_sigint()
+    control = SharedArrays.attach(control_spec)
+    source = source_factory()
+    ring = None
+    try:
+        frame, t0, t1 = _read(source, stop) if source.is_opened() else (None, 0.0, 0.0)
+        shape_q.put(None if frame is None else frame.shape)
+        ring_spec = _get(ring_q, stop.is_set) if frame is not None else None
+        if ring_spec is None:
+            return
+        # Workers are ready, stream
+        ring = SharedArrays.attach(ring_spec)
+        seq = 0
+        while frame is not None:
+            _record(control.stats, 0, t0, t1)
+            _publish(control, ring, cond, seq, frame)
+            seq += 1
+            if max_frames is not None and seq >= max_frames:
+                break
+            frame, t0, t1 = _read(source, stop)
+    finally:
+        done.set()
+        with cond:
+            cond.notify_all()
+        source.release()
+        if ring is not None:
+            ring.close()
+        control.close()
+
+
+def _claim(control, cond, stop, done):
+    """
+    Pins the newest frame no worker has taken yet and returns (slot, seq), or
+    None once the stream is over. Frames older than one already taken are
+    skipped: like LatestQueue, inference always works on the freshest frame.
+    """
+    with cond:
+        while not stop.is_set():
+            fresh = control.seq > control.state[NEWEST_TAKEN]
+            if fresh.any():
+                slot = int(np.argmax(np.where(fresh, control.seq, -1)))
+                seq = int(control.seq[slot])
+                control.pins[slot] += 1
+                control.state[NEWEST_TAKEN] = seq
+                return slot, seq
+            if done.is_set():
+                break
+            cond.wait(0.1)
+    return None
+
+
+def _inference_main(index, engine_factory, warmup, control_spec, cond, stop, done, ring_q):
+    _ignore_sigint()
+    control = SharedArrays.attach(control_spec)
+    ring = None
+    try:
+        try:
+            engine = engine_factory()
+            if warmup:
+                engine.warmup()
+        except Exception as e:
+            print(f"[Worker {index}] Could not load the pose model: {e}")
+            return
+        ring_spec = _get(ring_q, stop.is_set)
+        if ring_spec is None:
+            return
+        ring = SharedArrays.attach(ring_spec)
+        # Zero-copy input: the model reads the shared slot directly, read-only
+        pixels = ring.pixels.view()
+        pixels.flags.writeable = False
+        with cond:
+            control.state[READY] += 1
+            cond.notify_all()
+
+        while True:
+            claimed = _claim(control, cond, stop, done)
+            if claimed is None:
+                break
+            slot, seq = claimed
+            t0 = time.perf_counter()
+            try:
+                people = engine.get_all_keypoints(pixels[slot])
+            finally:
+                with cond:
+                    control.pins[slot] -= 1
+            t1 = time.perf_counter()
+            _record(control.stats, 1 + index, t0, t1)
+
+            n = min(len(people), MAX_PEOPLE)
+            with cond:
+                control.result_kp[index, :n] = people[:n]
+                control.result_count[index] = n
+                control.result_ms[index] = t1 - t0
+                control.result_seq[index] = seq
+                cond.notify_all()
+        del pixels
+    finally:
+        if ring is not None:
+            ring.close()
+        control.close()
+
+
+class ProcessPipeline:
+    """
+    Multi-process runtime: capture -> N inference workers -> UI, so decoding,
+    model pre/post-processing and drawing no longer share one interpreter.
+
+    The capture process writes frames into a shared-memory ring; workers run
+    the model directly on the ring slots (zero-copy) and publish keypoints
+    into a second shared array; this process applies them in frame order
+    (tracking, game logic) and renders.
+
+    Torn reads are prevented by slot ownership and sequence numbers: readers
+    pin a slot while they use it and the writer only reuses unpinned slots,
+    hiding a slot (seq = -1) while it is rewritten. Every result carries the
+    sequence number of its frame, and results older than one already applied
+    (workers finishing out of order) are discarded.
+
+    source_factory() -> source     called in the capture process
+    engine_factory() -> engine     called in every worker process
+    handle(people) -> result       called here for each new result, in frame order
+    render(frame, result) -> frame called here, result may be None
+    on_key(key)                    called with every key pressed in the window but 'q'
+
+    The factories are sent to spawned processes, so they must be picklable
+    (e.g. functools.partial of a module-level function).
+    """
+    def __init__(self, source_factory, engine_factory, handle, render=None, workers=1, warmup=True,
+                 window_name=None, max_frames=None, on_key=None):
+        self.source_factory = source_factory
+        self.engine_factory = engine_factory
+        self.handle = handle
+        self.render = render
+        self.workers = workers
+        self.warmup = warmup
+        self.window_name = window_name
+        self.max_frames = max_frames
+        self.on_key = on_key
+        # Every worker and the UI may each pin one slot, the writer needs one more
+        self.slots = workers + 2
+
+        self.infer_stats = StageStats("inference") # Results as they reach this process
+        self.logic_stats = StageStats("logic")
+        self.render_stats = StageStats("render")
+        self.shown = 0
+        self._stats = np.zeros((1 + workers, 4))
+        self._interrupted = False
+
+    def _on_sigint(self, signum, frame):
+        self._interrupted = True
+
+    def run(self):
+        """
+        Runs until the source is exhausted, 'q' or Ctrl+C is pressed.
+        Returns the report dict.
+        """
+        self._interrupted = False
+        previous = signal.signal(signal.SIGINT, self._on_sigint)
+        try:
+            return self._run()
+        finally:
+            signal.signal(signal.SIGINT, previous)
+
+    def _run(self):
+        ctx = mp.get_context('spawn') # No forked copies of model / camera threads
+        control = SharedArrays(_control_layout(self.slots, self.workers))
+        control.seq[:] = -1
+        control.state[NEWEST_TAKEN] = -1
+        control.result_seq[:] = -1
+        cond, stop, done = ctx.Condition(), ctx.Event(), ctx.Event()
+        shape_q, ring_q, capture_q = ctx.Queue(), ctx.Queue(), ctx.Queue()
+
+        procs = [ctx.Process(target=_capture_main, name="capture", daemon=True,
+                             args=(self.source_factory, control.spec(), cond, stop, done,
+                                   shape_q, capture_q, self.max_frames))]
+        procs += [ctx.Process(target=_inference_main, name=f"inference-{i}", daemon=True,
+                              args=(i, self.engine_factory, self.warmup, control.spec(), cond, stop, done, ring_q))
+                  for i in range(self.workers)]
+        workers = procs[1:]
+        for p in procs:
+            p.start()
+
+        ring = None
+        try:
+            shape = _get(shape_q, lambda: self._interrupted or not procs[0].is_alive())
+            if shape is None:
+                print("Error: Could not open the frame source.")
+                return self.report()
+            ring = SharedArrays([('pixels', (self.slots,) + tuple(shape), 'u1')])
+            for _ in workers:
+                ring_q.put(ring.spec())
+            with cond:
+                while control.state[READY] < self.workers:
+                    if not all(p.is_alive() for p in workers):
+                        print("Error: An inference worker failed to start.")
+                        return self.report()
+                    if self._interrupted:
+                        return self.report()
+                    cond.wait(0.1)
+            capture_q.put(ring.spec())
+            self._loop(control, ring, cond, done, workers)
+        finally:
+            stop.set()
+            with cond:
+                cond.notify_all()
+            for p in procs:
+                p.join(timeout=5.0)
+                if p.is_alive():
+                    p.terminate()
+            self._stats = control.stats.copy()
+            if ring is not None:
+                ring.close()
+            control.close()
+            if self.window_name:
+                cv2.destroyAllWindows()
+
+        return self.report()
+
+    def _loop(self, control, ring, cond, done, workers):
+        shown = applied = -1
+        result = None
+        while not self._interrupted:
+            with cond:
+                newest = int(control.seq.max())
+                fresh = sorted((int(s), w) for w, s in enumerate(control.result_seq) if s > applied)
+                if newest <= shown and not fresh:
+                    if done.is_set() and not any(p.is_alive() for p in workers):
+                        break # Everything captured has been inferred and shown
+                    cond.wait(0.1)
+                    continue
+                slot = None
+                if newest > shown:
+                    slot = int(np.argmax(control.seq))
+                    control.pins[slot] += 1
+                results = [(s, control.result_kp[w, :control.result_count[w]].copy(), float(control.result_ms[w]))
+                           for s, w in fresh]
+
+            for seq, people, seconds in results:
+                self.infer_stats.record(seconds)
+                t0 = time.perf_counter()
+                result = self.handle(people)
+                self.logic_stats.record(time.perf_counter() - t0)
+                applied = seq
+            if slot is None:
+                continue
+
+            # Drawing needs a private copy, the slot goes back to the writer
+            frame = ring.pixels[slot].copy()
+            with cond:
+                control.pins[slot] -= 1
+            shown = newest
+            self.shown += 1
+
+            t0 = time.perf_counter()
+            if self.render is not None:
+                frame = self.render(frame, result)
+            self.render_stats.record(time.perf_counter() - t0)
+            captured = int(control.state[CAPTURED])
+            metrics.set_counter("dropped_inference", captured - int(control.stats[1:, COUNT].sum()))
+            metrics.set_counter("dropped_render", captured - self.shown)
+
+            if self.window_name:
+                cv2.imshow(self.window_name, frame)
+                key = cv2.waitKey(1) & 0xFF
+                if key == ord('q'):
+                    break
+                if key != 0xFF and self.on_key is not None:
+                    self.on_key(key)
+
+    def report(self):
+        """
+        Per-stage throughput and dropped-frame counts; inference sums all workers.
+        """
+        def stage(rows):
+            count = rows[:, COUNT].sum()
+            span = rows[:, END].max() - rows[:, START].min() if count else 0.0
+            return {
+                'frames': int(count),
+                'fps': round((count - 1) / span, 2) if span > 0 else 0.0,
+                'mean_ms': round(1000.0 * rows[:, BUSY].sum() / count, 3) if count else 0.0,
+            }
+
+        captured = int(self._stats[0, COUNT])
+        report = {'capture': stage(self._stats[:1]), 'inference': stage(self._stats[1:])}
+        for stats in (self.logic_stats, self.render_stats):
+            report[stats.name] = {
+                'frames': stats.count,
+                'fps': round(stats.fps, 2),
+                'mean_ms': round(stats.mean_ms, 3),
+            }
+        report['inference']['dropped'] = captured - report['inference']['frames']
+        report['render']['dropped'] = captured - self.shown
+        return report
+
+    print_report = Pipeline.print_report
+
+
+def add_process_args(parser):
+    parser.add_argument('--workers', type=int, default=0,
+                        help="Run capture, N inference worker processes and the UI in separate "
+                             "processes over shared memory (default: 0, threaded pipeline)")
+
+
+def check_process_args(parser, args):
+    if args.workers < 0:
+        parser.error("--workers must be >= 0")
+    if args.workers and getattr(args, 'target_fps', None) is not None:
+        parser.error("--target-fps is not supported with --workers")
+    if args.workers > 1 and (args.roi or args.keyframe_interval > 1):
+        parser.error("--roi and --keyframe-interval track state across consecutive frames; "
+                     "use them with --workers 1")
+    if args.workers and getattr(args, 'idle_after', None) is not None:
+        parser.error("--idle-after is not supported with --workers")
+    if args.workers and getattr(args, 'threads', None) is None:
+        # Split the cores between workers instead of every worker grabbing all of them
+        args.threads = max(1, (os.cpu_count() or 1) // args.workers)
@@ -0,0 +1,115 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Import this module first in an entry point: its import time is the
+# reference point for the startup breakdown.
+_PROCESS_START = time.perf_counter()
+
+
+class StartupProfiler:
+    """
+    Records named startup phases (possibly overlapping, e.g. models loading
+    concurrently) and time-to-first-processed-frame, measured from when this
+    module was imported.
+    """
+    def __init__(self, start=None):
+        self.start = start if start is not None else _PROCESS_START
+        self.phases = [] # (name, offset_s, duration_s)
+        self.first_frame = None
+        self._lock = threading.Lock()
+
+    def _add(self, name, t0, t1):
+        with self._lock:
+            self.phases.append((name, t0 - self.start, t1 - t0))
+
+    @contextmanager
+    def phase(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add(name, t0, time.perf_counter())
+
+    def mark(self, name):
+        """
+        Records a phase running from the end of the previous phase (or from
+        process start) until now. Handy for "imports".
+        """
+        with self._lock:
+            last_end = max((self.start + off + dur for _, off, dur in self.phases), default=self.start)
+        self._add(name, last_end, time.perf_counter())
+
+    def timed(self, name, fn):
+        """Wraps fn so each call is recorded as phase `name` (for executor.submit)."""
+        def wrapper(*args, **kwargs):
+            with self.phase(name):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    def mark_first_frame(self):
+        """
+        Call when the first frame has been fully processed. Only the first
+        call counts; it prints the startup report.
+        """
+        if self.first_frame is not None:
+            return
+        self.first_frame = time.perf_counter() - self.start
+        self.print_report()
+
+    def to_dict(self):
+        with self._lock:
+            phases = [{'phase': n, 'start_s': round(o, 3), 'duration_s': round(d, 3)} for n, o, d in self.phases]
+        return {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'phases': phases,
+            'time_to_first_frame_s': round(self.first_frame, 3) if self.first_frame is not None else None,
+        }
+
+    def print_report(self):
+        report = self.to_dict()
+        print("--- Startup ---")
+        for p in report['phases']:
+            print(f"  {p['phase']:<18} +{p['start_s']:>7.3f}s  {p['duration_s']:>7.3f}s")
+        if report['time_to_first_frame_s'] is not None:
+            print(f"  time to first processed frame: {report['time_to_first_frame_s']:.3f}s")
+
+    def log(self, path):
+        """Appends the report as one JSON line (for tracking the KPI over time)."""
+        with open(path, 'a') as f:
+            f.write(json.dumps(self.to_dict()) + "\n")
+
+
+# Shared profiler for the running app
+startup = StartupProfiler()
+
+
+def configure_threads(n=None):
+    """
+    Sets CPU thread counts explicitly instead of relying on library defaults,
+    which oversubscribe when capture, drawing and inference share the cores.
+    n=None uses all cores for torch intra-op work.
+    """
+    n = n or os.cpu_count() or 1
+    try:
+        import torch
+        torch.set_num_threads(n)
+        try:
+            # Only allowed before any inter-op parallel work has started
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass
+    except ImportError:
+        pass
+    return n
+
+
+def add_startup_args(parser):
+    parser.add_argument('--threads', type=int, default=None,
+                        help="CPU threads for torch inference (default: all cores, split between --workers)")
+    parser.add_argument('--no-warmup', action='store_true',
+                        help="Skip the warm-up inference before opening the camera")
+    parser.add_argument('--startup-log', default=None,
+                        help="Append the startup breakdown as a JSON line to this file")
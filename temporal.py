@@ -0,0 +1,100 @@
+import numpy as np
+
+
+class FeatureWindow:
+    """
+    Sliding window over a per-frame feature vector (joint angles, keypoint
+    coordinates, ...), kept in a preallocated (window, dim) ring buffer.
+
+    push() updates the running sum, exponential average and velocities in
+    place in O(dim), no matter how long the window is, and never allocates.
+    min / max are reduced over the buffer on demand into preallocated arrays.
+
+    Statistics are returned as views of internal buffers: copy them if they
+    must survive the next push().
+    """
+    def __init__(self, dim, window=15, alpha=0.5):
+        self.dim = dim
+        self.window = window
+        self.alpha = alpha # EMA weight of the newest sample
+        self.buffer = np.zeros((window, dim), dtype=np.float64)
+        self.ema = np.zeros(dim, dtype=np.float64)
+        self.velocity = np.zeros(dim, dtype=np.float64) # Change since the previous frame
+        self.ema_velocity = np.zeros(dim, dtype=np.float64) # Smoothed per-frame change
+        self._sum = np.zeros(dim, dtype=np.float64)
+        self._mean = np.zeros(dim, dtype=np.float64)
+        self._min = np.zeros(dim, dtype=np.float64)
+        self._max = np.zeros(dim, dtype=np.float64)
+        self._scratch = np.zeros(dim, dtype=np.float64)
+        self.index = 0 # Slot the next sample goes into
+        self.count = 0 # All-time number of samples
+
+    def reset(self):
+        self.buffer.fill(0.0)
+        for arr in (self.ema, self.velocity, self.ema_velocity, self._sum):
+            arr.fill(0.0)
+        self.index = 0
+        self.count = 0
+
+    def push(self, x):
+        """Adds one (dim,) sample."""
+        slot = self.buffer[self.index]
+        latest = self.buffer[self.index - 1] # Previous sample (wraps to the end when index is 0)
+        scratch = self._scratch
+        if self.count == 0:
+            self.velocity.fill(0.0)
+            self.ema[:] = x
+        else:
+            np.subtract(x, latest, out=self.velocity)
+            # ema += alpha * (x - ema)
+            np.subtract(x, self.ema, out=scratch)
+            scratch *= self.alpha
+            self.ema += scratch
+            np.subtract(self.velocity, self.ema_velocity, out=scratch)
+            scratch *= self.alpha
+            self.ema_velocity += scratch
+
+        if self.count >= self.window:
+            self._sum -= slot # Sample falling out of the window
+        slot[:] = x
+        self._sum += slot
+        self.index = (self.index + 1) % self.window
+        self.count += 1
+        if self.index == 0:
+            # Once per lap, resum exactly so rounding error cannot accumulate
+            np.sum(self.buffer, axis=0, out=self._sum)
+
+    @property
+    def size(self):
+        """Samples currently in the window."""
+        return min(self.count, self.window)
+
+    @property
+    def full(self):
+        return self.count >= self.window
+
+    @property
+    def latest(self):
+        return self.buffer[self.index - 1]
+
+    @property
+    def mean(self):
+        if self.count:
+            np.divide(self._sum, self.size, out=self._mean)
+        return self._mean
+
+    @property
+    def minimum(self):
+        if self.count:
+            np.min(self.buffer[:self.size], axis=0, out=self._min)
+        return self._min
+
+    @property
+    def maximum(self):
+        if self.count:
+            np.max(self.buffer[:self.size], axis=0, out=self._max)
+        return self._max
+
+    def range(self):
+        """Peak-to-peak over the window (how much each feature moved recently)."""
+        return self.maximum - self.minimum
@@ -0,0 +1,50 @@
+import numpy as np
+
+from adaptive import AdaptiveEngine
+from tracker import PoseTracker
+
+# Two bright bodies (x1, y1, x2, y2) in a 640x480 frame
+BODIES = ((80, 100, 200, 440), (400, 90, 540, 450))
+
+
+class BlobEngine:
+    """
+    Stands in for PoseEngine: one pose per body, in the coordinates of
+    whatever frame it is handed, like the real model.
+    """
+    fixed_imgsz = False
+    imgsz = 640
+
+    def __init__(self):
+        self.sizes = []
+
+    def get_all_keypoints(self, frame):
+        h, w = frame.shape[:2]
+        self.sizes.append((w, h))
+        people = np.zeros((len(BODIES), 17, 3), dtype=np.float32)
+        for i, (x1, y1, x2, y2) in enumerate(BODIES):
+            t = np.linspace(0, 1, 17)
+            people[i, :, 0] = (x1 + (x2 - x1) * t) * w / 640
+            people[i, :, 1] = (y1 + (y2 - y1) * t[::-1]) * h / 480
+            people[i, :, 2] = 0.9
+        return people
+
+
+def test_input_downscale_keeps_full_frame_keypoints_and_ids():
+    model = BlobEngine()
+    engine = AdaptiveEngine({'m.pt': model})
+    tracker = PoseTracker()
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    reference = model.get_all_keypoints(frame)
+
+    ids = None
+    for scale in (1.0, 0.75, 0.5, 1.0):
+        engine.configure('m.pt', 640, 1, scale)
+        people = engine.get_all_keypoints(frame)
+        assert model.sizes[-1] == (int(640 * scale), int(480 * scale))
+        np.testing.assert_allclose(people, reference, atol=1e-3)
+
+        players = tracker.update(people)
+        if ids is None:
+            ids = sorted(players)
+        assert sorted(players) == ids
@@ -0,0 +1,52 @@
+import numpy as np
+
+from features import ANGLE_TRIPLETS, joint_angles, pose_features, with_mid_hip
+
+
+def reference_angle(a, b, c):
+    # The original per-call Exercise.calculate_angle
+    a, b, c = np.array(a[:2]), np.array(b[:2]), np.array(c[:2])
+    ba = a - b
+    bc = c - b
+    norm_ba = np.linalg.norm(ba)
+    norm_bc = np.linalg.norm(bc)
+    if norm_ba == 0 or norm_bc == 0:
+        return 0.0
+    cosine_angle = np.clip(np.dot(ba, bc) / (norm_ba * norm_bc), -1.0, 1.0)
+    return np.degrees(np.arccos(cosine_angle))
+
+
+def random_poses(n, seed=0):
+    rng = np.random.default_rng(seed)
+    poses = rng.uniform(0, 640, (n, 17, 3))
+    poses[..., 2] = rng.uniform(0, 1, (n, 17))
+    # Degenerate triplets: joints stacked on their vertex
+    poses[1, 8, :2] = poses[1, 6, :2]
+    poses[2, 14, :2] = poses[2, 12, :2]
+    # Integer pixel coordinates, as a rounded detector output would give
+    poses[3, :, :2] = np.round(poses[3, :, :2])
+    return poses
+
+
+def test_joint_angles_match_per_triplet_reference():
+    poses = with_mid_hip(random_poses(50))
+    angles = joint_angles(poses, ANGLE_TRIPLETS)
+    assert angles.shape == (50, len(ANGLE_TRIPLETS))
+    expected = np.array([[reference_angle(p[a], p[b], p[c]) for a, b, c in ANGLE_TRIPLETS] for p in poses])
+    np.testing.assert_allclose(angles, expected, rtol=0, atol=1e-9)
+    assert angles[1, 0] == 0.0 # (8, 6, 12) with the elbow on the shoulder
+
+
+def test_joint_angles_any_leading_shape():
+    poses = with_mid_hip(random_poses(12))
+    flat = joint_angles(poses, ANGLE_TRIPLETS)
+    np.testing.assert_array_equal(joint_angles(poses.reshape(3, 4, 18, 3), ANGLE_TRIPLETS),
+                                  flat.reshape(3, 4, -1))
+    np.testing.assert_array_equal(joint_angles(poses[5], ANGLE_TRIPLETS), flat[5])
+
+
+def test_pose_features_accepts_one_pose_or_a_batch():
+    poses = random_poses(8)
+    batch = pose_features(poses)
+    assert batch.shape == (8, 7) and batch.flags['C_CONTIGUOUS']
+    np.testing.assert_array_equal(pose_features(poses[2]), batch[2:3])
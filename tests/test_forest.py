@@ -0,0 +1,48 @@
+import os
+
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import train_test_split
+
+from dataset import load_training_arrays
+from features import ANGLE_COLUMNS
+from forest import CompiledForest
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Dataset')
+
+
+@pytest.fixture(scope='module')
+def split(tmp_path_factory):
+    if not os.path.isdir(DATA_DIR):
+        pytest.skip("Dataset/ not available")
+    # Same split as train_model.train(), cache kept out of the repo
+    X, y = load_training_arrays(ANGLE_COLUMNS, data_dir=DATA_DIR,
+                                cache_dir=str(tmp_path_factory.mktemp('cache')))
+    return train_test_split(X, y, test_size=0.2, random_state=42)
+
+
+@pytest.fixture(scope='module')
+def model(split):
+    X_train, _, y_train, _ = split
+    return RandomForestClassifier(n_estimators=25, random_state=42, n_jobs=1).fit(X_train, y_train)
+
+
+def test_compiled_forest_matches_sklearn(split, model):
+    X_test = split[1]
+    forest = CompiledForest.from_sklearn(model)
+    np.testing.assert_allclose(forest.predict_proba(X_test), model.predict_proba(X_test), rtol=0, atol=1e-12)
+    np.testing.assert_array_equal(forest.predict(X_test), model.predict(X_test))
+
+    labels, confidences = forest.classify(X_test)
+    np.testing.assert_array_equal(labels, model.predict(X_test))
+    np.testing.assert_allclose(confidences, model.predict_proba(X_test).max(axis=1), rtol=0, atol=1e-12)
+
+
+def test_compiled_forest_survives_save_and_load(split, model, tmp_path):
+    X_test = split[1]
+    path = str(tmp_path / 'forest.npz')
+    CompiledForest.from_sklearn(model).save(path)
+    forest = CompiledForest.load(path)
+    np.testing.assert_array_equal(forest.predict(X_test), model.predict(X_test))
+    np.testing.assert_allclose(forest.predict_proba(X_test), model.predict_proba(X_test), rtol=0, atol=1e-12)
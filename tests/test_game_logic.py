@@ -0,0 +1,146 @@
+import numpy as np
+import pytest
+
+from game_logic import BicepCurl, ExerciseBank
+from rules import BICEP_CURL, RULES, RuleExercise, RuleSet
+from test_features import reference_angle
+
+
+class ReferenceCurl:
+    """
+    The original per-object BicepCurl.update(), plus the EMA smoothing
+    (first sample initialises it) that the bank applies.
+    """
+    def __init__(self, smoothing=None):
+        self.reps = 0
+        self.score = 0
+        self.state = "extension"
+        self.is_correct_form = True
+        self.feedback = "Get Ready"
+        self.energy = 100.0
+        self.smoothing = smoothing
+        self.ema = None
+
+    def update(self, kp):
+        for idx in (6, 8, 10, 12):
+            if kp[idx][2] < 0.5:
+                self.feedback = "Camera Obstructed"
+                self.is_correct_form = False
+                return
+        s, e, w, h = kp[6], kp[8], kp[10], kp[12]
+        angles = np.array([reference_angle(h, s, e), reference_angle(s, e, w)])
+        if self.smoothing:
+            self.ema = angles if self.ema is None else self.ema + (angles - self.ema) * self.smoothing
+            angles = self.ema
+        flare, curl = angles
+
+        if flare > 20:
+            self.is_correct_form = False
+            self.feedback = "Tuck Your Elbow!"
+            self.energy -= 0.5
+        else:
+            self.is_correct_form = True
+            self.feedback = "Good Form"
+            self.energy = min(100, self.energy + 0.2)
+
+        if self.state == "extension":
+            if curl < 40 and self.is_correct_form:
+                self.state = "flexion"
+                self.reps += 1
+                self.score += 100
+        elif self.state == "flexion":
+            if curl > 160:
+                self.state = "extension"
+
+        if self.energy < 0:
+            self.energy = 0
+            self.feedback = "FATIGUE / BAD FORM"
+
+
+def curl_sessions(players=6, frames=600, seed=0):
+    """
+    (frames, players, 17, 3) poses of people curling at their own pace, with
+    elbow flare bursts (bad form, energy drain) and dropped joints.
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(frames)[:, None]
+    period = rng.uniform(20, 60, players)
+    phase = rng.uniform(0, 2 * np.pi, players)
+    curl = np.radians(95 + 80 * np.cos(2 * np.pi * t / period + phase))
+    flare = np.radians(np.where(rng.random((frames, players)) < 0.3, 35.0, 8.0)
+                       + rng.normal(0, 4, (frames, players)))
+
+    kp = np.zeros((frames, players, 17, 3))
+    kp[..., 2] = 0.9
+    shoulder = np.array([300.0, 200.0]) + rng.normal(0, 2, (frames, players, 2))
+    kp[..., 6, :2] = shoulder
+    kp[..., 12, :2] = shoulder + [0.0, 200.0]
+    upper = np.stack([np.sin(flare), np.cos(flare)], axis=-1)
+    kp[..., 8, :2] = shoulder + 120 * upper
+    # Forearm: the upper arm direction (elbow to shoulder) turned by the curl angle
+    back = -upper
+    c, s = np.cos(curl), np.sin(curl)
+    forearm = np.stack([c * back[..., 0] - s * back[..., 1], s * back[..., 0] + c * back[..., 1]], axis=-1)
+    kp[..., 10, :2] = kp[..., 8, :2] + 100 * forearm
+    kp[..., :, :2] += rng.normal(0, 1.5, (frames, players, 17, 2))
+    kp[rng.random((frames, players)) < 0.05, 10, 2] = 0.2 # Wrist lost
+    return kp.astype(np.float32)
+
+
+def state_of(game):
+    return (game.reps, game.score, game.state, game.feedback, game.is_correct_form)
+
+
+@pytest.mark.parametrize('smoothing', [None, 0.3])
+def test_bank_matches_per_object_bicep_curl(smoothing):
+    sessions = curl_sessions()
+    players = sessions.shape[1]
+    bank = ExerciseBank(2) # Grows while allocating
+    games = [BicepCurl(smoothing, bank=bank) for _ in range(players)]
+    refs = [ReferenceCurl(smoothing) for _ in range(players)]
+    rng = np.random.default_rng(1)
+
+    for kp in sessions:
+        # Players step out of frame now and then: update a subset
+        idx = np.flatnonzero(rng.random(players) < 0.8)
+        bank.update_curls([games[i].slot for i in idx], kp[idx])
+        for i in idx:
+            refs[i].update(kp[i])
+        for game, ref in zip(games, refs):
+            assert state_of(game) == state_of(ref)
+            assert game.energy == pytest.approx(ref.energy)
+
+    assert sum(g.reps for g in games) > 10
+    assert {g.feedback for g in games} >= {"Good Form", "Tuck Your Elbow!"}
+
+
+def test_single_bicep_curl_update_uses_its_own_slot():
+    sessions = curl_sessions(players=2, frames=200)
+    bank = ExerciseBank()
+    a, b = BicepCurl(bank=bank), BicepCurl(bank=bank)
+    ref = ReferenceCurl()
+    for kp in sessions:
+        a.update(kp[0])
+        ref.update(kp[0])
+    assert state_of(a) == state_of(ref)
+    assert (b.reps, b.feedback) == (0, "Get Ready")
+
+
+@pytest.mark.parametrize('rules', [RuleSet([BICEP_CURL]), RULES], ids=['alone', 'all_rules'])
+@pytest.mark.parametrize('smoothing', [None, 0.3])
+def test_bicep_curl_rule_matches_bicep_curl(rules, smoothing):
+    sessions = curl_sessions(seed=2)
+    players = sessions.shape[1]
+    curls = ExerciseBank()
+    ruled = ExerciseBank()
+    games = [BicepCurl(smoothing, bank=curls) for _ in range(players)]
+    rule_games = [RuleExercise('bicep_curl', rules=rules, smoothing=smoothing, bank=ruled)
+                  for _ in range(players)]
+
+    for kp in sessions:
+        curls.update_curls([g.slot for g in games], kp)
+        rules.update(ruled, [g.slot for g in rule_games], kp)
+        assert [state_of(g) for g in rule_games] == [state_of(g) for g in games]
+        np.testing.assert_array_equal([g.energy for g in rule_games], [g.energy for g in games])
+        np.testing.assert_array_equal([g.current_angle for g in rule_games], [g.current_angle for g in games])
+    assert sum(g.reps for g in games) > 10
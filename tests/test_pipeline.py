@@ -0,0 +1,22 @@
+import numpy as np
+
+from pipeline import Pipeline, SyntheticSource
+
+
+def test_render_never_draws_on_inference_frames():
+    # render() marks the pixel it draws on; process() must never see a mark
+    marked = []
+
+    def process(frame):
+        marked.append(bool(frame[0, 0, 0] == 255 and frame[0, 0, 1] == 0))
+        return None
+
+    def render(frame, result):
+        frame[0, 0] = (255, 0, 0)
+        return frame
+
+    source = SyntheticSource(64, 48, count=300, fps=100)
+    source._base[:] = 7 # Never (255, 0, 0) by itself
+    Pipeline(source, process, render).run()
+    assert marked
+    assert not any(marked)
@@ -0,0 +1,33 @@
+import pytest
+
+from game_logic import BicepCurl
+from replay import apply_overrides
+
+
+@pytest.fixture
+def thresholds():
+    saved = {name: getattr(BicepCurl, name) for name in ('FLARE_LIMIT', 'CURLED_ANGLE', 'EXTENDED_ANGLE')}
+    yield
+    for name, value in saved.items():
+        setattr(BicepCurl, name, value)
+
+
+def test_overrides_set_tunable_thresholds(thresholds):
+    apply_overrides(['BicepCurl.FLARE_LIMIT=22.5', 'BicepCurl.EXTENDED_ANGLE=150'])
+    assert BicepCurl.FLARE_LIMIT == 22.5
+    assert BicepCurl.EXTENDED_ANGLE == 150.0
+
+
+@pytest.mark.parametrize('item', [
+    'BicepCurl.KP_R_SHOULDER=5', # Numeric, but a keypoint index
+    'BicepCurl.REQUIRED=1',
+    'ExerciseBank.MAX_ANGLES=8',
+    'BicepCurl.NOPE=1',
+    'BicepCurl.FLARE_LIMIT',
+    'BicepCurl.FLARE_LIMIT=wide',
+])
+def test_overrides_reject_everything_else(thresholds, item):
+    with pytest.raises(ValueError):
+        apply_overrides([item])
+    assert BicepCurl.KP_R_SHOULDER == 6
+    assert BicepCurl.FLARE_LIMIT == 20
@@ -0,0 +1,49 @@
+import numpy as np
+
+from forest import GatedClassifier
+from server import MicroBatcher, Session
+
+
+class CountingModel:
+    classes = np.array(['bicep_curl_up', 'squats_down'])
+
+    def __init__(self):
+        self.rows = 0
+
+    def classify(self, X):
+        self.rows += len(X)
+        return self.classes[np.zeros(len(X), dtype=np.intp)], np.full(len(X), 0.9)
+
+
+class Writer:
+    class transport:
+        @staticmethod
+        def get_write_buffer_size():
+            return 0
+
+    def __init__(self):
+        self.messages = 0
+
+    def write(self, data):
+        self.messages += 1
+
+
+def test_closed_classifier_sessions_leave_no_gate_state():
+    model = CountingModel()
+    clf = GatedClassifier(model)
+    batcher = MicroBatcher(engine=None, clf=clf)
+    try:
+        live = Session(1, Writer(), 'classifier', batcher.curls)
+        gone = Session(2, Writer(), 'classifier', batcher.curls)
+        gone.closed = True # Closed while its frame was being inferred
+
+        person = np.random.default_rng(0).uniform(100, 400, (1, 17, 3)).astype(np.float32)
+        person[..., 2] = 0.9
+        batch = [(live, ({'seq': 1}, b'', 0.0)), (gone, ({'seq': 1}, b'', 0.0))]
+        batcher._apply(batch, [person, person], 0.01)
+
+        assert set(clf._last) == {live.id}
+        assert model.rows == 1
+        assert live.writer.messages == 1 and gone.writer.messages == 0
+    finally:
+        batcher.close()
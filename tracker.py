@@ -0,0 +1,182 @@
+import numpy as np
+
+class PoseTracker:
+    """
+    Associates pose detections across frames and assigns persistent player IDs.
+
+    ultralytics returns detections in no particular order, so without this the
+    per-player game state would flip between bodies whenever two people are in
+    frame. All track-vs-detection scoring is done on (M, N) arrays in one pass;
+    the assignment itself is a mutual-best-match loop whose rounds each handle
+    every track at once, so cost stays flat as a group class grows.
+    """
+    def __init__(self, conf_threshold=0.5, min_similarity=0.2, max_missed=30,
+                 iou_weight=0.5, kp_sigma=0.25):
+        self.conf_threshold = conf_threshold
+        self.min_similarity = min_similarity # Below this a pair is never matched
+        self.max_missed = max_missed         # Frames a track survives without a match
+        self.iou_weight = iou_weight         # Blend between box IoU and keypoint similarity
+        self.kp_sigma = kp_sigma             # Keypoint distance tolerance, relative to body size
+
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.keypoints = np.zeros((0, 17, 3), dtype=np.float32)
+        self.boxes = np.zeros((0, 4), dtype=np.float32)
+        self.missed = np.zeros(0, dtype=np.int64)
+        self.expired = [] # IDs dropped during the last update()
+        self._next_id = 1
+
+    def _boxes(self, keypoints):
+        """
+        Bounding boxes (x1, y1, x2, y2) of the confident keypoints of each pose.
+        Poses with no confident keypoints get a degenerate all-NaN box.
+        """
+        visible = keypoints[..., 2] > self.conf_threshold
+        x = keypoints[..., 0]
+        y = keypoints[..., 1]
+        with np.errstate(invalid='ignore'):
+            boxes = np.stack([
+                np.where(visible, x, np.inf).min(axis=1),
+                np.where(visible, y, np.inf).min(axis=1),
+                np.where(visible, x, -np.inf).max(axis=1),
+                np.where(visible, y, -np.inf).max(axis=1),
+            ], axis=1)
+        boxes[~visible.any(axis=1)] = np.nan
+        return boxes
+
+    def similarity(self, track_kps, track_boxes, det_kps, det_boxes):
+        """
+        (M, N) similarity between M tracks and N detections in [0, 1].
+        """
+        # Box IoU
+        tl = np.maximum(track_boxes[:, None, :2], det_boxes[None, :, :2])
+        br = np.minimum(track_boxes[:, None, 2:], det_boxes[None, :, 2:])
+        inter = np.clip(br - tl, 0, None).prod(axis=2)
+        area_t = (track_boxes[:, 2:] - track_boxes[:, :2]).prod(axis=1)
+        area_d = (det_boxes[:, 2:] - det_boxes[:, :2]).prod(axis=1)
+        union = area_t[:, None] + area_d[None, :] - inter
+        with np.errstate(invalid='ignore', divide='ignore'):
+            iou = np.where(union > 0, inter / union, 0.0)
+
+        # Keypoint similarity (OKS-style): mean Gaussian of joint distances,
+        # normalised by the track's body size, over joints visible in both
+        both = (track_kps[:, None, :, 2] > self.conf_threshold) & (det_kps[None, :, :, 2] > self.conf_threshold)
+        d2 = ((track_kps[:, None, :, :2] - det_kps[None, :, :, :2]) ** 2).sum(axis=3)
+        scale2 = np.maximum(area_t, 1.0)[:, None, None] * self.kp_sigma ** 2
+        with np.errstate(invalid='ignore'):
+            per_joint = np.exp(-d2 / (2 * scale2))
+        n_both = both.sum(axis=2)
+        kp_sim = np.where(both, per_joint, 0.0).sum(axis=2) / np.maximum(n_both, 1)
+
+        sim = self.iou_weight * iou + (1 - self.iou_weight) * kp_sim
+        return np.nan_to_num(sim, nan=0.0)
+
+    def _assign(self, sim):
+        """
+        Greedy mutual-best assignment. Each round matches every (track, det)
+        pair that are each other's best remaining option, then removes them.
+        Returns (track_rows, det_cols).
+        """
+        sim = np.where(sim >= self.min_similarity, sim, -1.0)
+        rows_out = []
+        cols_out = []
+        m = sim.shape[0]
+        if m == 0 or sim.shape[1] == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        rows = np.arange(m)
+        while True:
+            best_det = sim.argmax(axis=1)
+            best_trk = sim.argmax(axis=0)
+            mutual = (best_trk[best_det] == rows) & (sim[rows, best_det] > 0)
+            if not mutual.any():
+                break
+            r = rows[mutual]
+            c = best_det[mutual]
+            rows_out.append(r)
+            cols_out.append(c)
+            sim[r, :] = -1.0
+            sim[:, c] = -1.0
+        if not rows_out:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.concatenate(rows_out), np.concatenate(cols_out)
+
+    def update(self, detections):
+        """
+        Args:
+            detections (np.ndarray): (N, 17, 3) keypoints for this frame, or None.
+        Returns:
+            dict: {player_id: (17, 3) keypoints} for every player seen this frame.
+        """
+        if detections is None:
+            detections = np.zeros((0, 17, 3), dtype=np.float32)
+        detections = np.asarray(detections, dtype=np.float32).reshape(-1, 17, 3)
+        det_boxes = self._boxes(detections)
+
+        sim = self.similarity(self.keypoints, self.boxes, detections, det_boxes)
+        rows, cols = self._assign(sim)
+
+        # Matched tracks take the new detection
+        self.keypoints[rows] = detections[cols]
+        self.boxes[rows] = det_boxes[cols]
+        self.missed += 1
+        self.missed[rows] = 0
+
+        # Unmatched detections start new tracks
+        new = np.ones(len(detections), dtype=bool)
+        new[cols] = False
+        n_new = int(new.sum())
+        if n_new:
+            new_ids = np.arange(self._next_id, self._next_id + n_new)
+            self._next_id += n_new
+            self.ids = np.concatenate([self.ids, new_ids])
+            self.keypoints = np.concatenate([self.keypoints, detections[new]])
+            self.boxes = np.concatenate([self.boxes, det_boxes[new]])
+            self.missed = np.concatenate([self.missed, np.zeros(n_new, dtype=np.int64)])
+
+        # Expire tracks that have been lost for too long
+        alive = self.missed <= self.max_missed
+        self.expired = self.ids[~alive].tolist()
+        if not alive.all():
+            self.ids = self.ids[alive]
+            self.keypoints = self.keypoints[alive]
+            self.boxes = self.boxes[alive]
+            self.missed = self.missed[alive]
+
+        visible = np.flatnonzero(self.missed == 0)
+        # Copies, so callers on other threads never see the next update in place
+        return {int(self.ids[i]): self.keypoints[i].copy() for i in visible}
+
+    def primary_id(self):
+        """
+        The longest-tracked player currently in view (lowest ID), or None.
+        Single-player UIs lock onto this one.
+        """
+        visible = self.ids[self.missed == 0]
+        if len(visible) == 0:
+            return None
+        return int(visible.min())
+
+
+class PlayerGames:
+    """
+    Keeps a separate game-state object per tracked player ID.
+    factory() builds the state for a newly seen player (e.g. BicepCurl).
+    """
+    def __init__(self, factory):
+        self.factory = factory
+        self.games = {}
+
+    def sync(self, players, expired=()):
+        """
+        Creates state for new IDs in `players` and drops state for expired IDs.
+        """
+        for pid in expired:
+            self.games.pop(pid, None)
+        for pid in players:
+            if pid not in self.games:
+                self.games[pid] = self.factory()
+
+    def get(self, pid):
+        return self.games.get(pid)
+
+    def __len__(self):
+        return len(self.games)
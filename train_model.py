@@ -1,62 +1,132 @@
-import pandas as pd
-from sklearn.model_selection import train_test_split
+import argparse
+from sklearn.model_selection import GridSearchCV, ParameterGrid, StratifiedKFold, cross_val_score, train_test_split
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import classification_report, accuracy_score
 import joblib
+import numpy as np
 import os
+import time
+
+from augment import augmented_chunks, frontal_features, load_poses_3d
+from dataset import DATA_DIR, build_cache, load_training_arrays
+from features import ANGLE_COLUMNS
+from forest import CompiledForest, check_parity, compiled_path
 
 # Define paths
-DATA_DIR = 'Dataset'
 LABELS_FILE = os.path.join(DATA_DIR, 'labels.csv')
 ANGLES_FILE = os.path.join(DATA_DIR, 'angles.csv')
 LANDMARKS_FILE = os.path.join(DATA_DIR, 'landmarks.csv')
 DISTANCES_3D_FILE = os.path.join(DATA_DIR, '3d_distances.csv')
 XYZ_DISTANCES_FILE = os.path.join(DATA_DIR, 'xyz_distances.csv')
 MODEL_FILE = 'exercise_classifier.pkl'
+FOREST_FILE = compiled_path(MODEL_FILE) # Array-backed copy used at runtime
+
+# Hyperparameters searched by --search
+PARAM_GRID = {
+    'n_estimators': [100, 200, 400],
+    'max_depth': [None, 12, 20],
+    'min_samples_leaf': [1, 2, 4],
+    'max_features': ['sqrt', 0.5],
+}
+
+# Candidates compared by --select: family and constructor parameters.
+# Forests are served compiled (forest.py), everything else as its sklearn pickle.
+SELECT_CANDIDATES = {
+    'rf100':      ('forest', {'n_estimators': 100}),
+    'rf100_d16':  ('forest', {'n_estimators': 100, 'max_depth': 16}),
+    'rf50_d12':   ('forest', {'n_estimators': 50, 'max_depth': 12}),
+    'rf25_d10':   ('forest', {'n_estimators': 25, 'max_depth': 10}),
+    'rf10_d8':    ('forest', {'n_estimators': 10, 'max_depth': 8}),
+    'hgb100':     ('boosting', {'max_iter': 100}),
+    'hgb50_d6':   ('boosting', {'max_iter': 50, 'max_depth': 6}),
+    'logreg':     ('linear', {'max_iter': 2000}),
+    'knn5':       ('knn', {'n_neighbors': 5}),
+}
+# Default --latency-budget-ms: per-call latency of one classify() on a single row
+LATENCY_BUDGET_MS = 1.0
 
-def load_data():
+# Augmented training (--augment): samples per streamed chunk, and the leaf size
+# that keeps forests grown on millions of rows small enough for the runtime
+AUGMENT_CHUNK = 100_000
+AUGMENT_MIN_LEAF = 50
+
+def load_data(use_cache=True):
+    """
+    (X, y): features in ANGLE_COLUMNS order, exactly what
+    features.pose_features() produces at runtime, and the pose labels.
+    Read from the binary dataset cache, which is rebuilt from the CSVs
+    whenever they change.
+    """
     print("Loading datasets...")
     try:
-        labels_df = pd.read_csv(LABELS_FILE)
-        angles_df = pd.read_csv(ANGLES_FILE)
-        # Optional: Load other features if needed
-        # landmarks_df = pd.read_csv(LANDMARKS_FILE)
-        # dist_3d_df = pd.read_csv(DISTANCES_3D_FILE)
-        # xyz_dist_df = pd.read_csv(XYZ_DISTANCES_FILE)
-        
-        # Merge datasets
-        # Start with labels and angles (usually most critical)
-        merged_df = pd.merge(labels_df, angles_df, on='pose_id')
-        
         # NOTE: We are intentionally excluding 3d_distances.csv and landmarks.csv (which has Z)
         # because the YOLO model (yolo26n-pose) provides 2D keypoints.
         # Training on 3D data would make the model fail or perform poorly at inference time.
-        
-        return merged_df
+        return load_training_arrays(ANGLE_COLUMNS, use_cache=use_cache)
     except Exception as e:
         print(f"Error loading data: {e}")
         return None
 
-def train():
-    df = load_data()
-    if df is None:
+def cross_validate(params, X, y, folds, jobs):
+    """
+    Stratified k-fold accuracy of a forest with `params`, folds run in parallel.
+    """
+    cv = StratifiedKFold(n_splits=folds, shuffle=True, random_state=42)
+    clf = RandomForestClassifier(random_state=42, n_jobs=1, **params)
+    start = time.perf_counter()
+    scores = cross_val_score(clf, X, y, cv=cv, n_jobs=jobs)
+    print(f"{folds}-fold CV accuracy: {scores.mean():.4f} +/- {scores.std():.4f} "
+          f"({time.perf_counter() - start:.1f}s)")
+    return scores
+
+def search(X, y, folds, jobs):
+    """
+    Grid search over PARAM_GRID with stratified k-fold CV. Every
+    (candidate, fold) fit is an independent job spread across `jobs` workers;
+    the forests themselves stay single-threaded so cores are not oversubscribed.
+    Returns the best parameters.
+    """
+    cv = StratifiedKFold(n_splits=folds, shuffle=True, random_state=42)
+    grid = GridSearchCV(RandomForestClassifier(random_state=42, n_jobs=1), PARAM_GRID,
+                        cv=cv, scoring='accuracy', n_jobs=jobs, refit=False)
+    print(f"Searching {len(ParameterGrid(PARAM_GRID))} candidates x {folds} folds...")
+    start = time.perf_counter()
+    grid.fit(X, y)
+    print(f"Search done in {time.perf_counter() - start:.1f}s")
+
+    results = grid.cv_results_
+    ranked = sorted(range(len(results['params'])), key=lambda i: results['rank_test_score'][i])
+    print("Top candidates:")
+    for i in ranked[:5]:
+        print(f"  {results['mean_test_score'][i]:.4f} +/- {results['std_test_score'][i]:.4f}  {results['params'][i]}")
+    return grid.best_params_
+
+def train(folds=0, do_search=False, jobs=-1, use_cache=True):
+    data = load_data(use_cache)
+    if data is None:
         return
+    X, y = data
 
-    print(f"Data loaded. Shape: {df.shape}")
-    
-    # Separate features and target
-    # Assuming 'pose' is the target column in labels.csv
-    X = df.drop(columns=['pose_id', 'pose'])
-    y = df['pose']
+    print(f"Data loaded. Shape: {X.shape}")
     
     # Split data
     print("Splitting data...")
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+
+    params = {'n_estimators': 100}
+    if do_search:
+        # Tune on the training split only, the test split stays unseen
+        params = search(X_train, y_train, folds or 5, jobs)
+        print(f"Best parameters: {params}")
+    if folds:
+        cross_validate(params, X, y, folds, jobs)
     
     # Train model
     print("Training Random Forest Classifier...")
-    clf = RandomForestClassifier(n_estimators=100, random_state=42)
+    clf = RandomForestClassifier(random_state=42, n_jobs=jobs, **params)
     clf.fit(X_train, y_train)
+    # Single-threaded prediction at runtime: the per-frame batch is tiny
+    clf.set_params(n_jobs=None)
     
     # Evaluate
     print("Evaluating model...")
@@ -69,7 +139,284 @@ def train():
     # Save model
     print(f"Saving model to {MODEL_FILE}...")
     joblib.dump(clf, MODEL_FILE)
+    export_forest(clf, X_test)
+    print("Done.")
+
+def train_augmented(n_samples, chunk_size=AUGMENT_CHUNK, min_leaf=AUGMENT_MIN_LEAF,
+                    n_estimators=100, jobs=-1, seed=None, use_cache=True):
+    """
+    Trains on 2D angle features of the 3D landmarks seen from random cameras
+    (augment.py), i.e. what pose_features() computes from a detector at
+    runtime. The `n_samples` augmented rows are streamed in chunks: each chunk
+    (plus the original views of the training poses) grows its share of the
+    forest's trees with warm_start, so only one chunk is ever in memory.
+    Held-out poses are evaluated on their original view and on random views.
+    """
+    print("Loading 3D landmarks...")
+    try:
+        poses, y = load_poses_3d(use_cache=use_cache)
+    except Exception as e:
+        print(f"Error loading data: {e}")
+        return
+    train_idx, test_idx = train_test_split(np.arange(len(y)), test_size=0.2, random_state=42)
+    X_front = frontal_features(poses[train_idx])
+    y_front = y[train_idx]
+
+    chunks = -(-n_samples // chunk_size)
+    if chunks > n_estimators:
+        # Every chunk must grow at least one tree, or warm_start drops its data
+        chunk_size = -(-n_samples // n_estimators)
+        chunks = -(-n_samples // chunk_size)
+        print(f"More chunks than trees: growing chunks to {chunk_size} samples")
+    print(f"Training on {len(train_idx)} poses + {n_samples} augmented views "
+          f"({chunks} chunks of <= {chunk_size})...")
+    clf = RandomForestClassifier(n_estimators=0, min_samples_leaf=min_leaf, warm_start=True,
+                                 random_state=42, n_jobs=jobs)
+    start = time.perf_counter()
+    stream = augmented_chunks(poses[train_idx], y_front, n_samples, chunk_size, seed=seed)
+    for k, (X_aug, y_aug) in enumerate(stream):
+        # Spread the trees evenly, the remainder goes to the first chunks
+        clf.n_estimators += n_estimators // chunks + (k < n_estimators % chunks)
+        clf.fit(np.concatenate([X_front, X_aug]), np.concatenate([y_front, y_aug]))
+        print(f"  chunk {k + 1}/{chunks}: {clf.n_estimators} trees ({time.perf_counter() - start:.1f}s)")
+    clf.set_params(n_jobs=None, warm_start=False)
+
+    print("Evaluating model...")
+    X_test = frontal_features(poses[test_idx])
+    y_test = y[test_idx]
+    X_views, y_views = next(augmented_chunks(poses[test_idx], y_test, 20 * len(test_idx), seed=0))
+    print(f"Accuracy (original view): {accuracy_score(y_test, clf.predict(X_test)):.4f}")
+    print(f"Accuracy (random views):  {accuracy_score(y_views, clf.predict(X_views)):.4f}")
+    print("\nClassification Report (random views):")
+    print(classification_report(y_views, clf.predict(X_views)))
+
+    print(f"Saving model to {MODEL_FILE}...")
+    joblib.dump(clf, MODEL_FILE)
+    export_forest(clf, X_views)
+    print("Done.")
+
+def make_candidate(family, params, jobs=-1):
+    """
+    Unfitted estimator for a SELECT_CANDIDATES entry. Scale-sensitive
+    families get a StandardScaler in front.
+    """
+    from sklearn.ensemble import HistGradientBoostingClassifier
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.neighbors import KNeighborsClassifier
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import StandardScaler
+    if family == 'forest':
+        return RandomForestClassifier(random_state=42, n_jobs=jobs, **params)
+    if family == 'boosting':
+        return HistGradientBoostingClassifier(random_state=42, **params)
+    if family == 'linear':
+        return make_pipeline(StandardScaler(), LogisticRegression(**params))
+    if family == 'knn':
+        return make_pipeline(StandardScaler(), KNeighborsClassifier(**params))
+    raise ValueError(f"Unknown model family {family!r}")
+
+def _best_time(fn, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def measure_runtime(clf, X, workdir, name, single_calls=200, batch=1024):
+    """
+    Serializes clf the way main_with_classifier.py loads it (compiled forest
+    for random forests, joblib pickle otherwise) and measures, single-threaded:
+    file size, load time, the latency of one classify() call on one row
+    (median) and the per-sample cost of a batched call.
+    """
+    from forest import SklearnClassifier
+    if isinstance(clf, RandomForestClassifier):
+        path = os.path.join(workdir, name + '.npz')
+        CompiledForest.from_sklearn(clf).save(path)
+        load = lambda: CompiledForest.load(path)
+        fmt = 'npz'
+    else:
+        path = os.path.join(workdir, name + '.pkl')
+        joblib.dump(clf, path)
+        load = lambda: SklearnClassifier(joblib.load(path))
+        fmt = 'pickle'
+    load_s = _best_time(load, 3)
+    model = load()
+
+    rows = X[np.arange(single_calls) % len(X)]
+    model.classify(rows[:1]) # First call pays lazy initialisation
+    single = []
+    for i in range(single_calls):
+        start = time.perf_counter()
+        model.classify(rows[i:i + 1])
+        single.append(time.perf_counter() - start)
+    X_batch = X[np.arange(batch) % len(X)]
+    batch_s = _best_time(lambda: model.classify(X_batch), 3)
+
+    return {
+        'format': fmt,
+        'size_kb': round(os.path.getsize(path) / 1024.0, 1),
+        'load_ms': round(1000.0 * load_s, 2),
+        'single_ms': round(1000.0 * float(np.median(single)), 3),
+        'batch_us': round(1e6 * batch_s / batch, 2),
+    }
+
+def pareto_front(results):
+    """
+    Names of the candidates no other candidate beats on accuracy, single-row
+    latency and size at once.
+    """
+    def dominates(a, b):
+        better_or_equal = (a['accuracy'] >= b['accuracy'] and a['single_ms'] <= b['single_ms']
+                           and a['size_kb'] <= b['size_kb'])
+        strictly = (a['accuracy'] > b['accuracy'] or a['single_ms'] < b['single_ms']
+                    or a['size_kb'] < b['size_kb'])
+        return better_or_equal and strictly
+    return {r['name'] for r in results if not any(dominates(o, r) for o in results)}
+
+def select(budget_ms=LATENCY_BUDGET_MS, candidates=None, jobs=-1, use_cache=True, report_path=None):
+    """
+    Trains every candidate on the training split, measures accuracy on the
+    test split next to its runtime cost, prints a Pareto report and saves
+    the most accurate model whose single-row latency fits budget_ms
+    (ties go to the faster one) for main_with_classifier.py.
+    """
+    import json
+    import tempfile
+
+    data = load_data(use_cache)
+    if data is None:
+        return
+    X, y = data
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    names = candidates or list(SELECT_CANDIDATES)
+
+    results, models = [], {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in names:
+            family, params = SELECT_CANDIDATES[name]
+            clf = make_candidate(family, params, jobs)
+            start = time.perf_counter()
+            clf.fit(X_train, y_train)
+            fit_s = time.perf_counter() - start
+            if isinstance(clf, RandomForestClassifier):
+                clf.set_params(n_jobs=None) # Single-threaded prediction, as at runtime
+            result = {'name': name, 'family': family, 'params': params,
+                      'accuracy': round(accuracy_score(y_test, clf.predict(X_test)), 4),
+                      'fit_s': round(fit_s, 2)}
+            result.update(measure_runtime(clf, X_test, workdir, name))
+            print(f"  {name:<10} accuracy {result['accuracy']:.4f}  {result['single_ms']:.3f} ms/call")
+            results.append(result)
+            models[name] = clf
+
+    front = pareto_front(results)
+    fits = [r for r in results if r['single_ms'] <= budget_ms]
+    if fits:
+        chosen = max(fits, key=lambda r: (r['accuracy'], -r['single_ms']))
+    else:
+        chosen = min(results, key=lambda r: r['single_ms'])
+        print(f"No candidate fits {budget_ms} ms, taking the fastest.")
+
+    print(f"\nModel selection (test split of {len(y_test)} samples, budget {budget_ms} ms per call, "
+          "* = Pareto-optimal on accuracy / latency / size, > = selected):")
+    print(f"    {'model':<10} {'accuracy':>8} {'1-row ms':>9} {'batch us':>9} {'load ms':>8} "
+          f"{'size kB':>9} {'format':>7} {'fit s':>6}")
+    for r in sorted(results, key=lambda r: -r['accuracy']):
+        mark = ('>' if r is chosen else ' ') + ('*' if r['name'] in front else ' ')
+        print(f"  {mark}{r['name']:<10} {r['accuracy']:>8.4f} {r['single_ms']:>9.3f} {r['batch_us']:>9.2f} "
+              f"{r['load_ms']:>8.2f} {r['size_kb']:>9.1f} {r['format']:>7} {r['fit_s']:>6.2f}")
+    if report_path:
+        with open(report_path, 'w') as f:
+            json.dump({'budget_ms': budget_ms, 'test_samples': len(y_test), 'selected': chosen['name'],
+                       'pareto': sorted(front), 'candidates': results}, f, indent=2)
+        print(f"Report written to {report_path}")
+
+    clf = models[chosen['name']]
+    print(f"\nSelected {chosen['name']}. Saving model to {MODEL_FILE}...")
+    joblib.dump(clf, MODEL_FILE)
+    if isinstance(clf, RandomForestClassifier):
+        export_forest(clf, X_test)
+    elif os.path.exists(FOREST_FILE):
+        # A compiled forest from an earlier run must not shadow the new model
+        print(f"Removing stale {FOREST_FILE}.")
+        os.remove(FOREST_FILE)
     print("Done.")
 
+def export_forest(clf, X_check):
+    """
+    Flattens the forest into NumPy node arrays for the runtime evaluator and
+    verifies it reproduces sklearn's labels and probabilities on X_check.
+    The compiled file is only kept if it matches exactly.
+    """
+    print(f"Compiling forest to {FOREST_FILE}...")
+    forest = CompiledForest.from_sklearn(clf)
+    forest.save(FOREST_FILE)
+
+    # Check the saved file, not the in-memory copy
+    mismatches, max_diff = check_parity(clf, CompiledForest.load(FOREST_FILE), X_check)
+    print(f"Parity vs sklearn on {len(X_check)} samples: "
+          f"{mismatches} label mismatches, max proba diff {max_diff:.2e}")
+    if mismatches or max_diff > 1e-9:
+        print("Parity check FAILED, removing compiled forest (runtime will use the pickle).")
+        os.remove(FOREST_FILE)
+        return False
+    return True
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train the exercise classifier")
+    parser.add_argument('--cv', type=int, default=0, metavar='K',
+                        help="Report K-fold cross-validated accuracy (folds run in parallel)")
+    parser.add_argument('--search', action='store_true',
+                        help="Grid-search forest hyperparameters with K-fold CV (default K=5)")
+    parser.add_argument('--jobs', type=int, default=-1,
+                        help="Parallel workers for training / CV / search (default: all cores)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Read the CSVs directly instead of the binary dataset cache")
+    parser.add_argument('--augment', type=int, default=0, metavar='N',
+                        help="Train on N augmented 2D views of the 3D landmarks instead of the angle table")
+    parser.add_argument('--augment-chunk', type=int, default=AUGMENT_CHUNK,
+                        help=f"Augmented samples generated per chunk (default: {AUGMENT_CHUNK})")
+    parser.add_argument('--augment-min-leaf', type=int, default=AUGMENT_MIN_LEAF,
+                        help=f"min_samples_leaf of the augmented forest (default: {AUGMENT_MIN_LEAF})")
+    parser.add_argument('--augment-seed', type=int, default=None,
+                        help="Seed for the augmentation (default: fresh views every run)")
+    parser.add_argument('--select', action='store_true',
+                        help="Train several model families / sizes, report accuracy against latency, "
+                             "load time and size, and save the best one under --latency-budget-ms")
+    parser.add_argument('--candidates', default=None,
+                        help=f"Comma-separated subset of --select candidates ({', '.join(SELECT_CANDIDATES)})")
+    parser.add_argument('--latency-budget-ms', type=float, default=LATENCY_BUDGET_MS,
+                        help=f"Max single-row classify() latency for --select (default: {LATENCY_BUDGET_MS})")
+    parser.add_argument('--select-report', default=None, metavar='PATH',
+                        help="Also write the --select results as JSON")
+    parser.add_argument('--rebuild-cache', action='store_true',
+                        help="Rebuild the binary dataset cache from the CSVs and exit")
+    args = parser.parse_args()
+    if args.cv == 1 or args.cv < 0:
+        parser.error("--cv needs at least 2 folds")
+    if args.augment < 0 or args.augment_chunk < 1:
+        parser.error("--augment must be >= 0 and --augment-chunk >= 1")
+    if args.augment and (args.cv or args.search):
+        parser.error("--cv / --search evaluate the angle table, they cannot be combined with --augment")
+    if args.select and (args.augment or args.cv or args.search):
+        parser.error("--select cannot be combined with --augment, --cv or --search")
+    if args.candidates:
+        args.candidates = [c.strip() for c in args.candidates.split(',') if c.strip()]
+        unknown = [c for c in args.candidates if c not in SELECT_CANDIDATES]
+        if unknown:
+            parser.error(f"Unknown candidates: {', '.join(unknown)}")
+    return args
+
 if __name__ == "__main__":
-    train()
+    args = parse_args()
+    if args.rebuild_cache:
+        build_cache(force=True)
+    elif args.select:
+        select(args.latency_budget_ms, args.candidates, jobs=args.jobs, use_cache=not args.no_cache,
+               report_path=args.select_report)
+    elif args.augment:
+        train_augmented(args.augment, args.augment_chunk, args.augment_min_leaf,
+                        jobs=args.jobs, seed=args.augment_seed, use_cache=not args.no_cache)
+    else:
+        train(folds=args.cv, do_search=args.search, jobs=args.jobs, use_cache=not args.no_cache)
@@ -1,6 +1,8 @@
 import cv2
 import numpy as np
 
+from metrics import metrics
+
 # COCO Keypoint Skeleton Connections
 # Format: (Point A Index, Point B Index)
 SKELETON_CONNECTIONS = [
@@ -20,82 +22,234 @@ def draw_skeleton(frame, keypoints, is_correct):
     """
     if keypoints is None:
         return
-        
+    with metrics.timer("draw_skeleton"):
+        _draw_skeleton(frame, keypoints, is_correct)
+
+# Same connections as an index array, for vectorized masking
+_CONNECTIONS = np.array(SKELETON_CONNECTIONS)
+
+def _draw_skeleton(frame, keypoints, is_correct):
     # BGR Color
     color = (0, 255, 0) if is_correct else (0, 0, 255) 
-    
-    # Draw Connections (Limbs)
-    for p1, p2 in SKELETON_CONNECTIONS:
-        # Check if indices are within bounds (just in case)
-        if p1 < len(keypoints) and p2 < len(keypoints):
-            kp1 = keypoints[p1]
-            kp2 = keypoints[p2]
-            
-            # Check confidence (index 2)
-            if kp1[2] > 0.5 and kp2[2] > 0.5:
-                pt1 = (int(kp1[0]), int(kp1[1]))
-                pt2 = (int(kp2[0]), int(kp2[1]))
-                cv2.line(frame, pt1, pt2, color, 3)
-            
-    # Draw Keypoints (Joints)
-    for i, kp in enumerate(keypoints):
-        if kp[2] > 0.5:
-            cv2.circle(frame, (int(kp[0]), int(kp[1])), 5, color, -1)
+
+    keypoints = np.asarray(keypoints)
+    visible = keypoints[:, 2] > 0.5
+    pts = keypoints[:, :2].astype(np.int32)
+
+    # Draw Connections (Limbs): every limb with both ends confident, one call
+    connections = _CONNECTIONS[(_CONNECTIONS < len(keypoints)).all(axis=1)]
+    limbs = connections[visible[connections[:, 0]] & visible[connections[:, 1]]]
+    if len(limbs):
+        cv2.polylines(frame, pts[limbs], False, color, 3)
+
+    # Draw Keypoints (Joints): a zero-length segment of thickness 10 rasterizes
+    # exactly like a filled radius-5 circle, so all joints go in one call too
+    joints = pts[visible]
+    if len(joints):
+        cv2.polylines(frame, np.repeat(joints[:, None, :], 2, axis=1), False, color, 10)
+
+
+class TextSprite:
+    """
+    A piece of text rasterized once into a coverage mask and alpha-blended
+    onto frames afterwards, matching cv2.putText at the same origin
+    (including OpenCV's anti-aliased glyph edges) to within 1 intensity
+    level. Where two strokes of a glyph overlap, putText composites them
+    one after the other, rounding each time, which a single mask cannot
+    replay: a few such edge pixels per string may differ by +/-1.
+    Blending uses a preallocated scratch buffer: use from one thread only.
+    """
+    def __init__(self, text, font, scale, color, thickness):
+        (tw, th), baseline = cv2.getTextSize(text, font, scale, thickness)
+        self.width = tw
+        self.pad = thickness + 2 # Strokes spill past the getTextSize box
+        self.ascent = th
+        h = th + baseline + 2 * self.pad
+        w = tw + 2 * self.pad
+        alpha = np.zeros((h, w), dtype=np.uint8)
+        cv2.putText(alpha, text, (self.pad, self.pad + th), font, scale, 255, thickness)
+
+        # out = (frame * (255 - a) + color * a + 127) // 255, per channel
+        a = alpha.astype(np.uint16)[..., None]
+        self._inv = np.repeat(255 - a, 3, axis=2)
+        self._premul = np.asarray(color, dtype=np.uint16) * a + 127
+        self._scratch = np.empty((h, w, 3), dtype=np.uint16)
+
+    def blit(self, frame, org):
+        """Draws at `org`, the bottom-left text origin as in cv2.putText."""
+        x0 = org[0] - self.pad
+        y0 = org[1] - self.ascent - self.pad
+        fh, fw = frame.shape[:2]
+        h, w = self._scratch.shape[:2]
+        if x0 >= 0 and y0 >= 0 and x0 + w <= fw and y0 + h <= fh:
+            # Fully inside the frame (the usual case): no clipping slices
+            self._blend(frame[y0:y0 + h, x0:x0 + w], self._scratch, self._inv, self._premul)
+            return
+        # Clip to the frame
+        sx0, sy0 = max(0, -x0), max(0, -y0)
+        sx1, sy1 = min(w, fw - x0), min(h, fh - y0)
+        if sx1 <= sx0 or sy1 <= sy0:
+            return
+        clip = (slice(sy0, sy1), slice(sx0, sx1))
+        self._blend(frame[y0 + sy0:y0 + sy1, x0 + sx0:x0 + sx1],
+                    self._scratch[clip], self._inv[clip], self._premul[clip])
+
+    @staticmethod
+    def _blend(roi, tmp, inv, premul):
+        np.multiply(roi, inv, out=tmp)
+        tmp += premul
+        tmp //= 255
+        roi[:] = tmp
+
+
+class OverlayRenderer:
+    """
+    Draws the game overlay from cached pieces: every string (feedback, reps,
+    score, the "HP" label) is rasterized only the first time it appears and
+    blended from a bounded cache afterwards. Sprites are positioned and
+    clipped per frame, so they stay valid across resolution changes.
+    """
+    FONT = cv2.FONT_HERSHEY_SIMPLEX
+    BAR_WIDTH = 30
+    BAR_HEIGHT = 200
+    BAR_Y = 60
+
+    def __init__(self, max_texts=512):
+        self.max_texts = max_texts
+        self._texts = {}
+
+    def text(self, text, scale, color, thickness):
+        key = (text, scale, color, thickness)
+        sprite = self._texts.get(key)
+        if sprite is None:
+            if len(self._texts) >= self.max_texts:
+                self._texts.pop(next(iter(self._texts))) # Oldest first
+            sprite = self._texts[key] = TextSprite(text, self.FONT, scale, color, thickness)
+        return sprite
+
+    def draw(self, frame, game):
+        h, w = frame.shape[:2]
+
+        # --- 1. Feedback Text ---
+        # Top Center
+        text_color = (0, 255, 0) if game.is_correct_form else (0, 0, 255)
+        feedback = self.text(str(game.feedback).upper(), 1.0, text_color, 2)
+        feedback.blit(frame, ((w - feedback.width) // 2, 50))
+
+        # --- 2. Rep Counter & Score ---
+        # Top Left
+        self.text(f"REPS: {game.reps}", 1.2, (255, 255, 0), 3).blit(frame, (20, 60))
+        self.text(f"SCORE: {game.score}", 0.8, (255, 255, 255), 2).blit(frame, (20, 100))
+
+        # Debug: Show current angle
+        if hasattr(game, 'current_angle'):
+            self.text(f"Ang: {int(game.current_angle)}", 0.6, (200, 200, 200), 1).blit(frame, (20, 140))
+
+        # --- 3. Energy Bar ---
+        # Right side vertical bar
+        bar_x = w - 50
+        bar_y = self.BAR_Y
+
+        # Draw Background
+        cv2.rectangle(frame, (bar_x, bar_y), (bar_x + self.BAR_WIDTH, bar_y + self.BAR_HEIGHT), (50, 50, 50), -1)
+
+        # Calculate Fill
+        # Clamp energy 0-100
+        energy_level = max(0, min(100, game.energy))
+        fill_height = int((energy_level / 100.0) * self.BAR_HEIGHT)
+
+        # Determine Color
+        fill_color = (0, 255, 0) # Green
+        if energy_level < 30:
+            fill_color = (0, 0, 255) # Red
+        elif energy_level < 60:
+            fill_color = (0, 165, 255) # Orange
+
+        # Draw Fill (Bottom Up)
+        start_point = (bar_x, bar_y + self.BAR_HEIGHT - fill_height)
+        end_point = (bar_x + self.BAR_WIDTH, bar_y + self.BAR_HEIGHT)
+        cv2.rectangle(frame, start_point, end_point, fill_color, -1)
+
+        # Label
+        self.text("HP", 0.6, (255, 255, 255), 1).blit(frame, (bar_x + 2, bar_y + self.BAR_HEIGHT + 20))
+
+
+# Overlay renderer shared by draw_overlay (drawing happens on the render thread)
+_overlay = OverlayRenderer()
 
 def draw_overlay(frame, game):
     """
     Draws the gamified UI: Energy Bar, Score, Reps, Feedback.
     game: Instance of Exercise class (e.g. BicepCurl)
     """
-    h, w = frame.shape[:2]
-    font = cv2.FONT_HERSHEY_SIMPLEX
-    
-    # --- 1. Feedback Text ---
-    # Top Center
-    text = str(game.feedback).upper()
-    text_color = (0, 255, 0) if game.is_correct_form else (0, 0, 255)
-    
-    text_scale = 1.0
-    thickness = 2
-    text_size = cv2.getTextSize(text, font, text_scale, thickness)[0]
-    text_x = (w - text_size[0]) // 2
-    cv2.putText(frame, text, (text_x, 50), font, text_scale, text_color, thickness)
-    
-    # --- 2. Rep Counter & Score ---
-    # Top Left
-    cv2.putText(frame, f"REPS: {game.reps}", (20, 60), font, 1.2, (255, 255, 0), 3)
-    cv2.putText(frame, f"SCORE: {game.score}", (20, 100), font, 0.8, (255, 255, 255), 2)
-    
-    # Debug: Show current angle
-    if hasattr(game, 'current_angle'):
-        cv2.putText(frame, f"Ang: {int(game.current_angle)}", (20, 140), font, 0.6, (200, 200, 200), 1)
-    
-    # --- 3. Energy Bar ---
-    # Right side vertical bar
-    bar_width = 30
-    bar_height = 200
-    bar_x = w - 50
-    bar_y = 60
-    
-    # Draw Background
-    cv2.rectangle(frame, (bar_x, bar_y), (bar_x + bar_width, bar_y + bar_height), (50, 50, 50), -1)
-    
-    # Calculate Fill
-    # Clamp energy 0-100
-    energy_level = max(0, min(100, game.energy))
-    fill_height = int((energy_level / 100.0) * bar_height)
-    
-    # Determine Color
-    fill_color = (0, 255, 0) # Green
-    if energy_level < 30:
-        fill_color = (0, 0, 255) # Red
-    elif energy_level < 60:
-        fill_color = (0, 165, 255) # Orange
-    
-    # Draw Fill (Bottom Up)
-    start_point = (bar_x, bar_y + bar_height - fill_height)
-    end_point = (bar_x + bar_width, bar_y + bar_height)
-    cv2.rectangle(frame, start_point, end_point, fill_color, -1)
-    
-    # Label
-    cv2.putText(frame, "HP", (bar_x + 2, bar_y + bar_height + 20), font, 0.6, (255, 255, 255), 1)
+    with metrics.timer("draw_overlay"):
+        _overlay.draw(frame, game)
+
+def draw_player_label(frame, keypoints, player_id, color=(255, 255, 0)):
+    """
+    Draws "P<id>" above the highest confident keypoint of a tracked player.
+    """
+    if keypoints is None:
+        return
+    visible = keypoints[:, 2] > 0.5
+    if not visible.any():
+        return
+    pts = keypoints[visible]
+    top = int(np.argmin(pts[:, 1]))
+    x, y = int(pts[top, 0]), int(pts[top, 1]) - 20
+    cv2.putText(frame, f"P{player_id}", (x, max(y, 20)), cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
+
+class HudRenderer:
+    """
+    Renders the metrics HUD panel into an image once per snapshot (and frame
+    height) and pastes it into every frame until the snapshot changes.
+    """
+    LINE_H = 18
+    WIDTH = 300
+
+    def __init__(self):
+        self._key = None
+        self._panel = None # (y0, image)
+
+    def _render(self, snapshot, frame_h):
+        font = cv2.FONT_HERSHEY_SIMPLEX
+        stages = snapshot['stages']
+        counters = snapshot['counters']
+        lines = [f"{'stage':<14}{'mean':>7}{'p50':>7}{'p99':>7}"]
+        for name in sorted(stages):
+            st = stages[name]
+            lines.append(f"{name[:13]:<14}{st['mean_ms']:>7.1f}{st['p50_ms']:>7.1f}{st['p99_ms']:>7.1f}")
+        for name in sorted(counters):
+            lines.append(f"{name[:20]:<21}{counters[name]:>7}")
+
+        # Panel spans (5, y0 - LINE_H) .. (5 + WIDTH, frame_h - 5) in frame coordinates
+        y0 = frame_h - 10 - self.LINE_H * len(lines)
+        top = y0 - self.LINE_H
+        panel = np.zeros((frame_h - 5 - top + 1, self.WIDTH + 1, 3), dtype=np.uint8)
+        for i, line in enumerate(lines):
+            cv2.putText(panel, line, (5, y0 + i * self.LINE_H - top), font, 0.45, (255, 255, 255), 1)
+        return top, panel
+
+    def draw(self, frame, snapshot):
+        h, w = frame.shape[:2]
+        key = (id(snapshot), snapshot['time'], h)
+        if key != self._key:
+            self._key = key
+            self._panel = self._render(snapshot, h)
+        top, panel = self._panel
+        # Clip to the frame (tall snapshots / small frames)
+        src_y = max(0, -top)
+        ph, pw = panel.shape[:2]
+        pw = min(pw, w - 5)
+        if src_y < ph and pw > 0:
+            frame[top + src_y:top + ph, 5:5 + pw] = panel[src_y:, :pw]
+
+
+_hud = HudRenderer()
+
+def draw_metrics_hud(frame, snapshot):
+    """
+    Draws a per-stage latency table (mean / p50 / p99 ms) in the bottom-left
+    corner. snapshot: Metrics.snapshot()
+    """
+    _hud.draw(frame, snapshot)